@@ -27,6 +27,7 @@ from shapely.geometry import shape
 from tqdm.notebook import tqdm as notebook_tqdm
 from mcimageprocessing import config_manager
 from mcimageprocessing.programmatic.shared_functions.utilities import calculate_bounds
+from mcimageprocessing.programmatic.shared_functions.geometry_preparation import prepare_geojson
 
 from mcimageprocessing.programmatic.APIs.EarthEngine import EarthEngineManager
 from mcimageprocessing.programmatic.APIs.EarthEngine import EarthEngineNotebookInterface
@@ -372,7 +373,8 @@ class JupyterAPI(geemap.Map):
         The method starts by retrieving the list of uploaded file info from the 'change' dictionary. Then, it iterates over each file and extracts the filename and content. The content is initially
         * in the form of a memoryview object, which is converted to bytes and decoded to a string using 'utf-8' encoding.
 
-        Next, the string content is loaded as GeoJSON using the 'geojson.loads' function. A style dictionary is created to define the appearance of the GeoJSON layer, including the line color
+        Next, the string content is loaded as GeoJSON using the 'geojson.loads' function and its geometries are prepared with 'prepare_geojson',
+        * which removes vertices, slivers and holes that make no difference at the analysis scale. A style dictionary is created to define the appearance of the GeoJSON layer, including the line color
         *, fill color, border width, and fill opacity.
 
         A GeoJSON layer is created using the 'GeoJSON' class, with the loaded geojson_content and style as parameters. This layer is then added to the map using the 'add_layer' method, with
@@ -407,6 +409,9 @@ class JupyterAPI(geemap.Map):
                     else:
                         raise ValueError("Unsupported GeoJSON type")
 
+                    # Simplify and quantize the uploaded geometries, as they are later sent verbatim to Earth Engine
+                    data_to_add = geojson.FeatureCollection(prepare_geojson(data_to_add)['features'])
+
                     # Define the style for the layer
                     style = {"color": "black", "fillColor": "black", "weight": 1, "fillOpacity": 0.5}
 
@@ -1092,6 +1097,37 @@ class JupyterAPI(geemap.Map):
         bbox = self.get_bounding_box(distinct_values, geometry)
         self.process_api(self.glofas_class, 'glofas', geometry, distinct_values, index, bbox=bbox, additional_params=additional_params)
 
+    def handle_glofas_multiple(self, geometries):
+        """
+        Handles a GloFAS API request for several geometries with a single download.
+
+        :param geometries: A list of (geometry, distinct_values) tuples.
+        :return: None
+
+        The union of the bounding boxes of the geometries is downloaded once and clipped to every geometry locally.
+        """
+        with self.out:
+            try:
+                params = self.glofas_class.gather_parameters(glofas_product=self.glofas_options.value)
+                bboxes = [self.get_bounding_box(distinct_values, geometry) for geometry, distinct_values in geometries]
+                pbar = notebook_tqdm(total=10, desc='Processing', leave=False)
+
+                clipped_rasters = self.glofas_class.process_api_multiple(
+                    geometries=[geometry for geometry, _ in geometries],
+                    distinct_values_list=[distinct_values for _, distinct_values in geometries],
+                    bboxes=bboxes, params=params, pbar=pbar)
+
+                for (geometry, _), clipped_raster in zip(geometries, clipped_rasters):
+                    if clipped_raster is None:
+                        continue
+                    try:
+                        self.add_image_to_map(clipped_raster, params, geometry)
+                    except Exception as e:
+                        print(f"Error adding image to map: {e}")
+
+            except Exception as e:
+                print(f"Error processing glofas: {e}")
+
     def handle_gee(self, geometry, distinct_values, index):
         """
         Handle Gee Method
@@ -1184,6 +1220,12 @@ class JupyterAPI(geemap.Map):
                                                                           userlayers=self.userlayers,
                                                                           boundary_layer=self.dropdown.value,
                                                                           output_folder_location=selected_path)
+            geometries = list(geometries)
+            if self.dropdown_api.value == 'glofas' and len(geometries) > 1:
+                # Download the union of the geometries once instead of once per geometry
+                self.handle_glofas_multiple(geometries)
+                return
+
             for index, (geometry, distinct_values) in enumerate(geometries):
                 api_handler = api_handlers.get(self.dropdown_api.value)
                 if api_handler:
@@ -1,21 +1,32 @@
 import calendar
 import datetime
 import json
+import logging
+import math
 import os
 import re
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import ClassVar
 
 import ee
 import geemap
 import ipyfilechooser as fc
 import ipywidgets as widgets
+import pandas as pd
 import requests
 from ipywidgets import Layout
-from pydantic import BaseModel, Extra
+from pydantic import BaseModel, Extra, PrivateAttr
 from pydantic import root_validator
 from shapely.geometry import shape
 
 from mcimageprocessing import config_manager
+from mcimageprocessing.programmatic.shared_functions.cache import DEFAULT_CACHE_ROOT, LRUFileCache, hash_key
+from mcimageprocessing.programmatic.shared_functions.gee_catalog import GEECatalogIndex
+from mcimageprocessing.programmatic.shared_functions.geometry_preparation import (DEFAULT_PREPARATION_SCALE,
+                                                                                  as_geojson, prepare_geometry)
+
+logger = logging.getLogger(__name__)
 
 
 class EarthEngineManager(BaseModel):
@@ -32,6 +43,18 @@ class EarthEngineManager(BaseModel):
     }
     ee_dates: list = []
 
+    # Results of getInfo calls are cached on disk, keyed by the hash of the serialized computation
+    use_result_cache: bool = True
+    result_cache_directory: str = os.path.join(DEFAULT_CACHE_ROOT, 'earth_engine')
+    result_cache_max_bytes: int = 256 * 1024 ** 2
+    # Maximum age in seconds of cached results for collections that are still updated, e.g. {'MODIS/061/MOD13Q1': 86400}.
+    # Results of computations that use no listed collection never expire.
+    result_cache_freshness: dict = {}
+    # Maximum age in seconds of cached collection metadata, e.g. the dates of a collection, which change as images are
+    # added to it
+    metadata_cache_max_age: int = 24 * 60 * 60
+    _result_cache: LRUFileCache = PrivateAttr(default=None)
+
     # Class-level aggregation functions that do not change and are not instance-specific
     aggregation_functions: ClassVar[dict] = {
         'mode': lambda ic: ic.mode(),
@@ -43,6 +66,23 @@ class EarthEngineManager(BaseModel):
         'first': lambda ic: ic.sort('system:time_start', False).first()
     }
 
+    # Class-level statistic reducers, combined with sharedInputs for zonal statistics
+    statistics_reducers: ClassVar[dict] = {
+        'mean': lambda: ee.Reducer.mean(),
+        'sum': lambda: ee.Reducer.sum(),
+        'max': lambda: ee.Reducer.max(),
+        'min': lambda: ee.Reducer.min(),
+        'stdDev': lambda: ee.Reducer.stdDev(),
+        'variance': lambda: ee.Reducer.variance(),
+        'median': lambda: ee.Reducer.median(),
+        'count': lambda: ee.Reducer.count()
+    }
+
+    # Error fragments returned by Earth Engine when an aggregation runs out of memory or time
+    tile_scale_errors: ClassVar[tuple] = (
+        'memory limit', 'Computation timed out', 'Too many concurrent aggregations', 'User memory limit exceeded'
+    )
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.load_credentials()
@@ -55,6 +95,50 @@ class EarthEngineManager(BaseModel):
         )
         ee.Initialize(credentials)
 
+    @property
+    def result_cache(self):
+        """
+        :return: The LRUFileCache holding getInfo results, created on first use.
+        """
+        if self._result_cache is None:
+            self._result_cache = LRUFileCache(self.result_cache_directory, self.result_cache_max_bytes)
+        return self._result_cache
+
+    def get_info(self, ee_object, max_age: float = None):
+        """
+        Evaluate an Earth Engine object, reusing the result of an identical earlier computation when available.
+
+        :param ee_object: The Earth Engine object to evaluate.
+        :param max_age: Optional maximum age in seconds of a cached result, e.g. `metadata_cache_max_age` for
+                        collection metadata.
+        :return: The result of ee_object.getInfo().
+
+        The cache key is the SHA-256 hash of the serialized computation graph, so the same request made from another
+        notebook or run is answered from disk. Entries of computations that reference a collection listed in
+        `result_cache_freshness` expire after the configured number of seconds, and entries requested with `max_age`
+        after that many seconds; all other entries are kept until they are evicted by the size limit.
+
+        Example usage:
+            population = ee_manager.get_info(img.reduceRegion(ee.Reducer.sum(), geometry, 100).get('population'))
+        """
+        if not self.use_result_cache:
+            return ee_object.getInfo()
+
+        serialized = ee.serializer.toJSON(ee_object)
+        key = hash_key(serialized)
+        collections = [collection for collection in self.result_cache_freshness if f'"{collection}"' in serialized]
+        max_ages = [self.result_cache_freshness[collection] for collection in collections]
+        if max_age is not None:
+            max_ages.append(max_age)
+        max_age = min(max_ages, default=None)
+
+        missing = object()
+        result = self.result_cache.get_json(key, default=missing, max_age=max_age)
+        if result is missing:
+            result = ee_object.getInfo()
+            self.result_cache.put_json(key, result, metadata={'collections': collections})
+        return result
+
     @classmethod
     def validate_aggregation_function(cls, function):
         if function not in cls.aggregation_functions:
@@ -150,9 +234,9 @@ class EarthEngineManager(BaseModel):
             # Get the maximum date in the collection.
             max_date = ee.Date(collection.aggregate_max('system:time_start')).format('YYYY-MM-dd')
 
-            min_date = min_date.getInfo()
+            min_date = self.get_info(min_date, max_age=self.metadata_cache_max_age)
 
-            max_date = max_date.getInfo()
+            max_date = self.get_info(max_date, max_age=self.metadata_cache_max_age)
 
             return [min_date, max_date]
 
@@ -162,7 +246,7 @@ class EarthEngineManager(BaseModel):
         else:
             formatted_dates = collection.map(format_dates)
             current_date_list = formatted_dates.aggregate_array('current_date')
-            ee_date_list = current_date_list.getInfo()
+            ee_date_list = self.get_info(current_date_list, max_age=self.metadata_cache_max_age)
             self.ee_dates = [x for x in ee_date_list]
             return self.ee_dates
 
@@ -185,30 +269,152 @@ class EarthEngineManager(BaseModel):
         * the values represent the computed statistics for each type.
         """
         # Define the reducers for each statistic you want to calculate
-        reducers = ee.Reducer.mean().combine(
-            reducer2=ee.Reducer.sum(),
-            sharedInputs=True
-        ).combine(
-            reducer2=ee.Reducer.max(),
-            sharedInputs=True
-        ).combine(
-            reducer2=ee.Reducer.min(),
-            sharedInputs=True
-        ).combine(
-            reducer2=ee.Reducer.stdDev(),
-            sharedInputs=True
-        ).combine(
-            reducer2=ee.Reducer.variance(),
-            sharedInputs=True
-        ).combine(
-            reducer2=ee.Reducer.median(),
-            sharedInputs=True
-        )
+        reducers = self.build_statistics_reducer(['mean', 'sum', 'max', 'min', 'stdDev', 'variance', 'median'])
 
         # Apply the reducers to the image
         stats = img.reduceRegion(reducer=reducers, geometry=geometry, maxPixels=1e12)
         return stats
 
+    def build_statistics_reducer(self, statistics=None):
+        """
+        :param statistics: A list of statistic names to combine. Must be keys of `statistics_reducers`. Defaults to all of them.
+        :return: A single ee.Reducer combining all requested statistics with shared inputs.
+        """
+        statistics = statistics if statistics else list(self.statistics_reducers.keys())
+
+        reducer = None
+        for statistic in statistics:
+            if statistic not in self.statistics_reducers:
+                raise ValueError(
+                    f"Invalid statistic: {statistic}. Must be one of: {', '.join(self.statistics_reducers.keys())}")
+            next_reducer = self.statistics_reducers[statistic]()
+            reducer = next_reducer if reducer is None else reducer.combine(reducer2=next_reducer, sharedInputs=True)
+
+        return reducer
+
+    def calculate_bulk_statistics(self, img, geometries, scale, statistics=None, max_features_per_request=250, max_payload_bytes=4000000, tile_scale=1,
+                                  max_tile_scale=16):
+        """
+        :param img: The image on which to calculate the statistics.
+        :param geometries: An ee.FeatureCollection, or a list of ee.Feature, ee.Geometry, GeoJSON dictionaries or Shapely geometries.
+        :param scale: The scale in meters at which to reduce the image.
+        :param statistics: A list of statistic names from `statistics_reducers`. Defaults to all of them.
+        :param max_features_per_request: The maximum number of features sent in a single reduceRegions call.
+        :param max_payload_bytes: The maximum size of the serialized features sent in a single reduceRegions call.
+        :param tile_scale: The initial tileScale passed to reduceRegions.
+        :param max_tile_scale: The largest tileScale to try before splitting a chunk that runs out of memory.
+        :return: A pandas DataFrame with one row per geometry, one column per statistic and the properties of the input features.
+
+        All reducers are combined into one reducer and applied to every geometry with a single reduceRegions call per chunk,
+        instead of one reduceRegion and getInfo round trip per geometry. Chunks are bounded both by the number of features
+        and by the size of the serialized request. If Earth Engine reports a memory or time limit, the chunk is retried with
+        a doubled tileScale, and split in half once `max_tile_scale` has been reached.
+
+        Example usage:
+            admin_units = ee.FeatureCollection('FAO/GAUL_SIMPLIFIED_500m/2015/level2')
+            stats = ee_manager.calculate_bulk_statistics(image, admin_units, scale=100, statistics=['sum', 'mean'])
+        """
+        reducer = self.build_statistics_reducer(statistics)
+
+        rows = []
+        for chunk in self._chunk_features_for_request(geometries, max_features_per_request, max_payload_bytes):
+            rows.extend(self._reduce_regions_chunk(img, chunk, reducer, scale, tile_scale, max_tile_scale))
+
+        table = pd.DataFrame(rows)
+        if '_feature_index' in table.columns:
+            table = table.sort_values('_feature_index').drop(columns='_feature_index').reset_index(drop=True)
+        return table
+
+    def _chunk_features_for_request(self, geometries, max_features, max_payload_bytes):
+        """
+        :param geometries: An ee.FeatureCollection or a list of geometries (see `calculate_bulk_statistics`).
+        :param max_features: The maximum number of features per chunk.
+        :param max_payload_bytes: The maximum serialized size of a chunk.
+        :return: A generator of ee.FeatureCollection chunks.
+        """
+        if isinstance(geometries, ee.FeatureCollection):
+            # Server-side collections are sent by reference, so only the feature count bounds the chunk
+            feature_count = geometries.size().getInfo()
+            feature_list = geometries.toList(feature_count)
+            for offset in range(0, feature_count, max_features):
+                yield ee.FeatureCollection(feature_list.slice(offset, offset + max_features))
+            return
+
+        chunk = []
+        chunk_bytes = 0
+        for index, geometry in enumerate(geometries):
+            feature = self._as_indexed_feature(geometry, index)
+            feature_bytes = len(ee.serializer.toJSON(feature))
+
+            if chunk and (len(chunk) >= max_features or chunk_bytes + feature_bytes > max_payload_bytes):
+                yield ee.FeatureCollection(chunk)
+                chunk = []
+                chunk_bytes = 0
+
+            chunk.append(feature)
+            chunk_bytes += feature_bytes
+
+        if chunk:
+            yield ee.FeatureCollection(chunk)
+
+    def _as_indexed_feature(self, geometry, index):
+        """
+        :param geometry: An ee.Feature, ee.Geometry, GeoJSON dictionary or Shapely geometry.
+        :param index: The position of the geometry in the input list.
+        :return: An ee.Feature tagged with `_feature_index`.
+        """
+        if isinstance(geometry, ee.Feature):
+            feature = geometry
+        elif isinstance(geometry, ee.Geometry):
+            feature = ee.Feature(geometry)
+        elif isinstance(geometry, dict) and geometry.get('type') == 'Feature':
+            feature = ee.Feature(ee.Geometry(geometry['geometry']), geometry.get('properties') or {})
+        elif isinstance(geometry, dict):
+            feature = ee.Feature(ee.Geometry(geometry))
+        elif hasattr(geometry, '__geo_interface__'):
+            feature = ee.Feature(ee.Geometry(geometry.__geo_interface__))
+        else:
+            raise ValueError("Invalid geometry type. Must be an Earth Engine Geometry or Feature, GeoJSON or Shapely.")
+
+        return feature.set('_feature_index', index)
+
+    def _reduce_regions_chunk(self, img, chunk, reducer, scale, tile_scale, max_tile_scale):
+        """
+        :param img: The image to reduce.
+        :param chunk: The ee.FeatureCollection to reduce over.
+        :param reducer: The combined reducer.
+        :param scale: The scale in meters.
+        :param tile_scale: The tileScale for this attempt.
+        :param max_tile_scale: The largest tileScale to try before splitting the chunk.
+        :return: A list of property dictionaries, one per feature.
+        """
+        try:
+            reduced = img.reduceRegions(collection=chunk, reducer=reducer, scale=scale, tileScale=tile_scale)
+            # Drop the geometries so only the statistics are sent back
+            reduced = reduced.select(['.*'], None, False)
+            return [feature['properties'] for feature in self.get_info(reduced)['features']]
+        except ee.EEException as e:
+            if not any(fragment in str(e) for fragment in self.tile_scale_errors):
+                raise
+
+            if tile_scale < max_tile_scale:
+                logger.warning(f"reduceRegions failed with tileScale {tile_scale} ({e}), retrying with tileScale "
+                               f"{tile_scale * 2}.")
+                return self._reduce_regions_chunk(img, chunk, reducer, scale, tile_scale * 2, max_tile_scale)
+
+            chunk_size = chunk.size().getInfo()
+            if chunk_size <= 1:
+                raise
+
+            logger.warning(f"reduceRegions failed with tileScale {tile_scale} ({e}), splitting {chunk_size} features "
+                           f"into two requests.")
+            half = chunk_size // 2
+            feature_list = chunk.toList(chunk_size)
+            return (self._reduce_regions_chunk(img, ee.FeatureCollection(feature_list.slice(0, half)), reducer,
+                                               scale, tile_scale, max_tile_scale) +
+                    self._reduce_regions_chunk(img, ee.FeatureCollection(feature_list.slice(half)), reducer,
+                                               scale, tile_scale, max_tile_scale))
+
     def get_image(self,
                   multi_date: bool,
                   aggregation_period: str=None,
@@ -259,7 +465,7 @@ class EarthEngineManager(BaseModel):
             img_collection = ee.ImageCollection(image_collection).filter(
                 ee.Filter.date(start_date, end_date)).select(band).filter(ee.Filter.bounds(geometry))
 
-            ee_img_scale = img_collection.first().projection().nominalScale().getInfo()
+            ee_img_scale = self.get_info(img_collection.first().projection().nominalScale())
 
             mask = ee.Image.constant(1).clip(geometry)
 
@@ -290,7 +496,7 @@ class EarthEngineManager(BaseModel):
 
             img_collection = ee.ImageCollection(image_collection).filterDate(ee.Date(date)).select(band).filter(ee.Filter.bounds(geometry))
 
-            ee_img_scale = img_collection.first().projection().nominalScale().getInfo()
+            ee_img_scale = self.get_info(img_collection.first().projection().nominalScale())
 
             mask = ee.Image.constant(1).clip(geometry)
 
@@ -314,10 +520,10 @@ class EarthEngineManager(BaseModel):
     def split_and_sort_geometry(self, geometry, num_sections):
         """
         :param geometry: The geometry to be split and sorted.
-        :param num_sections: The number of sections to split the geometry into.
+        :param num_sections: The minimum number of sections to split the geometry into.
         :return: A list of sorted grid cells obtained by splitting the geometry.
 
-        This method takes a geometry and splits it into a grid of specified number of sections. The grid cells are then sorted based on their area in descending order.
+        This method takes a geometry and splits it into the smallest square grid with at least the specified number of sections. The grid cells are then sorted based on their area in descending order.
 
         Example usage:
         ```
@@ -327,13 +533,16 @@ class EarthEngineManager(BaseModel):
         sorted_grid = split_and_sort_geometry(geometry, num_sections)
         ```
         """
+        if num_sections < 1:
+            raise ValueError("The number of sections must be at least 1.")
+
         bounds = geometry.bounds()
         coords = bounds.getInfo()['coordinates'][0]
         min_x, max_x = min(coords, key=lambda x: x[0])[0], max(coords, key=lambda x: x[0])[0]
         min_y, max_y = min(coords, key=lambda x: x[1])[1], max(coords, key=lambda x: x[1])[1]
 
-        # Calculate dimensions for the grid
-        num_rows = num_cols = int(num_sections ** 0.5)
+        # Calculate dimensions for the grid, rounding up so that e.g. 2 sections give a 2 x 2 grid rather than no split
+        num_rows = num_cols = math.ceil(math.sqrt(num_sections))
         x_step = (max_x - min_x) / num_cols
         y_step = (max_y - min_y) / num_rows
 
@@ -372,7 +581,7 @@ class EarthEngineManager(BaseModel):
             raise ValueError("The region must be a Feature or Geometry.")
 
         if scale == 'default':
-            scale = img.projection().nominalScale().getInfo()
+            scale = self.get_info(img.projection().nominalScale())
         else:
             pass
 
@@ -414,13 +623,13 @@ class EarthEngineManager(BaseModel):
         if min_threshold is not None:
             img = img.updateMask(img.gte(min_threshold))
 
-        stats = img.reduceRegion(
+        stats = self.get_info(img.reduceRegion(
             reducer=ee.Reducer.minMax(),
             bestEffort=True,
             scale=scale,
             geometry=boundary,  # Add this line
             maxPixels=max_pixels
-        ).getInfo()
+        ))
 
         min_value = stats[f"{band}_min"]
         max_value = stats[f"{band}_max"]
@@ -443,50 +652,165 @@ class EarthEngineManager(BaseModel):
         map.addLayerControl()
         return map
 
-    def process_images(self, start_date, end_date, image_collection, band, country, aggregation_type, function):
+    def process_images(self, start_date, end_date, image_collection, band, geometry=None, aggregation_type='monthly',
+                       function='mean', output_folder='.', scale=1000, tiles=1, max_workers=4, overwrite=False,
+                       country=None):
         """
-        Process images within a specified date range.
+        Export one aggregated image per period and tile within a date range.
+
+        :param start_date: The start date of the date range, as 'YYYY-MM-DD' or a datetime.date.
+        :param end_date: The end date of the date range, as 'YYYY-MM-DD' or a datetime.date.
+        :param image_collection: The Earth Engine image collection to export.
+        :param band: The band to export.
+        :param geometry: The ee.Geometry or ee.Feature to export.
+        :param aggregation_type: The length of the periods, either "monthly" or "yearly".
+        :param function: The aggregation method applied to the images of each period, see `aggregation_functions`.
+        :param output_folder: The folder the images and the manifest are written to.
+        :param scale: The export scale in meters.
+        :param tiles: The number of tiles the geometry is split into, for exports above the download size limit.
+        :param max_workers: The maximum number of image builds and downloads running at the same time.
+        :param overwrite: Export periods whose output files already exist again.
+        :param country: Deprecated name of `geometry`, kept for callers passing it as a keyword.
+        :return: The manifest, a dictionary with the export parameters and one entry per (period, tile) pair.
+
+        The first and last periods are clipped to `start_date` and `end_date`, so a range starting or ending in the
+        middle of a month or year exports only the requested days. Every (period, tile) pair is planned before any
+        request is made. Pairs whose output file already exists are
+        skipped, so an interrupted export can be resumed by running it again. The remaining pairs are built and
+        downloaded by a pool of `max_workers` threads, and the manifest is written to `manifest.json` in the output
+        folder once every pair has finished. Failed pairs are recorded in the manifest instead of stopping the export.
 
-        :param start_date: The start date of the date range.
-        :param end_date: The end date of the date range.
-        :param image_collection: The collection of images to process.
-        :param band: The desired band of the images.
-        :param country: The country for which to process the images.
-        :param aggregation_type: The type of aggregation for the images (either "monthly" or "yearly").
-        :param function: The function to apply to the images.
-        :return: None
+        Example usage:
+            manifest = ee_manager.process_images('2015-01-01', '2020-12-31', 'MODIS/061/MOD13Q1', 'NDVI', geometry,
+                                                 'monthly', 'mean', output_folder='ndvi', scale=250, max_workers=8)
         """
+        if country is not None:
+            warnings.warn("The country argument of process_images is deprecated, use geometry instead.",
+                          DeprecationWarning, stacklevel=2)
+            geometry = country
+        if geometry is None:
+            raise ValueError("A geometry must be provided.")
+
         # Validate aggregation type
         if aggregation_type.lower() not in ("monthly", "yearly"):
             raise ValueError('Aggregation type should be either "monthly" or "yearly".')
+        self.__class__.validate_aggregation_function(function)
+
+        if isinstance(start_date, str):
+            start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+        if isinstance(end_date, str):
+            end_date = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
 
         # Generate date ranges
         if aggregation_type.lower() == "monthly":
-            date_ranges = self.generate_monthly_date_ranges(int(start_date[:4]))
+            date_ranges = self.generate_monthly_date_ranges(start_date, end_date)
         else:
-            date_ranges = self.generate_yearly_date_ranges(int(start_date[:4]))
+            date_ranges = self.generate_yearly_date_ranges(start_date, end_date)
 
-        for start, end in date_ranges:
-            start = datetime.datetime.strptime(start, "%Y-%m-%d").date()
-            end = datetime.datetime.strptime(end, "%Y-%m-%d").date()
+        geometry = self.ee_ensure_geometry(geometry)
+        tile_geometries = self.split_and_sort_geometry(geometry, tiles) if tiles > 1 else [geometry]
 
-            # If the date range is within the specified start date and end date
-            if start >= datetime.datetime.strptime(start_date, "%Y-%m-%d").date() and end <= datetime.datetime.strptime(end_date,
-                                                                                                      "%Y-%m-%d").date():
-                print(f"Processing images from {start} to {end}...")
+        os.makedirs(output_folder, exist_ok=True)
+        exports = self._plan_exports(date_ranges, start_date, end_date, tile_geometries, image_collection, band,
+                                     function, output_folder, overwrite)
 
-                # Proceed to fetch and process image
-                img, boundary = self.get_image(function, str(start), str(end), image_collection, band, country=country)
+        pending = [export for export in exports if export['status'] == 'pending']
+        print(f"Exporting {len(pending)} images, {len(exports) - len(pending)} already exist.")
 
-                # Generate download URL
-                download_url = self.get_image_download_url(boundary, 1000, img)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._export_image, export, tile_geometries[export['tile']], image_collection, band,
+                                function, scale): export
+                for export in pending
+            }
+            for future in as_completed(futures):
+                export = futures[future]
+                try:
+                    future.result()
+                    export['status'] = 'exported'
+                    print(f"Downloaded {export['file_name']}")
+                except Exception as e:
+                    export['status'] = 'failed'
+                    export['error'] = str(e)
+                    print(f"Failed to export {export['file_name']}: {e}")
+
+        manifest = {
+            'image_collection': image_collection,
+            'band': band,
+            'aggregation_type': aggregation_type.lower(),
+            'aggregation_method': function,
+            'scale': scale,
+            'tiles': len(tile_geometries),
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'exports': exports
+        }
+        with open(os.path.join(output_folder, 'manifest.json'), 'w') as file:
+            json.dump(manifest, file, indent=2)
 
-                # Prompt the download URL
-                print("Download URL: ", download_url)
+        return manifest
 
-                # Download the image
-                destination_path = f"{band}_{start}_{end}.tif"
-                self.download_file_from_url(download_url, destination_path)
+    def _plan_exports(self, date_ranges, start_date, end_date, tile_geometries, image_collection, band, function,
+                      output_folder, overwrite):
+        """
+        :param date_ranges: A list of (start, end) date string tuples, end inclusive.
+        :param start_date: The first requested date, as a datetime.date. Earlier days of the first period are dropped.
+        :param end_date: The last requested date, as a datetime.date. Later days of the last period are dropped.
+        :param tile_geometries: The list of tile geometries.
+        :param image_collection: The Earth Engine image collection.
+        :param band: The band to export.
+        :param function: The aggregation method.
+        :param output_folder: The folder the images are written to.
+        :param overwrite: Plan pairs whose output file already exists as pending.
+        :return: A list of export dictionaries with the period, tile, output path and status of every pair.
+        """
+        exports = []
+        for start, end in date_ranges:
+            # The dates are 'YYYY-MM-DD' strings, which sort like the dates they represent
+            start = max(start, start_date.strftime('%Y-%m-%d'))
+            end = min(end, end_date.strftime('%Y-%m-%d'))
+            if start > end:
+                continue
+            for tile_index in range(len(tile_geometries)):
+                file_name = f"{image_collection}_{band}_{start}_{end}_{function}"
+                if len(tile_geometries) > 1:
+                    file_name = f"{file_name}_tile_{tile_index}"
+                file_name = f"{file_name}.tif".replace('-', '_').replace('/', '_').replace(' ', '_')
+                file_path = os.path.join(output_folder, file_name)
+
+                exists = os.path.exists(file_path) and os.path.getsize(file_path) > 0
+                exports.append({
+                    'start_date': start,
+                    'end_date': end,
+                    'tile': tile_index,
+                    'file_name': file_name,
+                    'file_path': file_path,
+                    'status': 'skipped' if exists and not overwrite else 'pending'
+                })
+        return exports
+
+    def _export_image(self, export, tile_geometry, image_collection, band, function, scale):
+        """
+        Build and download the image of a single (period, tile) pair.
+
+        :param export: The export dictionary planned by `_plan_exports`.
+        :param tile_geometry: The ee.Geometry of the tile.
+        :param image_collection: The Earth Engine image collection.
+        :param band: The band to export.
+        :param function: The aggregation method.
+        :param scale: The export scale in meters.
+        :return: None
+        """
+        # The date filter excludes the end date, so filter up to the day after the last day of the period
+        end_date = datetime.datetime.strptime(export['end_date'], "%Y-%m-%d").date() + datetime.timedelta(days=1)
+        img, boundary, _ = self.get_image(multi_date=True, aggregation_method=function,
+                                          start_date=export['start_date'], end_date=str(end_date),
+                                          image_collection=image_collection, band=band, geometry=tile_geometry)
+        url = self.get_image_download_url(region=boundary, scale=scale, img=img)
+
+        # Download next to the output so that an interrupted download is never mistaken for an existing export
+        temporary_path = f"{export['file_path']}.part"
+        self.download_file_from_url(url, temporary_path)
+        os.replace(temporary_path, export['file_path'])
 
     def get_admin_units(self, level=0):
         """
@@ -519,7 +843,7 @@ class EarthEngineManager(BaseModel):
 
         if level == 0:
             unique_countries = gaul_dataset.aggregate_array('ADM0_NAME').distinct()
-            return sorted(unique_countries.getInfo())
+            return sorted(self.get_info(unique_countries))
 
         elif level == 1 or level == 2:
             # Get the distinct higher-level units
@@ -538,7 +862,7 @@ class EarthEngineManager(BaseModel):
             admin_units_dict = ee.Dictionary(
                 ee.List(unique_higher_level_units.iterate(process_higher_level_unit, ee.Dictionary({}))))
 
-            return admin_units_dict.getInfo()
+            return self.get_info(admin_units_dict)
 
 
     def get_image_sum(self, img, geometry, scale, band='population'):
@@ -556,7 +880,7 @@ class EarthEngineManager(BaseModel):
         # Apply the reducers to the image
         stats = img.reduceRegion(reducer=reducers, geometry=geometry, scale=scale, maxPixels=1e12)
 
-        sum_value = stats.get(band).getInfo()  # Make sure 'band' is the correct key
+        sum_value = self.get_info(stats.get(band))  # Make sure 'band' is the correct key
 
         return sum_value
 
@@ -646,13 +970,14 @@ class EarthEngineManager(BaseModel):
                     all_geometries.append(poly)
 
     def download_feature_geometry(self, distinct_values, feature_type_prefix=None, column=None, layer=None,
-                                  dropdown_api=None, output_folder_location=None):
+                                  dropdown_api=None, output_folder_location=None, scale=DEFAULT_PREPARATION_SCALE):
         """
         :param distinct_values: A list of distinct values used to filter the features.
         :param feature_type_prefix: Optional prefix for the feature type.
         :param column: Optional column used for filtering the features.
         :param layer: A layer object containing the features.
         :param dropdown_api: Optional dropdown API type.
+        :param scale: The analysis scale in meters used to simplify the geometry before it is sent back to Earth Engine.
         :return: The geometry of the features or None if no valid geometries are found.
 
         """
@@ -689,7 +1014,9 @@ class EarthEngineManager(BaseModel):
 
         if all_geometries:
             try:
-                dissolved_geometry = ee.Geometry.MultiPolygon(all_geometries).dissolve()
+                # The coordinates were fetched client-side, so shrink them before they are serialized back to Earth Engine
+                prepared_geometry = prepare_geometry({'type': 'MultiPolygon', 'coordinates': all_geometries}, scale)
+                dissolved_geometry = ee.Geometry(as_geojson(prepared_geometry)).dissolve()
                 feature = ee.Feature(dissolved_geometry)
             except ee.EEException as e:
                 print("Error creating dissolved geometry:", e)
@@ -706,7 +1033,8 @@ class EarthEngineManager(BaseModel):
             geometry = feature.geometry()
             return geometry
 
-    def download_and_split(self, image, original_geometry, scale, split_count=1, params=None, band=None):
+    def download_and_split(self, image, original_geometry, scale, split_count=1, params=None, band=None,
+                           allow_partial=True):
         """
         :param image: The image identifier.
         :param original_geometry: The original geometry of the image.
@@ -714,6 +1042,8 @@ class EarthEngineManager(BaseModel):
         :param split_count: The number of splits to divide the image into (default is 1).
         :param params: Additional parameters (default is None).
         :param band: The band of the image (default is None).
+        :param allow_partial: If False, no file names are returned when a piece fails to download, instead of the
+                              pieces downloaded before the error (default is True).
         :return: A list of file names and a boolean indicating if the download was successful.
         """
         file_names = []
@@ -734,9 +1064,12 @@ class EarthEngineManager(BaseModel):
             if "Total request size" in str(e):
                 print(f"Splitting geometry into {split_count * 2} parts and trying again.")
                 # Increase split count and try again
-                return self.download_and_split(image, original_geometry, scale, split_count * 2, params, band=band)
+                return self.download_and_split(image, original_geometry, scale, split_count * 2, params, band=band,
+                                               allow_partial=allow_partial)
             else:
                 print(f'Unexpected error: {e}')
+                if not allow_partial:
+                    return [], False
 
         return file_names, False
 
@@ -840,6 +1173,7 @@ class EarthEngineNotebookInterface(BaseModel):
         """
         super().__init__(**data)
         self.gee_layer_search_widget = None
+        self.gee_catalog = GEECatalogIndex()
         self.create_widgets_gee()
 
     def on_gee_search_button_clicked(self, b):
@@ -849,9 +1183,8 @@ class EarthEngineNotebookInterface(BaseModel):
         :param b: The button object that was clicked.
         :return: None
         """
-        # Here you define what happens when the button is clicked.
-        # For now, it's just a print statement.
-        assets = geemap.search_ee_data(self.gee_layer_search_widget.value)
+        # Search the local catalog index, it is downloaded on the first search and refreshed weekly
+        assets = self.gee_catalog.search(self.gee_layer_search_widget.value)
         with self.out:
             self.out.clear_output()
             print("Button clicked: Searching for", self.gee_layer_search_widget.value)
@@ -867,11 +1200,16 @@ class EarthEngineNotebookInterface(BaseModel):
 
         :return: None
         :rtype: None
+
+        The date range and bands are read from the catalog index. Earth Engine is only queried for datasets whose
+        metadata is missing from the catalog; bands not in the index yet are fetched in the background for next time.
         """
         selected_layer = self.gee_layer_search_results_dropdown.value
-        self.ee_dates_min_max = self.get_image_collection_dates(selected_layer, min_max_only=True)
+        self.ee_dates_min_max = self.gee_catalog.get_date_range(selected_layer) or \
+            self.get_image_collection_dates(selected_layer, min_max_only=True)
 
-        self.gee_bands_search_results.options = ee.ImageCollection(selected_layer).first().bandNames().getInfo()
+        self.gee_bands_search_results.options = self.gee_catalog.get_bands(selected_layer, background=True) or \
+            ee.ImageCollection(selected_layer).first().bandNames().getInfo()
 
     def on_single_or_range_dates_change(self, change):
         """
@@ -1126,7 +1464,7 @@ class EarthEngineNotebookInterface(BaseModel):
                             self.download_file_from_url(url=url, destination_path=file_name)
                             print(f"Downloaded {file_name}")
                     if gee_params['statistics_only']:
-                        all_stats_info = all_stats.getInfo()
+                        all_stats_info = self.get_info(all_stats)
                         with self.out:
                             self.out.clear_output()
                             print(all_stats_info)
@@ -1166,7 +1504,7 @@ class EarthEngineNotebookInterface(BaseModel):
                             self.download_file_from_url(url=url, destination_path=file_name)
                             print(f"Downloaded {file_name}")
                     if gee_params['statistics_only']:
-                        all_stats_info = all_stats.getInfo()
+                        all_stats_info = self.get_info(all_stats)
                         with self.out:
                             print(all_stats_info)
                 elif gee_params['aggregation_period'] == 'One Aggregation':
@@ -1,6 +1,11 @@
 import datetime
 import itertools
+import math
 import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
 from typing import Optional
 import ee
 import json
@@ -11,14 +16,23 @@ import warnings
 
 import cdsapi
 import ipyfilechooser as fc
+import pygrib
 import ipywidgets as widgets
 from ipywidgets import DatePicker
 from ipywidgets import VBox, HBox
+from shapely.geometry import mapping
 
 
 from mcimageprocessing import config_manager
 from mcimageprocessing.programmatic.APIs.EarthEngine import EarthEngineManager
-from mcimageprocessing.programmatic.shared_functions.utilities import process_and_clip_raster
+from mcimageprocessing.programmatic.shared_functions.cache import (DEFAULT_CACHE_ROOT, LRUFileCache, hash_key, read_json,
+                                                                   update_json)
+from mcimageprocessing.programmatic.shared_functions.cds_jobs import CDSJobQueue
+from mcimageprocessing.programmatic.shared_functions.ensemble_statistics import ensemble_statistics_from_grib
+from mcimageprocessing.programmatic.shared_functions.glofas_calendar import GloFasAvailabilityCalendar
+from mcimageprocessing.programmatic.shared_functions.point_extraction import extract_points_from_grib
+from mcimageprocessing.programmatic.shared_functions.utilities import (process_and_clip_raster, clip_raster_to_geometries,
+                                                                     as_clip_geometry)
 
 from osgeo import gdal
 
@@ -29,6 +43,18 @@ gdal.SetConfigOption('CPL_LOG_ERRORS', 'OFF')
 gdal.SetConfigOption('CPL_LOG', 'OFF')
 
 class GloFasAPI:
+    # Largest number of fields (dates x lead times x ensemble members) requested in a single CDS retrieve call
+    max_fields_per_request = 1000
+    # Number of ensemble members of the ensemble_perturbed_forecasts product type
+    ensemble_members = 50
+    # Resolution in degrees of the GloFAS grid, request areas are snapped outwards to it
+    grid_resolution = 0.05
+    # Seconds after which a combination recorded without data is probed again, since it may have been published since
+    unavailable_ttl = 24 * 60 * 60
+    # Days after which a date missing from a response is recorded as unavailable, since recent days may not be
+    # published yet, e.g. seasonal forecasts are published a few days after their reference date
+    publication_lag_days = 10
+
     def __init__(self, ee_manager: Optional[EarthEngineManager] = None):
 
         # ==============================================================================
@@ -39,6 +65,16 @@ class GloFasAPI:
         url = config_manager.config['KEYS']['GloFas']['url']
         key = config_manager.config['KEYS']['GloFas']['key']
         self.client = cdsapi.Client(url=url, key=key)
+        # Non-blocking client for the job queue, jobs are kept on the server so a restarted kernel can reattach
+        self.job_queue = CDSJobQueue(cdsapi.Client(url=url, key=key, quiet=True, wait_until_complete=False,
+                                                   delete=False))
+        # Downloaded GRIB files are shared between runs, keyed by a hash of the request
+        self.grib_cache = LRUFileCache(os.path.join(DEFAULT_CACHE_ROOT, 'glofas'), max_bytes=2 * 1024 ** 3)
+        # Known availability of every (product, version, model, product type) combination by date
+        self.availability_path = os.path.join(DEFAULT_CACHE_ROOT, 'glofas_availability.json')
+        self.availability = self._load_availability()
+        # Dates that exist for every (product, system version), built once and extended incrementally
+        self.calendar = GloFasAvailabilityCalendar(os.path.join(DEFAULT_CACHE_ROOT, 'glofas_calendar.json'))
 
         self.glofas_dict = {
             "products": {
@@ -93,32 +129,104 @@ class GloFasAPI:
     # PRIMARY FUNCTIONS
     # ==============================================================================
 
+    def run(self, geometry, params, dates=None, bbox=None, index=None, distinct_values=None, progress=None):
+        """
+        Download and process GloFAS data for a geometry, without any widget.
+
+        :param geometry: The geometry to process, a GeoJSON dictionary, a Shapely geometry, a GeoDataFrame or an Earth
+                         Engine geometry.
+        :param params: The GloFAS parameters, with the same keys as `GloFasAPINotebookInterface.gather_parameters`.
+        :param dates: Optional list of datetime.date objects. By default the single 'year', 'month' and 'day' of
+                      `params` is processed.
+        :param bbox: Optional bounding box with 'minx', 'miny', 'maxx' and 'maxy' columns. Defaults to the bounds of
+                     the geometry.
+        :param index: Optional index of the geometry, used in the file names.
+        :param distinct_values: Optional distinct values of the geometry, used in the file names.
+        :param progress: Optional callable called with a number of completed steps out of 10 and a status message.
+        :return: The list of processed rasters, one per date with data, or the raster found by the no-data helper.
+
+        `params` is copied and never modified. Runs write their files to params['folder_location'] under names that
+        only depend on the product, index, distinct values and date, so runs executed concurrently must write to
+        different folders, e.g. with params['create_sub_folder'] set to True, as `run_glofas_job` does.
+
+        Example usage:
+            glofas = GloFasAPI()
+            rasters = glofas.run(geojson, params, dates=[datetime.date(2023, 5, 1), datetime.date(2023, 5, 2)],
+                                 progress=lambda steps, message: print(message))
+        """
+        params = dict(params)
+        progress = progress or (lambda steps, message: None)
+        if bbox is None:
+            west, south, east, north = as_clip_geometry(geometry, self.ee_instance).bounds
+            bbox = {'minx': [west], 'miny': [south], 'maxx': [east], 'maxy': [north]}
+
+        try:
+            progress(4, "Downloading data...")
+
+            if params.get('create_sub_folder'):
+                folder_path = params['folder_location']
+                params['folder_location'] = self._create_sub_folder(params['folder_location'])
+                try:
+                    os.rename(os.path.join(folder_path, 'geometry.geojson'),
+                              os.path.join(params['folder_location'], 'geometry.geojson'))
+                except (PermissionError, FileNotFoundError):
+                    pass
+
+            with open(os.path.join(params['folder_location'], 'parameters.json'), 'w') as f:
+                json.dump(params, f, default=str)
+
+            processed_rasters = []
+
+            def process_downloaded_file(date, file_path):
+                progress(0, f"Processing {date}...")
+                if params.get('ensemble_statistics') and params.get('product_type') == 'ensemble_perturbed_forecasts':
+                    ensemble_statistics_from_grib(file_path, params['folder_location'])
+                processed_rasters.append(process_and_clip_raster(file_path, geometry, params, self.ee_instance))
+
+            if dates:
+                # Request the whole range at once and process every day as soon as its request is downloaded
+                self.download_glofas_date_range(bbox=bbox, params=params, dates=dates, index=index,
+                                                distinct_values=distinct_values,
+                                                on_date_downloaded=process_downloaded_file)
+            else:
+                file_path = self.download_glofas_data(bbox=bbox, params=params, index=index,
+                                                      distinct_values=distinct_values)
+                process_downloaded_file(self._availability_date(params), file_path)
+            progress(4, "Processing data...")
+
+            self._write_geometry(geometry, params['folder_location'])
+            progress(2, "Finished!")
+            return processed_rasters
+
+        except Exception as e:
+            print(e)
+            if "no data is available within your requested subset" in str(e) and params.get('no_data_helper'):
+                processed_raster = self.no_data_helper_function(bbox, params, geometry, index, distinct_values)
+                return [processed_raster] if processed_raster else []
+            else:
+                print("An error occurred that couldn't be handled by the no data helper function.")
+                return []
+
     def download_data(self, product_name, request_parameters, file_name):
         # Construct the file path
-        day = request_parameters.get('day', '01')
         file_path = os.path.join(request_parameters['folder_location'], file_name)
 
+        cached_file_path = self.get_cached_grib(product_name, request_parameters)
+        if cached_file_path is not None:
+            shutil.copyfile(cached_file_path, file_path)
+            return file_path
+
         f = io.StringIO()
         # Call the CDS API
         with redirect_stdout(f):
             self.client.retrieve(
                 product_name,
-                {
-                    'variable': request_parameters['variable'],
-                    'format': request_parameters['format'],
-                    'system_version': request_parameters['system_version'],
-                    'hydrological_model': request_parameters['hydrological_model'],
-                    'product_type': request_parameters['product_type'],
-                    'year': request_parameters['year'],
-                    'day': day,
-                    'month': request_parameters['month'],
-                    'leadtime_hour': request_parameters['leadtime_hour'],
-                    'area': request_parameters['area'],
-                },
+                self._build_cds_request(request_parameters),
                 file_path
             )
 
-            return file_path
+        self.cache_grib(product_name, request_parameters, file_path)
+        return file_path
 
     def download_glofas_data(self, bbox, params, index=None, distinct_values=None):
         """
@@ -129,7 +237,352 @@ class GloFasAPI:
         :return: The file path of the downloaded Glofas data.
         """
 
-        request_parameters = {
+        request_parameters = self._build_request_parameters(bbox, params)
+        if not self._check_calendar(params, [datetime.date.fromisoformat(self._availability_date(params))]):
+            # Fail like CDS does, without submitting the request, so the no-data helper can take over
+            raise Exception("no data is available within your requested subset")
+
+        index = index if index is not None else 0
+
+        # Construct file name based on the parameters
+        file_name = self._build_file_name(params, index, distinct_values, params.get('year'), params.get('month'),
+                                          request_parameters.get('day', '01'))
+
+        # Download data and return the file path
+        return self.download_data(params['glofas_product'], request_parameters, file_name)
+
+    def download_glofas_date_range(self, bbox, params, dates, index=None, distinct_values=None,
+                                   on_date_downloaded=None):
+        """
+        Download several days with as few CDS requests as possible and split the result into one GRIB per day.
+
+        :param bbox: The bounding box of the area to download Glofas data for.
+        :param params: The parameters for downloading Glofas data. 'year', 'month' and 'day' are ignored.
+        :param dates: The list of datetime.date objects to download.
+        :param index: The index of the Glofas data.
+        :param distinct_values: The distinct values for the Glofas data (optional).
+        :param on_date_downloaded: Optional function called with the date and file path of every day as soon as the
+                                   request containing it has been downloaded and split.
+        :return: A dictionary mapping every date found in the downloaded data to the file path of its GRIB file.
+
+        The dates are grouped into requests by `plan_date_requests`, so a 30 day range is retrieved in one or two
+        requests instead of 30. Every request is submitted to the CDS job queue before waiting on any of them, and the
+        results are split as they arrive. The per-day files are named as `download_glofas_data` names single days.
+
+        Example usage:
+            dates = [datetime.date(2023, 5, 1) + datetime.timedelta(days=i) for i in range(30)]
+            file_paths = glofas.download_glofas_date_range(bbox, params, dates)
+        """
+        index = index if index is not None else 0
+        file_paths = {}
+        output_paths = {}
+        job_ids = []
+
+        # Serve the days downloaded by earlier requests from the cache and only request the others
+        dates_to_request = []
+        for date in self._check_calendar(params, sorted(set(dates))):
+            file_path = os.path.join(params['folder_location'],
+                                     self._build_file_name(params, index, distinct_values, date.year, date.month,
+                                                           date.day))
+            cached_file_path = self.get_cached_grib(params['glofas_product'],
+                                                    self._build_date_request_parameters(bbox, params, date))
+            if cached_file_path is None:
+                dates_to_request.append(date)
+                continue
+            shutil.copyfile(cached_file_path, file_path)
+            file_paths[date] = file_path
+            if on_date_downloaded is not None:
+                on_date_downloaded(date, file_path)
+
+        for request_index, request in enumerate(self.plan_date_requests(dates_to_request, params.get('leadtime_hour'),
+                                                                        params.get('product_type'))):
+            request_parameters = self._build_request_parameters(bbox, params)
+            request_parameters.update({key: request[key] for key in ('year', 'month', 'day', 'leadtime_hour')})
+
+            combined_file_name = self._build_file_name(params, index, distinct_values, 'combined', request_index,
+                                                       len(request['dates']))
+            job_id = self.job_queue.submit(params['glofas_product'], self._build_cds_request(request_parameters),
+                                           os.path.join(params['folder_location'], combined_file_name))
+            job_ids.append(job_id)
+            output_paths[job_id] = {
+                date: os.path.join(params['folder_location'],
+                                   self._build_file_name(params, index, distinct_values, date.year, date.month,
+                                                         date.day))
+                for date in request['dates']
+            }
+
+        errors = []
+        for job in self.job_queue.as_completed(job_ids):
+            if job['state'] == 'failed':
+                errors.append(job['error'])
+                continue
+            split_paths = self.split_grib_by_date(job['target'], output_paths[job['job_id']])
+            os.remove(job['target'])
+            for date, file_path in split_paths.items():
+                self.cache_grib(params['glofas_product'], self._build_date_request_parameters(bbox, params, date),
+                                file_path)
+            file_paths.update(split_paths)
+            if on_date_downloaded is not None:
+                for date, file_path in sorted(split_paths.items()):
+                    on_date_downloaded(date, file_path)
+
+        if errors and not file_paths:
+            raise Exception(errors[0])
+        for error in errors:
+            print(error)
+
+        missing_dates = [date for date in dates if date not in file_paths]
+        if not errors:
+            # Every request succeeded, so the days it did not contain do not exist for this combination, unless they
+            # may not be published yet. The calendar covers every combination of the system version, so the outcome is
+            # only recorded for the combination
+            published_before = datetime.date.today() - datetime.timedelta(days=self.publication_lag_days)
+            for date in missing_dates:
+                if date in dates_to_request and date < published_before:
+                    self.record_availability(dict(params, year=date.year, month=date.month, day=date.day),
+                                             self._combination(params), False)
+        if missing_dates:
+            print(f"No data was returned for {', '.join(str(date) for date in missing_dates)}.")
+
+        return dict(sorted(file_paths.items()))
+
+    def download_and_clip_geometries(self, geometries, bboxes, params, labels, dates=None):
+        """
+        Download GloFAS data once for several geometries and clip it to each of them.
+
+        :param geometries: The geometries to clip to, e.g. the admin units or watersheds of a run.
+        :param bboxes: The bounding box of every geometry, with 'minx', 'miny', 'maxx' and 'maxy' columns.
+        :param params: The parameters for downloading Glofas data.
+        :param labels: One label per geometry, used in the clipped file names.
+        :param dates: Optional list of datetime.date objects. By default the 'year', 'month' and 'day' of `params` are
+                      downloaded.
+        :return: A dictionary mapping every label to the list of its clipped rasters, one per date.
+
+        When CDS has no data for the requested combination and params['no_data_helper'] is set, every date is downloaded
+        with the first other available combination, as `process_api` does for a single geometry.
+
+        The union of the bounding boxes, snapped to the GloFAS grid, is retrieved in a single request (or a single
+        date range), and every downloaded file is read once and clipped to all geometries. Twenty admin units cost one
+        download instead of twenty.
+
+        Example usage:
+            clipped = glofas.download_and_clip_geometries(geometries, bboxes, params, ['north', 'south'])
+        """
+        bbox = self.union_bbox(bboxes)
+        try:
+            if dates:
+                file_paths = list(self.download_glofas_date_range(bbox, params, dates,
+                                                                  distinct_values=['union']).values())
+            else:
+                file_paths = [self.download_glofas_data(bbox, params, distinct_values=['union'])]
+        except Exception as e:
+            if "no data is available within your requested subset" not in str(e) or not params.get('no_data_helper'):
+                raise
+            print(e)
+            file_paths = self._no_data_union_fallback(bbox, params, dates)
+
+        clipped = {label: [] for label in labels}
+        for file_path in file_paths:
+            if params.get('clip_to_geometry', True):
+                clipped_paths = clip_raster_to_geometries(file_path, geometries, labels, self.ee_instance)
+            else:
+                clipped_paths = {label: file_path for label in labels}
+            for label, clipped_path in clipped_paths.items():
+                clipped[label].append(clipped_path)
+
+        return clipped
+
+    def extract_station_timeseries(self, stations, params, dates=None, search_radius=0, output_file=None):
+        """
+        Download GloFAS data around a set of stations and extract their discharge time series.
+
+        :param stations: A DataFrame with 'station_id', 'lon' and 'lat' columns, e.g. river gauges.
+        :param params: The parameters for downloading Glofas data.
+        :param dates: Optional list of datetime.date objects. By default the 'year', 'month' and 'day' of `params` are
+                      downloaded.
+        :param search_radius: Number of grid cells searched around each station for the river cell.
+        :param output_file: Optional CSV file the table is written to.
+        :return: A tidy DataFrame with one row per station, reference date, member and lead time.
+
+        A single area covering every station, padded by the search radius, is downloaded and the values of all stations
+        are read from the decoded arrays at once, without writing or clipping any raster.
+
+        Example usage:
+            stations = pd.read_csv('gauges.csv')
+            timeseries = glofas.extract_station_timeseries(stations, params, dates=dates, search_radius=1)
+        """
+        padding = (search_radius + 1) * self.grid_resolution
+        bbox = self.union_bbox([{'minx': [stations['lon'].min() - padding], 'miny': [stations['lat'].min() - padding],
+                                 'maxx': [stations['lon'].max() + padding], 'maxy': [stations['lat'].max() + padding]}])
+        if dates:
+            file_paths = list(self.download_glofas_date_range(bbox, params, dates, distinct_values=['stations']).values())
+        else:
+            file_paths = [self.download_glofas_data(bbox, params, distinct_values=['stations'])]
+
+        timeseries = extract_points_from_grib(file_paths, stations, search_radius=search_radius)
+        if output_file:
+            timeseries.to_csv(output_file, index=False)
+        return timeseries
+
+    def _no_data_union_fallback(self, bbox, params, dates):
+        # Find another combination for every date and keep the downloaded files, they are clipped by the caller
+        file_paths = []
+        for date in dates or [None]:
+            date_params = dict(params)
+            if date is not None:
+                date_params.update({'year': date.year, 'month': date.month, 'day': date.day})
+            self.no_data_helper_function(bbox, date_params, None, 0, ['union'],
+                                         process_file=lambda file_path: file_paths.append(file_path) or file_path)
+        if not file_paths:
+            raise Exception("no data is available within your requested subset for any combination")
+        return file_paths
+
+    def union_bbox(self, bboxes):
+        """
+        :param bboxes: A list of bounding boxes with 'minx', 'miny', 'maxx' and 'maxy' columns, e.g. GeoDataFrame
+                       bounds.
+        :return: The bounding box containing all of them, snapped outwards to the GloFAS grid, in the same format.
+        """
+        north = max(bbox['maxy'][0] for bbox in bboxes)
+        west = min(bbox['minx'][0] for bbox in bboxes)
+        south = min(bbox['miny'][0] for bbox in bboxes)
+        east = max(bbox['maxx'][0] for bbox in bboxes)
+        north, west, south, east = self.snap_area_to_grid([north, west, south, east])
+        return {'minx': [west], 'miny': [south], 'maxx': [east], 'maxy': [north]}
+
+    def plan_date_requests(self, dates, leadtime_hour=None, product_type=None):
+        """
+        Group dates and lead times into CDS requests.
+
+        :param dates: The list of datetime.date objects to request.
+        :param leadtime_hour: A lead time in hours, or a list of lead times.
+        :param product_type: The product type, used to count the ensemble members of a request.
+        :return: A list of requests, each a dictionary with the 'year', 'month', 'day' and 'leadtime_hour' lists of the
+                 request and the 'dates' it covers.
+
+        A CDS request covers every combination of its years, months and days. Months are grouped with the same set
+        of days, then years with the same months and days, so every request covers exactly the requested dates.
+        Requests larger than `max_fields_per_request` are split in halves, along years, then months, then days and
+        finally lead times.
+        """
+        leadtime_hours = leadtime_hour if isinstance(leadtime_hour, (list, tuple)) else [leadtime_hour]
+        members = self.ensemble_members if product_type == 'ensemble_perturbed_forecasts' else 1
+
+        days_by_month = defaultdict(set)
+        for date in set(dates):
+            days_by_month[(date.year, date.month)].add(date.day)
+
+        years_by_group = defaultdict(list)
+        months_by_days = defaultdict(lambda: defaultdict(list))
+        for (year, month), days in sorted(days_by_month.items()):
+            months_by_days[tuple(sorted(days))][year].append(month)
+        for days, months_by_year in months_by_days.items():
+            for year, months in months_by_year.items():
+                years_by_group[(tuple(months), days)].append(year)
+
+        requests = []
+        for (months, days), years in sorted(years_by_group.items(), key=lambda item: (item[1], item[0])):
+            request = {'year': years, 'month': list(months), 'day': list(days), 'leadtime_hour': leadtime_hours}
+            requests.extend(self._split_request(request, members))
+
+        return [{
+            'year': [str(year) for year in request['year']],
+            'month': [f"{month:02d}" for month in request['month']],
+            'day': [f"{day:02d}" for day in request['day']],
+            'leadtime_hour': [str(hour) for hour in request['leadtime_hour']],
+            'dates': [datetime.date(year, month, day)
+                      for year, month, day in itertools.product(request['year'], request['month'], request['day'])]
+        } for request in requests]
+
+    def get_cached_grib(self, product_name, request_parameters):
+        """
+        Find a cached GRIB file for a request.
+
+        :param product_name: The GloFAS product.
+        :param request_parameters: The request parameters built by `_build_request_parameters`.
+        :return: The path of a cached GRIB file covering the request, or None. The file must be copied before use.
+
+        An entry for the same request is used first. Otherwise any cached entry with the same product, version,
+        model, product type, dates and lead times whose area contains the requested area is used, so the unit of an
+        overlapping admin area is not downloaded again. Such a file covers more than the requested area until it is
+        clipped to the geometry.
+        """
+        cached_file_path = self.grib_cache.get_file(self._grib_cache_key(product_name, request_parameters))
+        if cached_file_path is not None:
+            return cached_file_path
+
+        request_key = self._grib_cache_key(product_name, request_parameters, include_area=False)
+        north, west, south, east = self.snap_area_to_grid(request_parameters['area'])
+        for key, metadata in self.grib_cache.entries().items():
+            if not metadata or metadata.get('request_key') != request_key:
+                continue
+            cached_north, cached_west, cached_south, cached_east = metadata['area']
+            if cached_north >= north and cached_west <= west and cached_south <= south and cached_east >= east:
+                return self.grib_cache.get_file(key)
+        return None
+
+    def cache_grib(self, product_name, request_parameters, file_path):
+        """
+        Store a downloaded GRIB file in the shared cache.
+
+        :param product_name: The GloFAS product.
+        :param request_parameters: The request parameters the file was downloaded with.
+        :param file_path: The downloaded GRIB file. It is copied into the cache.
+        :return: The path of the cached file.
+        """
+        return self.grib_cache.put_file(
+            self._grib_cache_key(product_name, request_parameters), file_path,
+            metadata={'request_key': self._grib_cache_key(product_name, request_parameters, include_area=False),
+                      'area': self.snap_area_to_grid(request_parameters['area'])})
+
+    def snap_area_to_grid(self, area):
+        """
+        :param area: A CDS area as [north, west, south, east] in degrees.
+        :return: The smallest area on the GloFAS grid containing it, as [north, west, south, east].
+        """
+        north, west, south, east = (float(value) / self.grid_resolution for value in area)
+        # Round before snapping so that floating point noise does not add a row or column of cells
+        return [round(math.ceil(round(north, 6)) * self.grid_resolution, 4),
+                round(math.floor(round(west, 6)) * self.grid_resolution, 4),
+                round(math.floor(round(south, 6)) * self.grid_resolution, 4),
+                round(math.ceil(round(east, 6)) * self.grid_resolution, 4)]
+
+    def split_grib_by_date(self, file_path, output_paths):
+        """
+        Split a GRIB file into one file per forecast reference date.
+
+        :param file_path: The GRIB file to split.
+        :param output_paths: A dictionary mapping datetime.date objects to the file path their messages are written to.
+        :return: A dictionary mapping the dates that had at least one message to their file paths.
+        """
+        output_files = {}
+        written = {}
+        try:
+            with pygrib.open(file_path) as grib_file:
+                for message in grib_file:
+                    date = datetime.datetime.strptime(str(message.dataDate), '%Y%m%d').date()
+                    if date not in output_paths:
+                        continue
+                    if date not in output_files:
+                        output_files[date] = open(output_paths[date], 'wb')
+                    output_files[date].write(message.tostring())
+                    written[date] = output_paths[date]
+        finally:
+            for output_file in output_files.values():
+                output_file.close()
+        return written
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    def _build_request_parameters(self, bbox, params):
+        """
+        :param bbox: The bounding box of the area to download Glofas data for.
+        :param params: The parameters for downloading Glofas data.
+        :return: The request parameters passed to `download_data`.
+        """
+        return {
             'glofas_product': params.get('glofas_product'),
             'variable': 'river_discharge_in_the_last_24_hours',
             'format': 'grib',
@@ -141,25 +594,105 @@ class GloFasAPI:
             # Omit 'day' to use the default value or provide a specific day
             'day': params.get('day', '01'),
             'leadtime_hour': params.get('leadtime_hour'),
-            'area': [bbox['maxy'][0], bbox['minx'][0], bbox['miny'][0], bbox['maxx'][0]],
+            'area': self.snap_area_to_grid([bbox['maxy'][0], bbox['minx'][0], bbox['miny'][0], bbox['maxx'][0]]),
             'folder_location': params.get('folder_location'),
         }
 
-        index = index if index is not None else 0
-
-        # Construct file name based on the parameters
-        file_name = f"{params['glofas_product']}_{'userdefined' if distinct_values is None else '_'.join(str(value) for value in distinct_values)}_{index}_{params.get('year')}_{params.get('month')}_{request_parameters.get('day', '01')}.grib"
+    def _build_date_request_parameters(self, bbox, params, date):
+        """
+        :param bbox: The bounding box of the area to download Glofas data for.
+        :param params: The parameters for downloading Glofas data.
+        :param date: A datetime.date.
+        :return: The request parameters of the single day, used as the cache key of its GRIB file.
+        """
+        request_parameters = self._build_request_parameters(bbox, params)
+        request_parameters.update({'year': date.year, 'month': date.month, 'day': date.day})
+        return request_parameters
 
-        # Download data and return the file path
-        return self.download_data(params['glofas_product'], request_parameters, file_name)
+    def _grib_cache_key(self, product_name, request_parameters, include_area=True):
+        """
+        :param product_name: The GloFAS product.
+        :param request_parameters: The request parameters.
+        :param include_area: Include the grid snapped area in the key.
+        :return: A hash of the canonical form of the request, independent of how numbers and lists are written.
+        """
+        def as_sorted_ints(value):
+            values = value if isinstance(value, (list, tuple)) else [value]
+            return sorted(int(item) for item in values if item is not None)
+
+        return hash_key({
+            'product': product_name,
+            'variable': request_parameters['variable'],
+            'system_version': request_parameters['system_version'],
+            'hydrological_model': request_parameters['hydrological_model'],
+            'product_type': request_parameters['product_type'],
+            'year': as_sorted_ints(request_parameters['year']),
+            'month': as_sorted_ints(request_parameters['month']),
+            'day': as_sorted_ints(request_parameters.get('day', '01')),
+            'leadtime_hour': as_sorted_ints(request_parameters['leadtime_hour']),
+            'area': self.snap_area_to_grid(request_parameters['area']) if include_area else None
+        })
+
+    def _build_cds_request(self, request_parameters):
+        """
+        :param request_parameters: The request parameters built by `_build_request_parameters`.
+        :return: The request dictionary sent to the CDS API.
+        """
+        return {
+            'variable': request_parameters['variable'],
+            'format': request_parameters['format'],
+            'system_version': request_parameters['system_version'],
+            'hydrological_model': request_parameters['hydrological_model'],
+            'product_type': request_parameters['product_type'],
+            'year': request_parameters['year'],
+            'day': request_parameters.get('day', '01'),
+            'month': request_parameters['month'],
+            'leadtime_hour': request_parameters['leadtime_hour'],
+            'area': request_parameters['area'],
+        }
 
-    # ==============================================================================
-    # HELPER FUNCTIONS
-    # ==============================================================================
+    def _build_file_name(self, params, index, distinct_values, year, month, day):
+        """
+        :param params: The parameters for downloading Glofas data.
+        :param index: The index of the Glofas data.
+        :param distinct_values: The distinct values for the Glofas data, or None for user defined geometries.
+        :param year: The year of the data.
+        :param month: The month of the data.
+        :param day: The day of the data.
+        :return: The GRIB file name.
+        """
+        return f"{params['glofas_product']}_{'userdefined' if distinct_values is None else '_'.join(str(value) for value in distinct_values)}_{index}_{year}_{month}_{day}.grib"
 
-    def no_data_helper_function(self, bbox, glofas_params, geometry, index, distinct_values):
+    def _split_request(self, request, members):
+        """
+        :param request: A request dictionary with 'year', 'month', 'day' and 'leadtime_hour' lists.
+        :param members: The number of ensemble members of every date and lead time.
+        :return: A list of requests covering the same fields, each within `max_fields_per_request` when possible.
+        """
+        keys = ('year', 'month', 'day', 'leadtime_hour')
+        fields = members
+        for key in keys:
+            fields *= len(request[key])
+        if fields <= self.max_fields_per_request:
+            return [request]
+
+        for key in keys:
+            if len(request[key]) > 1:
+                half = len(request[key]) // 2
+                return (self._split_request({**request, key: request[key][:half]}, members) +
+                        self._split_request({**request, key: request[key][half:]}, members))
+        return [request]
+
+    def no_data_helper_function(self, bbox, glofas_params, geometry, index, distinct_values, process_file=None):
         """
         Helper function to handle 'no data available' scenario by trying different combinations.
+
+        :param process_file: Optional function processing the downloaded file instead of clipping it to `geometry`.
+                             A falsy result counts as a failure and the next combination is tried.
+
+        The availability of every other (system_version, hydrological_model, product_type) combination is probed
+        concurrently with `probe_availability`, and only combinations that are available, or whose availability could
+        not be determined, are downloaded, in their order of preference.
         """
         system_version_list = self.glofas_dict['products'][glofas_params['glofas_product']]['system_version']
         hydrological_model_list = self.glofas_dict['products'][glofas_params['glofas_product']]['hydrological_model']
@@ -167,26 +700,173 @@ class GloFasAPI:
 
         all_combinations = list(itertools.product(system_version_list, hydrological_model_list, product_type_list))
 
-        last_attempted_combination = (glofas_params['system_version'], glofas_params['hydrological_model'],
-                                      glofas_params['product_type'] if glofas_params.get('product_type') else None)
+        last_attempted_combination = self._combination(glofas_params)
 
         all_combinations.remove(last_attempted_combination)
+        self.record_availability(glofas_params, last_attempted_combination, False)
+
+        availability = self.probe_availability(bbox, glofas_params, all_combinations)
 
         for comb in all_combinations:
+            if availability[comb] is False:
+                continue
             try:
                 glofas_params['system_version'], glofas_params['hydrological_model'], glofas_params[
                     'product_type'] = comb
                 file_path = self.download_glofas_data(bbox, glofas_params, index, distinct_values)
-                processed_raster = process_and_clip_raster(file_path, geometry, glofas_params, self.ee_instance)
+                if process_file is not None:
+                    processed_raster = process_file(file_path)
+                else:
+                    processed_raster = process_and_clip_raster(file_path, geometry, glofas_params, self.ee_instance)
                 if processed_raster:  # Check if processing was successful
                     return processed_raster
             except Exception as e:
                 print(e)
-                if "no data is available within your requested subset" not in str(e):
-                    break  # Exit the loop if a different error occurs
+                if "no data is available" in str(e):
+                    self.record_availability(glofas_params, comb, False)
         print("No suitable data could be found for any combination.")
         return None
 
+    def probe_availability(self, bbox, glofas_params, combinations):
+        """
+        Check concurrently which combinations have data for the date of the parameters.
+
+        :param bbox: The bounding box of the area of interest.
+        :param glofas_params: The parameters for downloading Glofas data.
+        :param combinations: A list of (system_version, hydrological_model, product_type) tuples.
+        :return: A dictionary mapping every combination to True if data is available, False if it is not and None if
+                 the probe failed for another reason.
+
+        Combinations with a recorded outcome are answered from the availability records. For the others, a request
+        for a single grid cell and lead time is submitted to the CDS job queue, so all probes wait in the queue at the
+        same time and the total latency is that of the slowest probe. Outcomes are recorded for later runs.
+        """
+        availability = {comb: self.get_recorded_availability(glofas_params, comb) for comb in combinations}
+        to_probe = [comb for comb in combinations if availability[comb] is None]
+        if not to_probe:
+            return availability
+
+        probe_folder = tempfile.mkdtemp(prefix='glofas_probe_')
+        leadtime_hour = glofas_params.get('leadtime_hour')
+        north, west = self.snap_area_to_grid([bbox['maxy'][0], bbox['minx'][0], bbox['maxy'][0], bbox['minx'][0]])[:2]
+        probe_bbox = {'minx': [west], 'miny': [north - self.grid_resolution], 'maxx': [west + self.grid_resolution],
+                      'maxy': [north]}
+
+        job_combinations = {}
+        for comb in to_probe:
+            probe_params = dict(glofas_params)
+            probe_params['system_version'], probe_params['hydrological_model'], probe_params['product_type'] = comb
+            probe_params['leadtime_hour'] = leadtime_hour[0] if isinstance(leadtime_hour, (list, tuple)) else leadtime_hour
+            request_parameters = self._build_request_parameters(probe_bbox, probe_params)
+            job_id = self.job_queue.submit(glofas_params['glofas_product'], self._build_cds_request(request_parameters),
+                                           os.path.join(probe_folder, f"probe_{len(job_combinations)}.grib"))
+            job_combinations[job_id] = comb
+
+        for job in self.job_queue.as_completed(list(job_combinations)):
+            comb = job_combinations[job['job_id']]
+            if job['state'] == 'downloaded':
+                availability[comb] = True
+            elif "no data is available" in job.get('error', ''):
+                availability[comb] = False
+            if availability[comb] is not None:
+                self.record_availability(glofas_params, comb, availability[comb])
+
+        shutil.rmtree(probe_folder, ignore_errors=True)
+        return availability
+
+    def get_recorded_availability(self, glofas_params, combination):
+        """
+        :param glofas_params: The parameters for downloading Glofas data, providing the product and date.
+        :param combination: A (system_version, hydrological_model, product_type) tuple.
+        :return: True if the combination was recorded as available on that date, False if it was recorded as
+                 unavailable less than `unavailable_ttl` seconds ago, None otherwise.
+        """
+        entry = self.availability.get(self._availability_key(glofas_params['glofas_product'], combination), {}).get(
+            self._availability_date(glofas_params))
+        if entry is True:
+            return True
+        if isinstance(entry, dict) and time.time() - entry['recorded'] < self.unavailable_ttl:
+            return False
+        return None
+
+    def record_availability(self, glofas_params, combination, available):
+        """
+        Record whether a combination has data on the date of the parameters.
+
+        :param glofas_params: The parameters for downloading Glofas data, providing the product and date.
+        :param combination: A (system_version, hydrological_model, product_type) tuple.
+        :param available: True if data is available, False otherwise. Unavailable outcomes are stored with the time
+                          they were recorded and expire after `unavailable_ttl` seconds.
+        :return: None
+        """
+        key = self._availability_key(glofas_params['glofas_product'], combination)
+        date = self._availability_date(glofas_params)
+        entry = True if available else {'available': False, 'recorded': time.time()}
+
+        def merge(availability):
+            availability = availability or {}
+            availability.setdefault(key, {})[date] = entry
+            return availability
+
+        # Merged into the file under its lock, so records of concurrent runs are kept
+        self.availability = update_json(self.availability_path, merge)
+        if available:
+            # The calendar is kept per system version, so only data found for one combination proves the date exists
+            self.calendar.record(glofas_params['glofas_product'], combination[0],
+                                 datetime.date.fromisoformat(self._availability_date(glofas_params)), True)
+
+    def available_dates(self, product_name, system_version):
+        """
+        :param product_name: The GloFAS product, e.g. 'cems-glofas-forecast'.
+        :param system_version: The system version, e.g. 'operational'.
+        :return: The sorted list of dates available for the product and system version, up to yesterday.
+
+        The calendar is built the first time from the first year of the product and then only extended with the days
+        published since, so repeated calls return immediately.
+        """
+        start_date = datetime.date(min(self.glofas_dict['products'][product_name]['year']), 1, 1)
+        return self.calendar.build(product_name, system_version, start_date)
+
+    def _check_calendar(self, params, dates):
+        # Drop the dates known not to exist for the system version, or recently found without data for the combination,
+        # so no request is submitted for them
+        unavailable = [date for date in dates
+                       if self.calendar.is_available(params['glofas_product'], params['system_version'], date) is False
+                       or self.get_recorded_availability(dict(params, year=date.year, month=date.month, day=date.day),
+                                                         self._combination(params)) is False]
+        if unavailable:
+            print(f"Skipping {', '.join(str(date) for date in unavailable)}: no data is available for "
+                  f"{params['glofas_product']} {' '.join(str(value) for value in self._combination(params) if value)} "
+                  f"on these dates.")
+        return [date for date in dates if date not in unavailable]
+
+    def _load_availability(self):
+        return read_json(self.availability_path, {})
+
+    @staticmethod
+    def _combination(glofas_params):
+        return (glofas_params['system_version'], glofas_params['hydrological_model'],
+                glofas_params['product_type'] if glofas_params.get('product_type') else None)
+
+    @staticmethod
+    def _availability_key(product_name, combination):
+        return '/'.join([product_name] + [str(value) for value in combination])
+
+    @staticmethod
+    def _availability_date(glofas_params):
+        return f"{int(glofas_params['year']):04d}-{int(glofas_params['month']):02d}-{int(glofas_params.get('day', 1)):02d}"
+
+    def _write_geometry(self, geometry, folder_location):
+        # Serialize the geometry to GeoJSON
+        if isinstance(geometry, (ee.Geometry, ee.Feature, ee.FeatureCollection)):
+            geojson_geometry = geometry.getInfo()  # If geometry is an Earth Engine object
+        elif isinstance(geometry, dict):
+            geojson_geometry = geometry  # If geometry is already in GeoJSON format
+        else:
+            geojson_geometry = mapping(as_clip_geometry(geometry, self.ee_instance))
+
+        with open(os.path.join(folder_location, 'geometry.geojson'), 'w') as f:
+            f.write(json.dumps(geojson_geometry))
 
     def _create_sub_folder(self, base_folder: str) -> str:
         """
@@ -196,15 +876,20 @@ class GloFasAPI:
         :type base_folder: str
         :return: The path of the newly created subfolder.
         :rtype: str
+
+        Runs started in the same second get a numbered suffix, so concurrent runs never share a subfolder.
         """
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")  # More readable timestamp
         folder_name = os.path.join(base_folder, f"glofas_processed_on_{timestamp}")
-        try:
-            os.mkdir(folder_name)
-            return folder_name
-        except OSError as e:
-            self.logger.error(f"Failed to create subfolder: {e}")
-            return base_folder
+        for attempt in itertools.count(2):
+            try:
+                os.mkdir(folder_name)
+                return folder_name
+            except FileExistsError:
+                folder_name = os.path.join(base_folder, f"glofas_processed_on_{timestamp}_{attempt}")
+            except OSError as e:
+                print(f"Failed to create subfolder: {e}")
+                return base_folder
 
 
     def get_last_day_of_month(self, year, month):
@@ -220,6 +905,40 @@ class GloFasAPI:
         last_day_of_month = next_month_first_day - datetime.timedelta(days=1)
         return last_day_of_month
 
+
+# One GloFasAPI per worker process, created by the first job the process runs
+_worker_api = None
+
+
+def run_glofas_job(geometry, params, dates=None, bbox=None, index=None, distinct_values=None, progress=None):
+    """
+    Run `GloFasAPI.run` in a worker process.
+
+    The clients, caches and Earth Engine session of a GloFasAPI cannot be pickled, so every worker process creates its
+    own instance and reuses it for the jobs it runs. The geometry must be picklable, e.g. a GeoJSON dictionary or a
+    Shapely geometry, and so must the progress callback, e.g. a module-level function.
+
+    Every job writes its outputs to its own subfolder of params['folder_location'], see `_create_sub_folder`, so jobs
+    for geometries without an index or distinct values do not overwrite each other's files.
+
+    The workers share the state files of their instances: the CDS job state, the GRIB cache index, the availability
+    records and the availability calendar are re-read and written under a file lock, so concurrent workers merge their
+    changes instead of overwriting each other's.
+
+    :return: The list of processed rasters returned by `GloFasAPI.run`.
+
+    Example usage:
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(run_glofas_job, geojson, params, dates) for geojson in geometries]
+            rasters = [future.result() for future in futures]
+    """
+    global _worker_api
+    if _worker_api is None:
+        _worker_api = GloFasAPI()
+    return _worker_api.run(geometry, dict(params, create_sub_folder=True), dates=dates, bbox=bbox, index=index, distinct_values=distinct_values,
+                           progress=progress)
+
+
 class GloFasAPINotebookInterface(GloFasAPI):
 
     def __init__(self, ee_manager: Optional[EarthEngineManager] = None):
@@ -315,12 +1034,23 @@ class GloFasAPINotebookInterface(GloFasAPI):
             names='value'
         )
 
+        # Every system version has its own calendar
+        self.system_version.observe(
+            lambda change: self.on_single_or_date_range_change({'new': self.single_or_date_range.value},
+                                                               glofas_option=glofas_option),
+            names='value'
+        )
+
         self.no_data_helper_checklist = widgets.Checkbox(value=True, description='No-Data Helper Function',
                                                          tooltip="Due to GloFas API framework, some versions and/or "
                                                                  "models aren't available for certain dates. If enabled,"
                                                                  "This will allow the program to automatically alter the version date and "
                                                                  "hydrological model to find a matching dataset.")
 
+        self.ensemble_statistics = widgets.Checkbox(value=False, description='Ensemble Statistics',
+                                                    tooltip="For ensemble perturbed forecasts, also write the ensemble "
+                                                            "mean, median, percentiles and spread of every pixel.")
+
         self.system_version.layout.width = 'auto'
         # self.date_picker.layout.width = 'auto'
 
@@ -351,25 +1081,12 @@ class GloFasAPINotebookInterface(GloFasAPI):
         else:
             return [self.system_version, self.hydrological_model, self.product_type, self.leadtime,
                     self.single_or_date_range,
-                    self.glofas_date_vbox, self.filechooser, self.glofas_end_of_vbox_items]
+                    self.glofas_date_vbox, self.ensemble_statistics, self.filechooser, self.glofas_end_of_vbox_items]
 
     def get_available_dates(self, glofas_option):
-        """Generate a list of available dates based on the selected GloFas option."""
-        min_year = min(self.glofas_dict['products'][glofas_option]['year'])
-        max_year = max(self.glofas_dict['products'][glofas_option]['year'])
-        min_month = 1  # Assuming January is always included
-        max_month = 12  # Assuming December is always included
-        min_day = 1
-
-        available_dates = []
-        for year in range(min_year, max_year + 1):
-            for month in range(min_month, max_month + 1):
-                for day in range(min_day, self.get_last_day_of_month(year, month).day + 1):
-                    if datetime.date(year, month, day) >= datetime.date.today():
-                        break
-                    available_dates.append(datetime.date(year, month, day))
-
-        return available_dates
+        """Get the list of available dates of the selected GloFas option and system version from the calendar."""
+        system_version = self.system_version.value.replace('.', '_').lower()
+        return self.available_dates(glofas_option, system_version)
 
     def update_date_dropdown(self, glofas_option):
         """Update the date dropdown with available dates based on the selected GloFas option."""
@@ -539,7 +1256,8 @@ class GloFasAPINotebookInterface(GloFasAPI):
                 'create_sub_folder': create_sub_folder,
                 'clip_to_geometry': clip_to_geometry,
                 'add_image_to_map': add_image_to_map,
-                'no_data_helper': no_data_helper
+                'no_data_helper': no_data_helper,
+                'ensemble_statistics': self.ensemble_statistics.value
             }
         elif glofas_product == 'cems-glofas-reforecast':
             return {
@@ -555,7 +1273,8 @@ class GloFasAPINotebookInterface(GloFasAPI):
                 'create_sub_folder': create_sub_folder,
                 'clip_to_geometry': clip_to_geometry,
                 'add_image_to_map': add_image_to_map,
-                'no_data_helper': no_data_helper
+                'no_data_helper': no_data_helper,
+                'ensemble_statistics': self.ensemble_statistics.value
             }
         else:
             print("Invalid GloFAS product.")
@@ -564,99 +1283,71 @@ class GloFasAPINotebookInterface(GloFasAPI):
     def process_api(self, geometry, distinct_values, index, bbox, params, pbar=None):
         """
         Process the GLOFAS API data.
-        """
-        try:
-            pbar.update(4)
-            pbar.set_postfix_str("Downloading data...")
 
-            if params['create_sub_folder']:
-                # Create a sub-folder
-                folder_path = params['folder_location']
-                params['folder_location'] = self._create_sub_folder(params['folder_location'])
-
-                try:
-                    os.rename(os.path.join(folder_path, 'geometry.geojson'),
-                              os.path.join(params['folder_location'], 'geometry.geojson'))
-                except PermissionError:
-                    pass
+        The dates are read from the date widgets and the work is delegated to the widget-free `GloFasAPI.run`.
+        """
+        def update_progress_bar(steps, message):
+            if pbar is not None:
+                pbar.update(steps)
+                pbar.set_postfix_str(message)
 
+        processed_rasters = self.run(geometry, params, dates=self.get_selected_dates(), bbox=bbox, index=index,
+                                     distinct_values=distinct_values, progress=update_progress_bar)
+        return processed_rasters[-1] if processed_rasters else None
 
+    def get_selected_dates(self):
+        """
+        :return: The list of dates between the selected start and end dates for a date range, None for a single date.
+        """
+        if self.single_or_date_range.value != "Date Range":
+            return None
 
-            params_file_path = os.path.join(params['folder_location'], 'parameters.json')
+        start_date = self.date_picker.children[0].value
+        end_date = self.date_picker.children[1].value
+        if isinstance(start_date, datetime.datetime):
+            start_date = start_date.date()
+        if isinstance(end_date, datetime.datetime):
+            end_date = end_date.date()
+        return [start_date + datetime.timedelta(days=day) for day in range((end_date - start_date).days + 1)]
 
+    def process_api_multiple(self, geometries, distinct_values_list, bboxes, params, pbar=None):
+        """
+        Process the GLOFAS API data for several geometries with a single download.
+
+        :param geometries: The geometries to process.
+        :param distinct_values_list: The distinct values of every geometry, or None for user defined geometries.
+        :param bboxes: The bounding box of every geometry.
+        :param params: The GloFAS parameters gathered from the widgets.
+        :param pbar: Optional tqdm progress bar.
+        :return: A list with the last clipped raster of every geometry, None where the geometry had no data.
+        """
+        try:
+            if pbar is not None:
+                pbar.update(4)
+                pbar.set_postfix_str("Downloading data...")
 
+            if params['create_sub_folder']:
+                params['folder_location'] = self._create_sub_folder(params['folder_location'])
 
-            with open(params_file_path, 'w') as f:
+            with open(os.path.join(params['folder_location'], 'parameters.json'), 'w') as f:
                 json.dump(params, f)
 
-            if self.single_or_date_range.value == "Date Range":
-                try:
-
-                    start_date = self.date_picker.children[0].value
-                    end_date = self.date_picker.children[1].value
-
-                    current_date = start_date
-                    if isinstance(start_date, datetime.datetime):
-                        start_date = start_date.date()
-                    if isinstance(end_date, datetime.datetime):
-                        end_date = end_date.date()
-                    if isinstance(current_date, datetime.datetime):
-                        current_date = current_date.date()
-
-                    while current_date <= end_date:
-                        params['year'] = str(current_date.year)
-                        params['month'] = current_date.month
-                        params['day'] = str(current_date.day)
-                        file_path = self.download_glofas_data(bbox=bbox, params=params, index=index, distinct_values=distinct_values)
-                        pbar.update(4)
-                        pbar.set_postfix_str("Processing data...")
-                        processed_raster = process_and_clip_raster(file_path, geometry, params, self.ee_instance)
-                        current_date += datetime.timedelta(days=1)
-
-                except Exception as e:
-                    print(e)
-                    if "no data is available within your requested subset" in str(e) and params['no_data_helper']:
-                        return self.no_data_helper_function(bbox, params, geometry, index, distinct_values)
-                    else:
-                        print("An error occurred that couldn't be handled by the no data helper function.")
-                        return None
-
-            else:
+            dates = self.get_selected_dates()
 
-                file_path = self.download_glofas_data(bbox=bbox, params=params, index=index, distinct_values=distinct_values)
-                pbar.update(4)
-                pbar.set_postfix_str("Processing data...")
-                processed_raster = process_and_clip_raster(file_path, geometry, params, self.ee_instance)
-            # Serialize the geometry to GeoJSON
-            if isinstance(geometry, ee.Geometry):
-                geojson_geometry = geometry.getInfo()  # If geometry is an Earth Engine object
-            elif isinstance(geometry, ee.Feature):
-                geojson_geometry = geometry.getInfo()
-            elif isinstance(geometry, ee.FeatureCollection):
-                geojson_geometry = geometry.getInfo()
-            else:
-                geojson_geometry = geometry  # If geometry is already in GeoJSON format
+            labels = [str(index) if distinct_values is None else '_'.join(str(value) for value in distinct_values)
+                      for index, distinct_values in enumerate(distinct_values_list)]
+            clipped = self.download_and_clip_geometries(geometries, bboxes, params, labels, dates=dates)
 
-            # Define the GeoJSON filename
-            geojson_filename = os.path.join(params['folder_location'], 'geometry.geojson')
+            if pbar is not None:
+                pbar.update(6)
+                pbar.set_postfix_str("Finished!")
 
-
-            # Write the GeoJSON to a file
-            with open(geojson_filename, 'w') as f:
-                f.write(json.dumps(geojson_geometry))
-
-            pbar.update(2)
-            pbar.set_postfix_str("Finished!")
-
-            return processed_raster
+            return [clipped[label][-1] if clipped[label] else None for label in labels]
 
         except Exception as e:
             print(e)
-            if "no data is available within your requested subset" in str(e) and params['no_data_helper']:
-                return self.no_data_helper_function(bbox, params, geometry, index, distinct_values)
-            else:
-                print("An error occurred that couldn't be handled by the no data helper function.")
-                return None
+            print("An error occurred while processing the geometries.")
+            return [None] * len(geometries)
 
     def setup_global_variables(self):
         self.glofas_dict = {
@@ -4,11 +4,13 @@
 
 import datetime
 import json
+import multiprocessing
 import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Dict, Any, List
 from typing import Optional, Set, Tuple, Union
-from pyproj import Transformer
 
 import ee
 import geopandas as gpd
@@ -18,11 +20,10 @@ import numpy as np
 import pandas as pd
 import rasterio
 import requests
-from bs4 import BeautifulSoup
 from osgeo import gdal
-from pyproj import CRS
+from requests.adapters import HTTPAdapter
 from rasterio.features import shapes
-from shapely.geometry import Point
+from rasterio.warp import transform_bounds
 from shapely.geometry import shape
 from shapely.geometry.base import BaseGeometry
 import shapely
@@ -31,7 +32,15 @@ from mcimageprocessing import config_manager
 from mcimageprocessing.programmatic.APIs.EarthEngine import EarthEngineManager
 from mcimageprocessing.programmatic.APIs.GPWv4 import GPWv4
 from mcimageprocessing.programmatic.APIs.WorldPop import WorldPop
-from mcimageprocessing.programmatic.shared_functions.utilities import process_and_clip_raster, generate_bbox
+from mcimageprocessing.programmatic.shared_functions.cache import (DEFAULT_CACHE_ROOT, LRUFileCache, hash_key, read_json,
+                                                                   write_json)
+from mcimageprocessing.programmatic.shared_functions.flood_datacube import FloodDatacube
+from mcimageprocessing.programmatic.shared_functions.flood_population import flood_population_overlay, read_population
+from mcimageprocessing.programmatic.shared_functions.modis_tiles import tiles_for_geometry
+from mcimageprocessing.programmatic.shared_functions.utilities import (generate_bbox, as_clip_geometry,
+                                                                     mosaic_images)
+from mcimageprocessing.programmatic.shared_functions.geometry_preparation import (METERS_PER_DEGREE, as_geojson,
+                                                                                  prepare_geometry)
 
 
 # ==============================================================================
@@ -50,9 +59,9 @@ nrt_band_options = {'Water Counts 1-Day 250m Grid_Water_Composite': 0,
                     'Water Counts 3-Day 250m Grid_Water_Composite': 9,
                     'Valid Counts 3-Day 250m Grid_Water_Composite': 10,
                     'Flood 3-Day 250m Grid_Water_Composite': 11}
-modis_proj = CRS("+proj=sinu +R=6371007.181 +nadgrids=@null +wktext")
-modis_tile_size = 1111950.5196666667  # MODIS sinusoidal tile size in meters
 modis_nrt_api_root_url = 'https://nrt3.modaps.eosdis.nasa.gov/api/v2/content/archives/allData/61/MCDWD_L3_NRT'
+modis_nrt_details_url = 'https://nrt3.modaps.eosdis.nasa.gov/api/v2/content/details/allData/61/MCDWD_L3_NRT'
+modis_nrt_file_pattern = re.compile(r"MCDWD_L3_NRT\.A(\d{4})(\d{3})\.h(\d{2})v(\d{2})\.061\.(\d+)\.hdf")
 date_type_options = ['Single Date', 'Date Range', 'All Available Images']
 population_source_variables = ['Residential Population', "Age and Sex Structures"]
 population_source_year_options = [x for x in range(2000, 2021)]
@@ -66,31 +75,48 @@ class ModisNRT:
         None
 
     Attributes:
-        modis_tile_size (float): MODIS sinusoidal tile size in meters.
         modis_download_token (str): Token for MODIS NRT download.
         modis_nrt_api_root_url (str): Root URL for MODIS NRT API.
         headers (dict): Headers for API requests.
         nrt_band_options (dict): Dictionary mapping MODIS band names to their index values.
 
     Methods:
-        calculate_modis_tile_index(x, y)
-            Calculate MODIS tile indices for given sinusoidal coordinates.
-
         get_modis_tile(geometry)
-            Calculate which MODIS tiles a given geometry falls into.
+            Calculate which MODIS tiles a given geometry intersects.
 
         get_modis_nrt_file_list(tiles, modis_nrt_params)
             Get a list of MODIS NRT files for the given tiles.
 
+        get_modis_nrt_listing(date)
+            Get the cached tile to granule URL listing of a day.
+
         process_hdf_file(hdf_file, subdataset_index, tif_list=None)
             Process an HDF file and convert it to a GeoTIFF.
     """
 
     population_source_options=population_source_options
     nrt_band_options = nrt_band_options
-    modis_proj = modis_proj
-    modis_tile_size = modis_tile_size
+    # Tile grid of the granules, 'sinusoidal' for the MODIS land grid or 'geographic' for 10 degree lat/lon tiles
+    tile_grid = 'sinusoidal'
     modis_nrt_api_root_url = modis_nrt_api_root_url
+    modis_nrt_details_url = modis_nrt_details_url
+    # Listings of days older than this many days are final and cached without expiry
+    recent_listing_days = 3
+    # Seconds after which the listing of a recent day is fetched again
+    listing_ttl = 15 * 60
+    # Seconds after which the date index is rebuilt from the whole archive, dropping days removed from the server
+    date_index_rebuild_interval = 30 * 24 * 60 * 60
+    # Number of granules downloaded at the same time
+    max_download_workers = 4
+    # Number of days of a date range warped at the same time, each in its own process. Every warp holds the mosaic of
+    # a day in memory, so the default stays low on machines with many cores
+    max_date_workers = min(4, os.cpu_count() or 1)
+    # Number of attempts of a granule download before giving up
+    download_retries = 3
+    download_chunk_size = 1024 ** 2
+    # 'raster' overlays the flood raster on a downloaded population raster, 'vector' sends the flood polygons to
+    # Earth Engine. Populations without a single count raster, e.g. age and sex structures, always use 'vector'.
+    population_overlay = 'raster'
     date_type_options = date_type_options
     population_source_variables= population_source_variables
     population_source_year_options=population_source_year_options
@@ -103,9 +129,26 @@ class ModisNRT:
         """
         self.modis_download_token = config_manager.config['KEYS']['MODIS_NRT']['token']  # Token for MODIS NRT download
         self.headers = {'Authorization': f'Bearer {self.modis_download_token}'}  # Token for MODIS NRT download
+        # Pooled connections shared by the concurrent granule downloads
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.max_download_workers))
+        # Sizes in bytes of the granules of the fetched listings, by URL
+        self.granule_sizes = {}
         self.ee_instance = ee_manager if ee_manager else EarthEngineManager()
         self.worldpop_instance = WorldPop()
         self.gpwv4_instance = GPWv4()
+        # Parsed daily listings, in memory for the session and on disk between sessions
+        self.listing_cache = LRUFileCache(os.path.join(DEFAULT_CACHE_ROOT, 'modis_nrt_listings'),
+                                          max_bytes=64 * 1024 ** 2)
+        self._listings = {}
+        # Known (year, day of year) entries of the archive, refreshed incrementally
+        self.date_index_path = os.path.join(DEFAULT_CACHE_ROOT, 'modis_nrt_dates.json')
+        # Population rasters by population source, year and area of interest bounds, on disk between sessions and
+        # read into memory once per session
+        self.population_cache = LRUFileCache(os.path.join(DEFAULT_CACHE_ROOT, 'population_rasters'),
+                                             max_bytes=2 * 1024 ** 3)
+        self._population_grids = {}
 
     # ==============================================================================
     # PRIMARY FUNCTIONS
@@ -119,17 +162,302 @@ class ModisNRT:
         :param modis_nrt_params: Dictionary containing modis nrt parameters.
         :type matching_files: List[str]
         :type modis_nrt_params: Dict[str, Any]
-        :return: Tuple containing lists of hdf files to process and tif files.
+        :return: Tuple containing lists of hdf files to process and tif files, in the order of `matching_files`.
         :rtype: Tuple[List[str], List[str]]
+
+        Each granule is converted to GeoTIFF as soon as its download completes, while the others are still
+        downloading.
+        """
+        subdataset_index = self.nrt_band_options[modis_nrt_params['nrt_band']]
+        tif_files = {}
+
+        def convert(url, hdf_file):
+            converted = []
+            self.process_hdf_file(hdf_file, subdataset_index, tif_list=converted)
+            tif_files[url] = converted[0]
+
+        hdf_files = self.download_granules(matching_files, modis_nrt_params['folder_output'], on_downloaded=convert)
+        return hdf_files, [tif_files[url] for url in matching_files if url in tif_files]
+
+    def download_granules(self, urls: List[str], folder_path: str, on_downloaded=None) -> List[str]:
+        """
+        Download granules concurrently.
+
+        :param urls: The URLs of the granules.
+        :param folder_path: The folder the granules are downloaded to.
+        :param on_downloaded: Optional function called with the URL and file path of every granule as soon as it is
+                              downloaded, in the calling thread.
+        :return: The list of downloaded HDF files, in the order of `urls`. Failed downloads are reported and left out.
+
+        The granules are downloaded by up to `max_download_workers` threads sharing one pooled session. Granules
+        already present in the folder with the size given by the listing are not downloaded again.
+        """
+        hdf_files = {}
+        with ThreadPoolExecutor(max_workers=self.max_download_workers) as executor:
+            futures = {executor.submit(self.download_granule, url, folder_path): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    hdf_files[url] = future.result()
+                except Exception as e:
+                    print(f"Failed to download {url.split('/')[-1]}: {e}")
+                    continue
+                if on_downloaded is not None:
+                    on_downloaded(url, hdf_files[url])
+        return [hdf_files[url] for url in urls if url in hdf_files]
+
+    def warp_granules(self, hdf_files: List[str], subdataset_index: int, output_path: str, geometry: Any = None,
+                      target_crs: Optional[str] = None) -> str:
+        """
+        Mosaic, clip and reproject the selected subdataset of several granules in one pass.
+
+        :param hdf_files: The HDF granules of a day.
+        :param subdataset_index: Index of the subdataset, see `nrt_band_options`.
+        :param output_path: The path of the output GeoTIFF.
+        :param geometry: Optional geometry to clip to, in any format accepted by `as_clip_geometry`. Pixels touching it
+                         are kept.
+        :param target_crs: Optional CRS of the output, e.g. 'EPSG:4326'. Defaults to the CRS of the granules.
+        :return: The path of the output GeoTIFF.
+
+        A VRT is built directly over the subdatasets, without converting them to GeoTIFF first, and a single
+        multithreaded gdal.Warp crops it to the cutline. The source pixels are read once, instead of once for the
+        conversion, once for the merge and once for the clip.
+
+        Example usage:
+            output = modis.warp_granules(hdf_files, 11, 'modis_nrt_merged_2024_100_clipped.tif', geometry=aoi)
+        """
+        clip_geometry = as_clip_geometry(geometry, self.ee_instance) if geometry is not None else None
+        return warp_modis_granules(hdf_files, subdataset_index, output_path, clip_geometry, target_crs)
+
+    def process_date_files(self, matching_files: List[str], geometry: Any, modis_nrt_params: Dict[str, Any]) -> str:
+        """
+        Download the granules of a day and produce its merged, clipped raster.
+
+        :param matching_files: The granule URLs of the day, from `get_modis_nrt_file_list`.
+        :param geometry: The geometry to clip to when modis_nrt_params['clip_to_geometry'] is True.
+        :param modis_nrt_params: Dictionary containing modis nrt parameters, with the 'date' of the granules.
+        :return: The path of 'modis_nrt_merged_<year>_<doy>_clipped.tif', or of 'modis_nrt_merged_<year>_<doy>.tif'
+                 when the raster is not clipped.
+        """
+        clip = modis_nrt_params.get('clip_to_geometry', True)
+        output_path = self.date_output_path(modis_nrt_params['date'], modis_nrt_params)
+
+        hdf_files = self.download_granules(matching_files, modis_nrt_params['folder_output'])
+        if not hdf_files:
+            raise ValueError(f"No MODIS NRT granules could be downloaded for {modis_nrt_params['date']}.")
+        self.warp_granules(hdf_files, self.nrt_band_options[modis_nrt_params['nrt_band']], output_path,
+                           geometry=geometry if clip else None)
+        self.cleanup_files([], hdf_files, modis_nrt_params)
+        return output_path
+
+    def process_date_range(self, tiles: List[Tuple[int, int]], geometry: Any, modis_nrt_params: Dict[str, Any],
+                           start_date: datetime.date, end_date: datetime.date) -> Dict[str, str]:
+        """
+        Produce the merged, clipped raster of every day of a date range in parallel.
+
+        :param tiles: The (h, v) tiles of the area of interest, from `get_modis_tile`.
+        :param geometry: The geometry to clip to when modis_nrt_params['clip_to_geometry'] is True.
+        :param modis_nrt_params: Dictionary containing modis nrt parameters.
+        :param start_date: The first day.
+        :param end_date: The last day, included.
+        :return: A dictionary mapping the 'YYYY-MM-DD' date of every processed day to its raster, in date order.
+
+        The listings of all days are fetched by a thread pool, and the granules of all days are downloaded by the
+        threads of `download_granules`. As soon as all granules of a day are downloaded, the day is warped in a
+        process pool of up to `max_date_workers` processes while the other downloads continue. Outputs are named after
+        their date, see `date_output_path`, so the result does not depend on the order in which days complete.
+
+        Example usage:
+            rasters = modis.process_date_range(tiles, aoi, params, datetime.date(2024, 1, 1), datetime.date(2024, 3, 31))
+            modis.write_population_impacted(rasters, aoi, params)
+        """
+        dates = [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        clip = modis_nrt_params.get('clip_to_geometry', True)
+        clip_geometry = as_clip_geometry(geometry, self.ee_instance) if clip else None
+        subdataset_index = self.nrt_band_options[modis_nrt_params['nrt_band']]
+
+        with ThreadPoolExecutor(max_workers=self.max_download_workers) as executor:
+            file_lists = executor.map(lambda date: self.get_modis_nrt_file_list(tiles, {'date': date}), dates)
+            urls_by_date = {date: urls for date, urls in zip(dates, file_lists)}
+
+        date_of_url = {url: date for date, urls in urls_by_date.items() for url in urls}
+        pending = {date: set(urls) for date, urls in urls_by_date.items() if urls}
+        downloaded = {date: {} for date in pending}
+        for date in dates:
+            if date not in pending:
+                print(f'No matching files found for {date}. Please try again later after new imagery available.')
+
+        workers = max(1, min(self.max_date_workers, len(pending)))
+        # Share the cores between the processes instead of letting every warp use all of them
+        warp_threads = max(1, (os.cpu_count() or 1) // workers)
+        futures = {}
+
+        # Processes are spawned rather than forked, since the download threads are running when the first day is
+        # submitted and a forked child would inherit their locks
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            def submit(date):
+                hdf_files = [downloaded[date][url] for url in urls_by_date[date] if url in downloaded[date]]
+                output_path = self.date_output_path(date, modis_nrt_params)
+                future = executor.submit(warp_modis_granules, hdf_files, subdataset_index, output_path,
+                                         clip_geometry, None, warp_threads)
+                futures[future] = (date, hdf_files)
+
+            def on_downloaded(url, hdf_file):
+                date = date_of_url[url]
+                downloaded[date][url] = hdf_file
+                pending[date].discard(url)
+                if not pending[date]:
+                    submit(date)
+
+            self.download_granules(list(date_of_url), modis_nrt_params['folder_output'], on_downloaded=on_downloaded)
+            # Days with failed downloads are warped from the granules that could be downloaded
+            for date, urls in pending.items():
+                if urls and downloaded[date]:
+                    submit(date)
+
+            outputs = {}
+            for future in as_completed(futures):
+                date, hdf_files = futures[future]
+                try:
+                    outputs[date.strftime('%Y-%m-%d')] = future.result()
+                except Exception as e:
+                    print(f"Failed to process {date}: {e}")
+                self.cleanup_files([], hdf_files, modis_nrt_params)
+
+        return dict(sorted(outputs.items()))
+
+    def update_datacube(self, outputs: Dict[str, str], cube_directory: str,
+                        statistics_folder: Optional[str] = None) -> FloodDatacube:
+        """
+        Append the rasters of a date range to a flood datacube and optionally write its flood statistics.
+
+        :param outputs: A dictionary mapping 'YYYY-MM-DD' dates to their clipped rasters, e.g. from
+                        `process_date_range`.
+        :param cube_directory: The directory of the datacube. An existing datacube is extended.
+        :param statistics_folder: Optional folder the flood duration, first and last flood day and frequency GeoTIFFs
+                                  are written to.
+        :return: The FloodDatacube.
+        """
+        cube = FloodDatacube(cube_directory)
+        for date, output_path in sorted(outputs.items()):
+            try:
+                cube.append(output_path, datetime.date.fromisoformat(date))
+            except ValueError as e:
+                print(f"Could not add {date} to the datacube: {e}")
+        if statistics_folder is not None and cube.dates:
+            cube.write_statistics(statistics_folder)
+        return cube
+
+    def write_population_impacted(self, outputs: Dict[str, str], geometry: Any,
+                                  modis_nrt_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Calculate the population impacted of every day and write them to 'population_impacted.json'.
+
+        :param outputs: A dictionary mapping 'YYYY-MM-DD' dates to their clipped rasters.
+        :param geometry: The area of interest.
+        :param modis_nrt_params: Dictionary containing modis nrt parameters, with the population options, and optionally
+                                 'admin_units' and 'admin_labels' to also write the population impacted in every admin
+                                 unit next to each raster.
+        :return: The dictionary mapping every date to its population impacted, in date order.
+
+        The population raster is fetched once and every date is a local overlay, see
+        `calculate_population_in_flood_area`.
+        """
+        population = {}
+        for date, output_path in sorted(outputs.items()):
+            try:
+                population[date] = self.calculate_population_in_flood_area(
+                    output_path, modis_nrt_params['population_year'], modis_nrt_params['population_data_type'],
+                    modis_nrt_params['population_type'], modis_nrt_params.get('folder_path',
+                                                                              modis_nrt_params['folder_output']),
+                    aoi=geometry, admin_units=modis_nrt_params.get('admin_units'),
+                    admin_labels=modis_nrt_params.get('admin_labels'))
+            except Exception as e:
+                print(f"Failed to calculate the population impacted on {date}: {e}")
+
+        file_path = os.path.join(modis_nrt_params['folder_output'], 'population_impacted.json')
+        temporary_path = f"{file_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(population, f)
+        os.replace(temporary_path, file_path)
+        return population
+
+    def download_granule(self, url: str, folder_path: str) -> str:
+        """
+        Download a granule, resuming an interrupted download and skipping a complete one.
+
+        :param url: The URL of the granule.
+        :param folder_path: The folder the granule is downloaded to.
+        :return: The path of the downloaded HDF file.
+
+        The file is downloaded to a '.part' file that is renamed once complete. When a '.part' file is left by an
+        earlier attempt, the download resumes from its end with a Range request. Failed attempts are retried up to
+        `download_retries` times with an increasing delay.
         """
-        hdf_files_to_process = []
-        tif_list = []
-        for url in matching_files:
-            self.download_and_process_modis_nrt(url, modis_nrt_params['folder_output'], hdf_files_to_process, subdataset=modis_nrt_params['nrt_band'], tif_list=tif_list)
-        return hdf_files_to_process, tif_list
+        file_path = os.path.join(folder_path, url.split('/')[-1])
+        expected_size = self.granule_sizes.get(url)
+        if os.path.exists(file_path) and (expected_size is None or os.path.getsize(file_path) == expected_size):
+            return file_path
+
+        temporary_path = f"{file_path}.part"
+        for attempt in range(1, self.download_retries + 1):
+            try:
+                offset = os.path.getsize(temporary_path) if os.path.exists(temporary_path) else 0
+                headers = {'Range': f'bytes={offset}-'} if offset else {}
+                with self.session.get(url, headers=headers, stream=True, timeout=60) as response:
+                    if response.status_code == 416:
+                        # The part file is already complete
+                        break
+                    response.raise_for_status()
+                    mode = 'ab' if response.status_code == 206 else 'wb'
+                    with open(temporary_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                            f.write(chunk)
+                if expected_size is not None and os.path.getsize(temporary_path) != expected_size:
+                    raise IOError(f"Expected {expected_size} bytes, got {os.path.getsize(temporary_path)}.")
+                break
+            except (requests.RequestException, IOError) as e:
+                if expected_size is not None and os.path.exists(temporary_path) and \
+                        os.path.getsize(temporary_path) > expected_size:
+                    os.remove(temporary_path)
+                if attempt == self.download_retries:
+                    raise
+                print(f"Retrying {url.split('/')[-1]} after error: {e}")
+                time.sleep(2 ** attempt)
+
+        os.replace(temporary_path, file_path)
+        return file_path
 
     def calculate_population_in_flood_area(self, raster_path: str, year: int, population_data_type: str,
-                                           population_data_source: str, folder_output: str) -> str:
+                                           population_data_source: str, folder_output: str, aoi: Any = None,
+                                           admin_units: Any = None, admin_labels: List[str] = None) -> str:
+        """
+        Calculate the population living in the flooded pixels of a clipped MODIS NRT raster.
+
+        :param raster_path: Path to the clipped MODIS NRT raster.
+        :param year: The population year.
+        :param population_data_type: The population source, 'WorldPop' or 'GPWv4'.
+        :param population_data_source: The population variable or GPWv4 layer.
+        :param folder_output: The folder where outputs are written.
+        :param aoi: Optional area of interest as a Shapely geometry or GeoJSON. Flood polygons outside it are dropped.
+        :param admin_units: Optional geometries or GeoDataFrame of admin units. With the raster overlay, the population
+                            impacted in every unit is written next to the raster as JSON.
+        :param admin_labels: One label per admin unit.
+        :return: The population impacted.
+
+        With the raster overlay, the population raster of the area of interest is downloaded once and read once per
+        session, so every further date only costs a local masked sum, see `get_population_grid`.
+        """
+        if self.population_overlay == 'raster':
+            population_grid = self.get_population_grid(raster_path, year, population_data_type,
+                                                       population_data_source, folder_output, aoi=aoi)
+            if population_grid:
+                result = flood_population_overlay(raster_path, population_grid, geometries=admin_units,
+                                                  labels=admin_labels, ee_instance=self.ee_instance)
+                if 'by_unit' in result:
+                    with open(raster_path.replace('.tif', '_population_by_unit.json'), 'w') as f:
+                        json.dump(result['by_unit'], f)
+                return round(result['population_impacted'])
 
         with rasterio.open(raster_path) as src:
             band = src.read(1)  # Read the first band
@@ -162,9 +490,15 @@ class ModisNRT:
 
         gdf.to_file(output_path, driver='GeoJSON')
 
-        ee_geometries = gdf['geometry'].apply(self.shapely_to_ee)
+        # Send a single prepared MultiPolygon instead of one serialized geometry per flood polygon
+        pixel_scale = abs(src.res[0]) * METERS_PER_DEGREE if src.crs.is_geographic else abs(src.res[0])
+        region = None if isinstance(aoi, ee.ComputedObject) else aoi
+        flood_geometry = prepare_geometry(shapely.MultiPolygon(list(gdf.to_crs('EPSG:4326').geometry)),
+                                          scale=pixel_scale, region=region)
+        if flood_geometry.is_empty:
+            return 'No flood area detected'
 
-        multi_geom = ee.Geometry.MultiPolygon(list(ee_geometries))
+        multi_geom = ee.Geometry(as_geojson(flood_geometry))
 
         if population_data_type == 'WorldPop':
 
@@ -229,46 +563,134 @@ class ModisNRT:
 
             return round(self.ee_instance.get_image_sum(img=image, geometry=multi_geom, band=band, scale=927.67))
 
+    def get_population_raster(self, raster_path: str, year: int, population_data_type: str,
+                              population_data_source: str, folder_output: str, aoi: Any = None) -> Optional[str]:
+        """
+        Download the population count raster covering a MODIS NRT raster, or reuse the cached one.
+
+        :param raster_path: Path to the clipped MODIS NRT raster.
+        :param year: The population year.
+        :param population_data_type: The population source, 'WorldPop' or 'GPWv4'.
+        :param population_data_source: The population variable or GPWv4 layer.
+        :param folder_output: The folder where the population raster is written.
+        :param aoi: Optional area of interest. Its bounds are downloaded instead of the bounds of the raster.
+        :return: The path of the cached population raster, or None if the population has no single count raster or
+                 could not be downloaded completely.
+
+        Rasters are cached in `population_cache` by population source, year and bounds, so later runs over the same
+        area do not download them again. A download with a missing piece is neither mosaicked nor cached.
+        """
+        if population_data_type == 'WorldPop':
+            if population_data_source != 'Residential Population':
+                return None
+            image_collection, band, aggregation_method = 'WorldPop/GP/100m/pop', 'population', 'max'
+        else:
+            image_collection = population_data_source
+            band = 'population_count' if population_data_source == 'CIESIN/GPWv411/GPW_Population_Count' else 'unwpp-adjusted_population_count'
+            aggregation_method = 'first'
+
+        if aoi is not None:
+            bounds = as_clip_geometry(aoi, self.ee_instance).bounds
+        else:
+            with rasterio.open(raster_path) as src:
+                bounds = transform_bounds(src.crs, 'EPSG:4326', *src.bounds)
+
+        bounds = [round(value, 6) for value in bounds]
+        key = hash_key('population', population_data_type, population_data_source, year, bounds)
+        cached_path = self.population_cache.get_file(key)
+        if cached_path:
+            return cached_path
+
+        image, region, scale = self.ee_instance.get_image(multi_date=True, start_date=f'{year}-01-01',
+                                                          end_date=f'{year}-12-31', image_collection=image_collection,
+                                                          band=band, geometry=ee.Geometry.Rectangle(list(bounds)),
+                                                          aggregation_method=aggregation_method)
+        os.makedirs(folder_output, exist_ok=True)
+        file_names, download_successful = self.ee_instance.download_and_split(
+            image, region, scale, params={'year': year, 'folder_output': folder_output}, band=band, allow_partial=False)
+        if not file_names:
+            return None
+
+        if download_successful:
+            population_path = file_names[0]
+        else:
+            population_path = os.path.join(folder_output, f"mosaic_{band}_{year}.tif")
+            mosaic_images(file_names, population_path)
+
+        return self.population_cache.put_file(key, population_path, metadata={
+            'source': population_data_type, 'variable': population_data_source, 'year': year, 'bounds': bounds})
+
+    def get_population_grid(self, raster_path: str, year: int, population_data_type: str,
+                            population_data_source: str, folder_output: str, aoi: Any = None) -> Optional[tuple]:
+        """
+        Get the population counts covering a MODIS NRT raster, read once per session.
+
+        :param raster_path: Path to the clipped MODIS NRT raster.
+        :param year: The population year.
+        :param population_data_type: The population source, 'WorldPop' or 'GPWv4'.
+        :param population_data_source: The population variable or GPWv4 layer.
+        :param folder_output: The folder where a downloaded population raster is written.
+        :param aoi: Optional area of interest, see `get_population_raster`.
+        :return: The tuple returned by `read_population`, or None if the population has no single count raster.
+        """
+        population_path = self.get_population_raster(raster_path, year, population_data_type,
+                                                     population_data_source, folder_output, aoi=aoi)
+        if population_path is None:
+            return None
+        if population_path not in self._population_grids:
+            self._population_grids[population_path] = read_population(population_path)
+        return self._population_grids[population_path]
+
     # ==============================================================================
     # HELPER FUNCTIONS
     # ==============================================================================
 
-    def calculate_modis_tile_index(self, x: float, y: float) -> tuple[int, int]:
+    def date_output_path(self, date: datetime.date, modis_nrt_params: Dict[str, Any]) -> str:
         """
-        Calculate the MODIS tile index for the given coordinates.
-
-        :param x: The X-coordinate of the location.
-        :param y: The Y-coordinate of the location.
-        :return: A tuple containing the horizontal and vertical indices of the MODIS tile.
+        :param date: The day of the raster.
+        :param modis_nrt_params: Dictionary containing modis nrt parameters.
+        :return: The path of 'modis_nrt_merged_<year>_<doy>_clipped.tif' in the output folder, without '_clipped' when
+                 modis_nrt_params['clip_to_geometry'] is False.
+        """
+        clip = modis_nrt_params.get('clip_to_geometry', True)
+        return os.path.join(modis_nrt_params['folder_output'],
+                            f"modis_nrt_merged_{date.year}_{date.timetuple().tm_yday:03d}"
+                            f"{'_clipped' if clip else ''}.tif")
 
+    def get_modis_tile(self, geometry: Union[BaseGeometry, list, pd.DataFrame]) -> Set[tuple[int, int]]:
         """
-        h = int((x + 20015109.354) // self.modis_tile_size)
-        v = int((10007554.677 - y) // self.modis_tile_size)  # Adjust for Northern Hemisphere
-        return h, v
+        Find the MODIS tiles covered by a geometry.
 
-    def get_modis_tile(self, geometry: Union[Point, list, pd.DataFrame]) -> Set[tuple[int, int]]:
-        transformer = Transformer.from_crs("epsg:4326", self.modis_proj, always_xy=True)
-        tiles_covered = set()
+        :param geometry: A Shapely geometry in EPSG:4326, a bounding box list [minx, miny, maxx, maxy], or a DataFrame
+                         with bbox columns.
+        :return: The set of (h, v) tiles of `tile_grid` intersecting the geometry.
 
-        if isinstance(geometry, Point):
-            x, y = transformer.transform(geometry.x, geometry.y)
-            tiles_covered.add(self.calculate_modis_tile_index(x, y))
+        The geometry is intersected with the precomputed tile polygons of `modis_tiles`, so every tile inside a large
+        area is found and tiles that only overlap the bounding box of a geometry are left out.
+        """
+        if isinstance(geometry, BaseGeometry):
+            area = geometry
         elif isinstance(geometry, list) and len(geometry) == 4:
-            for corner in [(geometry[0], geometry[1]), (geometry[0], geometry[3]),
-                           (geometry[2], geometry[1]), (geometry[2], geometry[3])]:
-                x, y = transformer.transform(corner[0], corner[1])
-                tiles_covered.add(self.calculate_modis_tile_index(x, y))
+            area = shapely.geometry.box(*geometry)
         elif isinstance(geometry, pd.DataFrame):
             bbox = geometry.iloc[0]  # Assuming you want to process the first row
-            for corner in [(bbox['minx'], bbox['miny']), (bbox['minx'], bbox['maxy']),
-                           (bbox['maxx'], bbox['miny']), (bbox['maxx'], bbox['maxy'])]:
-                x, y = transformer.transform(corner[0], corner[1])
-                tiles_covered.add(self.calculate_modis_tile_index(x, y))
+            area = shapely.geometry.box(bbox['minx'], bbox['miny'], bbox['maxx'], bbox['maxy'])
         else:
             raise TypeError(
-                "Input must be a Shapely Point, a bounding box list [minx, miny, maxx, maxy], or a DataFrame with bbox columns.")
+                "Input must be a Shapely geometry, a bounding box list [minx, miny, maxx, maxy], or a DataFrame with bbox columns.")
 
-        return tiles_covered
+        return set(tiles_for_geometry(area, grid=self.tile_grid))
+
+    def get_area_of_interest(self, geometry: Any, bbox: Any) -> Union[BaseGeometry, Any]:
+        """
+        :param geometry: The geometry of the run, in any format accepted by `as_clip_geometry`.
+        :param bbox: The bounding box of the geometry, used when the geometry cannot be converted.
+        :return: The Shapely geometry used to find the tiles of the run, or the bounding box.
+        """
+        try:
+            return as_clip_geometry(geometry, self.ee_instance)
+        except Exception:
+            return bbox
 
     def get_modis_nrt_file_list(self, tiles: List[Tuple[int, int]], modis_nrt_params: Dict[str, datetime.datetime]) -> \
     List[str]:
@@ -277,36 +699,67 @@ class ModisNRT:
         :param modis_nrt_params: Dictionary containing the necessary parameters for Modis NRT (date)
         :return: List of matching file URLs
 
-        This method takes in a list of tiles and Modis NRT parameters and returns a list of file URLs that match the specified criteria. It loops through each tile, constructs the base URL folder
-        *, and generates a file pattern based on the year, day of year, and tile coordinates. It then sends a request to the base URL folder and parses the HTML content using BeautifulSoup.
-        * It finds all the links in the HTML content and checks if they match the file pattern. If a link matches the pattern, it is added to the list of matching files. Finally, the method
-        * prints a message and returns the list of matching file URLs.
+        The listing of the day is fetched once with `get_modis_nrt_listing` and every tile is a dictionary lookup in it,
+        so an AOI covering several tiles costs a single listing request, or none when the listing is cached.
         """
+        listing = self.get_modis_nrt_listing(modis_nrt_params['date'])
+        return [listing[(tile[0], tile[1])] for tile in tiles if (tile[0], tile[1]) in listing]
 
-        matching_files = []
-        for tile in tiles:
-            h = f"{tile[0]:02d}"
-            v = f"{tile[1]:02d}"
-            year = modis_nrt_params['date'].year
-            doy = f"{modis_nrt_params['date'].timetuple().tm_yday:03d}"
-            base_url_folder = f"{self.modis_nrt_api_root_url}/{year}/{doy}/"
-            file_pattern = rf"MCDWD_L3_NRT\.A{year}{doy}\.h{h}v{v}\.061\.\d+\.hdf"
-
-            response = requests.get(base_url_folder)
-            html_content = response.text
-
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-            links = soup.find_all('a')
-
-            # Check if the request was successful
-            for link in links:
-                href = link.get('href')
-                if re.search(file_pattern, href):
-                    matching_files.append(href)
+    def get_modis_nrt_listing(self, date: datetime.date) -> Dict[Tuple[int, int], str]:
+        """
+        Get the granules published for a day.
 
+        :param date: The day of the granules.
+        :return: A dictionary mapping (h, v) tiles to the URL of their granule. When a tile was reprocessed, the
+                 granule with the latest production time is kept.
 
-        return matching_files
+        The listing is read from the JSON details API of the archive and cached by (year, day of year), in memory and
+        on disk. Listings of the last `recent_listing_days` days are still being filled and are fetched again after
+        `listing_ttl` seconds. A listing fetched once its day is older is final and never fetched again, unless it is
+        empty, e.g. because the folder of the day did not exist yet.
+        """
+        year = date.year
+        doy = f"{date.timetuple().tm_yday:03d}"
+        key = hash_key('MCDWD_L3_NRT', year, doy)
+        recent = (datetime.date.today() - datetime.date(date.year, date.month, date.day)).days <= self.recent_listing_days
+
+        fetched, listing, final = self._listings.get(key, (None, None, False))
+        if listing is None or (not final and time.time() - fetched > self.listing_ttl):
+            metadata = self.listing_cache.get_metadata(key) or {}
+            cached = self.listing_cache.get_json(key, max_age=None if metadata.get('final') else self.listing_ttl)
+            final = cached is not None and metadata.get('final', False)
+            if cached is None:
+                cached = self._fetch_modis_nrt_listing(year, doy)
+                final = not recent and bool(cached)
+                self.listing_cache.put_json(key, cached, metadata={'year': year, 'doy': doy, 'final': final})
+            listing = {(int(tile[1:3]), int(tile[4:6])): url for tile, (url, size) in cached.items()}
+            self.granule_sizes.update({url: size for url, size in cached.values() if size})
+            self._listings[key] = (time.time(), listing, final)
+        return listing
+
+    def _fetch_modis_nrt_listing(self, year: int, doy: str) -> Dict[str, str]:
+        """
+        :param year: The year of the listing.
+        :param doy: The zero-padded day of year of the listing.
+        :return: A dictionary mapping 'hHHvVV' tile names to the [URL, size in bytes] of their granule, empty if the
+                 day has no granules yet.
+        """
+        response = self.session.get(f"{self.modis_nrt_details_url}/{year}/{doy}?fields=all&formats=json", timeout=60)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+
+        granules = {}
+        for entry in response.json().get('content', []):
+            match = modis_nrt_file_pattern.fullmatch(entry.get('name', ''))
+            if not match:
+                continue
+            tile = f"h{match.group(3)}v{match.group(4)}"
+            production = match.group(5)
+            if tile not in granules or production > granules[tile][0]:
+                url = entry.get('downloadsLink') or f"{self.modis_nrt_api_root_url}/{year}/{doy}/{entry['name']}"
+                granules[tile] = (production, [url, int(entry['size']) if entry.get('size') else None])
+        return {tile: granule for tile, (production, granule) in granules.items()}
 
     def process_hdf_file(self, hdf_file: str, subdataset_index: int, tif_list: Optional[List[str]] = None) -> None:
         """
@@ -353,49 +806,67 @@ class ModisNRT:
 
     def download_and_process_modis_nrt(self, url: str, folder_path: str, hdf_files_to_process: List[str],
                                        subdataset: str, tif_list: Optional[List[str]] = None) -> None:
-        response = requests.get(url, headers=self.headers, stream=True)
-        downloaded_files = []
-        if response.status_code == 200:
-            # Ensure the folder_path ends with a slash
-            if not folder_path.endswith('/'):
-                folder_path += '/'
-            filename = f"{folder_path}{url.split('/')[-1]}"  # Corrected the path
-
-            with open(filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            downloaded_files.append(filename)
-            subdataset_index = self.nrt_band_options[subdataset]
-
-
-            for hdf_file in downloaded_files:
-                self.process_hdf_file(hdf_file, subdataset_index, tif_list=tif_list)
-
-    def get_modis_nrt_dates(self) -> List[datetime.datetime]:
-        years = []
-        response = requests.get(f'{self.modis_nrt_api_root_url}?fields=all')
-        if response.status_code == 200:
-            html_content = response.text
-            soup = BeautifulSoup(html_content, 'html.parser')
-            for a in soup.find_all('a'):
-                year_text = a.text  # Extract the text, which is the year
-                if year_text.isdigit():  # Ensure that the extracted text is a year
-                    years.append(year_text)
-
-        dates = []
+        try:
+            filename = self.download_granule(url, folder_path)
+        except requests.RequestException as e:
+            print(f"Failed to download {url.split('/')[-1]}: {e}")
+            return
+
+        hdf_files_to_process.append(filename)
+        subdataset_index = self.nrt_band_options[subdataset]
+        self.process_hdf_file(filename, subdataset_index, tif_list=tif_list)
+
+    def get_modis_nrt_dates(self, refresh: bool = False) -> List[datetime.datetime]:
+        """
+        Get the dates with MODIS NRT granules from the persisted date index.
+
+        :param refresh: If True, the current year is fetched again even if the index is fresh.
+        :return: The sorted list of dates.
+
+        The index stores the known days of year of every year in `date_index_path`. It is built from the JSON details
+        API, and rebuilt from the whole archive every `date_index_rebuild_interval` seconds, so years and days the
+        server no longer keeps are dropped. In between only the current year, and the previous one during the first
+        days of January, is fetched again, and only when the index is older than `listing_ttl` seconds, so the dates are
+        normally read from local state without any request.
+        """
+        index = self._load_date_index()
+        today = datetime.date.today()
+
+        if not index['years'] or time.time() - index.get('rebuilt', 0) > self.date_index_rebuild_interval:
+            years = self._fetch_modis_nrt_directory(self.modis_nrt_details_url)
+            index['years'] = {}
+            index['rebuilt'] = time.time()
+        elif refresh or time.time() - index['updated'] > self.listing_ttl:
+            years = {str(today.year), str((today - datetime.timedelta(days=self.recent_listing_days)).year)}
+        else:
+            years = []
+
         for year in years:
-            date_response = requests.get(f'{self.modis_nrt_api_root_url}/{year}?fields=all')
-            if date_response.status_code == 200:
-                html_content = date_response.text
-                soup = BeautifulSoup(html_content, 'html.parser')
-                for a in soup.find_all('a'):
-                    date_text = a.text  # Extract the text, which should be the day of the year
-                    if date_text.isdigit():  # Ensure that the extracted text is a day of the year
-                        date_string = f'{year}{date_text}'
-                        dates.append(self.convert_to_date(date_string))
-
-        return dates
+            days = self._fetch_modis_nrt_directory(f"{self.modis_nrt_details_url}/{year}")
+            if days:
+                index['years'][year] = days
+        if years:
+            index['updated'] = time.time()
+            self._save_date_index(index)
+
+        return sorted(self.convert_to_date(f"{year}{doy}") for year, days in index['years'].items() for doy in days)
+
+    def _fetch_modis_nrt_directory(self, url: str) -> List[str]:
+        """
+        :param url: The URL of a folder of the JSON details API.
+        :return: The sorted names of its numeric entries, e.g. years or days of year. Empty if it does not exist.
+        """
+        response = requests.get(f"{url}?fields=all&formats=json")
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return sorted(entry['name'] for entry in response.json().get('content', []) if entry['name'].isdigit())
+
+    def _load_date_index(self) -> Dict[str, Any]:
+        return read_json(self.date_index_path, {'years': {}, 'updated': 0})
+
+    def _save_date_index(self, index: Dict[str, Any]) -> None:
+        write_json(self.date_index_path, index)
 
     def convert_to_date(self, date_string: str) -> datetime.datetime:
         """
@@ -503,6 +974,227 @@ class ModisNRT:
         return merged_output
 
 
+def warp_modis_granules(hdf_files: List[str], subdataset_index: int, output_path: str,
+                        clip_geometry: Optional[BaseGeometry] = None, target_crs: Optional[str] = None,
+                        num_threads: Union[int, str] = 'ALL_CPUS') -> str:
+    """
+    Mosaic, clip and reproject the selected subdataset of several granules in one pass.
+
+    This is the implementation of `ModisNRT.warp_granules`. It only takes picklable arguments and needs no ModisNRT
+    instance, so it can run in a process pool.
+
+    :param hdf_files: The HDF granules of a day.
+    :param subdataset_index: Index of the subdataset, see `ModisNRT.nrt_band_options`.
+    :param output_path: The path of the output GeoTIFF.
+    :param clip_geometry: Optional Shapely geometry in EPSG:4326 to clip to. Pixels touching it are kept.
+    :param target_crs: Optional CRS of the output. Defaults to the CRS of the granules.
+    :param num_threads: The number of threads of the warp.
+    :return: The path of the output GeoTIFF.
+    """
+    subdatasets = [gdal.Open(hdf_file, gdal.GA_ReadOnly).GetSubDatasets()[subdataset_index][0]
+                   for hdf_file in hdf_files]
+    vrt_path = f"/vsimem/{os.path.basename(output_path)}.vrt"
+    mosaic = gdal.BuildVRT(vrt_path, subdatasets)
+    nodata = mosaic.GetRasterBand(1).GetNoDataValue()
+
+    warp_options = {
+        'format': 'GTiff',
+        'dstSRS': target_crs,
+        'dstNodata': nodata if nodata is not None else 255,  # 255 is the fill value of the flood product
+        'multithread': True,
+        'warpOptions': [f'NUM_THREADS={num_threads}'],
+        'creationOptions': ['COMPRESS=DEFLATE', 'TILED=YES'],
+    }
+
+    cutline_path = None
+    if clip_geometry is not None:
+        cutline_path = f"/vsimem/{os.path.basename(output_path)}.geojson"
+        gdal.FileFromMemBuffer(cutline_path, json.dumps({
+            'type': 'FeatureCollection',
+            'features': [{'type': 'Feature', 'properties': {},
+                          'geometry': shapely.geometry.mapping(clip_geometry)}]
+        }))
+        warp_options.update({
+            'cutlineDSName': cutline_path,
+            'cropToCutline': True,
+            'warpOptions': warp_options['warpOptions'] + ['CUTLINE_ALL_TOUCHED=TRUE'],
+        })
+
+    try:
+        gdal.Warp(output_path, mosaic, **warp_options)
+    finally:
+        mosaic = None
+        gdal.Unlink(vrt_path)
+        if cutline_path is not None:
+            gdal.Unlink(cutline_path)
+    return output_path
+
+
+class ModisNRTWatcher:
+    """
+    Long-running watcher processing the MODIS NRT granules of several areas of interest as they are published.
+
+    Every poll reads the listings of today and of the last `lookback_days` days, which costs one small listing request
+    per day once the listings cached by `ModisNRT.get_modis_nrt_listing` are stale. A day of an area is processed again
+    only when the granules of its tiles differ from the ones recorded in the state file, i.e. when a granule of a new
+    tile was published or a granule was reprocessed with a new production time. Its raster is replaced, and its
+    population impacted and datacube slice are updated in place.
+
+    The outputs of an area are written to a sub-folder named after it in modis_nrt_params['folder_output'], like in
+    `ModisNRT.process_date_range`. With modis_nrt_params['keep_individual_tiles'] set to True, unchanged granules are
+    not downloaded again when a day is processed again. When admin units are given for an area, the population impacted
+    in every unit is written next to each raster of the area.
+
+    Example usage:
+        watcher = ModisNRTWatcher(ModisNRT(), {'kenya': kenya_geojson}, params)
+        watcher.run()
+    """
+
+    def __init__(self, modis_nrt: ModisNRT, areas: Dict[str, Any], modis_nrt_params: Dict[str, Any],
+                 state_path: Optional[str] = None, poll_interval: Optional[float] = None, lookback_days: int = 1,
+                 admin_units: Optional[Dict[str, Any]] = None, admin_labels: Optional[Dict[str, List[str]]] = None):
+        """
+        Initialize the watcher and load its state.
+
+        :param modis_nrt: The ModisNRT instance used to list, download and process the granules.
+        :param areas: A dictionary mapping the name of every area of interest to its geometry.
+        :param modis_nrt_params: Dictionary containing modis nrt parameters, as for `ModisNRT.process_date_files`, with
+                                 the population options when 'calculate_population' is True, and 'build_datacube'.
+        :param state_path: The JSON file recording the processed granules. Defaults to
+                           'modis_nrt_watcher_state.json' in the output folder.
+        :param poll_interval: Seconds between two polls. Defaults to `ModisNRT.listing_ttl`.
+        :param lookback_days: Number of days before today whose granules are still checked for updates.
+        :param admin_units: Optional dictionary mapping the name of an area to the geometries or GeoDataFrame of its
+                            admin units.
+        :param admin_labels: Optional dictionary mapping the name of an area to one label per admin unit.
+        """
+        self.modis_nrt = modis_nrt
+        self.areas = areas
+        self.modis_nrt_params = dict(modis_nrt_params)
+        self.state_path = state_path or os.path.join(self.modis_nrt_params['folder_output'],
+                                                     'modis_nrt_watcher_state.json')
+        self.poll_interval = poll_interval if poll_interval is not None else modis_nrt.listing_ttl
+        self.lookback_days = lookback_days
+        self.admin_units = admin_units or {}
+        self.admin_labels = admin_labels or {}
+        self.tiles = {name: sorted(modis_nrt.get_modis_tile(modis_nrt.get_area_of_interest(geometry, None)))
+                      for name, geometry in areas.items()}
+        self.state = self._load_state()
+
+    # ==============================================================================
+    # PRIMARY FUNCTIONS
+    # ==============================================================================
+
+    def run(self, max_polls: Optional[int] = None) -> None:
+        """
+        Poll for new granules until interrupted.
+
+        :param max_polls: Optional number of polls after which the watcher stops.
+        :return: None
+        """
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                self.poll()
+                polls += 1
+                if max_polls is None or polls < max_polls:
+                    time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print('Stopped watching MODIS NRT granules.')
+
+    def poll(self) -> Dict[str, List[str]]:
+        """
+        Process the days whose granules are new or updated since the last poll.
+
+        :return: A dictionary mapping the name of every area to the 'YYYY-MM-DD' dates processed during the poll.
+        """
+        today = datetime.date.today()
+        processed = {name: [] for name in self.areas}
+
+        for offset in range(self.lookback_days, -1, -1):
+            date = today - datetime.timedelta(days=offset)
+            try:
+                listing = self.modis_nrt.get_modis_nrt_listing(date)
+            except Exception as e:
+                print(f"Could not list the MODIS NRT granules of {date}: {e}")
+                continue
+
+            for name in self.areas:
+                urls = [listing[tile] for tile in self.tiles[name] if tile in listing]
+                if not urls or urls == self.state.get(name, {}).get(date.isoformat()):
+                    continue
+                try:
+                    self.process_day(name, date, urls)
+                except Exception as e:
+                    print(f"Failed to process {name} on {date}: {e}")
+                    continue
+                self.state.setdefault(name, {})[date.isoformat()] = urls
+                self._save_state()
+                processed[name].append(date.isoformat())
+
+        return processed
+
+    def process_day(self, name: str, date: datetime.date, urls: List[str]) -> str:
+        """
+        Process the granules of a day of an area and update its outputs.
+
+        :param name: The name of the area.
+        :param date: The day of the granules.
+        :param urls: The granule URLs of the tiles of the area.
+        :return: The path of the raster of the day.
+        """
+        folder_output = os.path.join(self.modis_nrt_params['folder_output'], name)
+        os.makedirs(folder_output, exist_ok=True)
+        params = dict(self.modis_nrt_params, date=date, folder_output=folder_output)
+
+        output_path = self.modis_nrt.process_date_files(urls, self.areas[name], params)
+
+        if params.get('calculate_population'):
+            population = self.modis_nrt.calculate_population_in_flood_area(
+                output_path, params['population_year'], params['population_data_type'], params['population_type'],
+                folder_output, aoi=self.areas[name], admin_units=self.admin_units.get(name),
+                admin_labels=self.admin_labels.get(name))
+            self._update_population_impacted(folder_output, date, population)
+
+        if params.get('build_datacube'):
+            self.modis_nrt.update_datacube({date.isoformat(): output_path},
+                                           os.path.join(folder_output, 'flood_datacube'))
+        return output_path
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    @staticmethod
+    def _update_population_impacted(folder_output, date, population):
+        file_path = os.path.join(folder_output, 'population_impacted.json')
+        try:
+            with open(file_path, 'r') as f:
+                population_impacted = json.load(f)
+        except (OSError, ValueError):
+            population_impacted = {}
+        population_impacted[date.isoformat()] = population
+
+        temporary_path = f"{file_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(dict(sorted(population_impacted.items())), f)
+        os.replace(temporary_path, file_path)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        temporary_path = f"{self.state_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temporary_path, self.state_path)
+
+
 class ModisNRTNotebookInterface(ModisNRT):
 
     def __init__(self, ee_manager: Optional[EarthEngineManager] = None):
@@ -583,25 +1275,6 @@ class ModisNRTNotebookInterface(ModisNRT):
         self.population_source_year.value = self.population_source_year.options[0]
 
 
-    def get_modis_nrt_dates(self) -> List[datetime.date]:
-        """
-        Retrieves the MODIS NRT dates from the NASA API.
-
-        :return: A list of datetime.date objects representing the MODIS NRT dates.
-        """
-        response = requests.get(
-            f'https://nrt3.modaps.eosdis.nasa.gov/api/v2/content/details/allData/61/MCDWD_L3_NRT?fields=all&formats=json')
-        json_response = response.json()['content']
-        years = [x['name'] for x in json_response if x['name'] != 'Recent']
-        dates = []
-        for year in years:
-            date_response = requests.get(
-                f'https://nrt3.modaps.eosdis.nasa.gov/api/v2/content/details/allData/61/MCDWD_L3_NRT/{year}?fields=all&formats=json')
-            date_response_json = date_response.json()['content']
-            for date in date_response_json:
-                dates.append(self.convert_to_date(f'{year}{date["name"]}'))
-        return dates
-
     def create_widgets_for_modis_nrt(self) -> List[widgets.Widget]:
         """
         Create widgets for MODIS NRT.
@@ -691,12 +1364,19 @@ class ModisNRTNotebookInterface(ModisNRT):
                 indent=False
             )
 
-            self.end_of_vbox_items = widgets.Accordion([widgets.TwoByTwoLayout(
+            self.build_datacube = widgets.Checkbox(
+                value=False,
+                description='Build Flood Datacube and Statistics (Date Range)',
+                disabled=False,
+                indent=False
+            )
+
+            self.end_of_vbox_items = widgets.Accordion([widgets.VBox([widgets.TwoByTwoLayout(
                 top_left=self.create_sub_folder,
                 top_right=self.clip_to_geometry,
                 bottom_left=self.keep_individual_tiles,
                 bottom_right=self.add_image_to_map
-            )])
+            ), self.build_datacube])])
 
             self.end_of_vbox_items.set_title(0, 'Options')
 
@@ -749,6 +1429,8 @@ class ModisNRTNotebookInterface(ModisNRT):
 
         with open(params_file_path, 'w') as f:
             params_for_dump = params.copy()
+            # Admin units are geometries, not parameters
+            params_for_dump.pop('admin_units', None)
             for key, value in params_for_dump.items():
                 if isinstance(value, datetime.datetime):
                     params_for_dump[key] = value.isoformat()
@@ -757,71 +1439,28 @@ class ModisNRTNotebookInterface(ModisNRT):
         if params['calculate_population']:
             self.population_dict = {}
 
-        tiles = self.get_modis_tile(bbox)
+        tiles = self.get_modis_tile(self.get_area_of_interest(geometry, bbox))
 
         if self.single_or_date_range_modis_nrt.value in ['Date Range', 'All Available Images']:
             start_date = params['start_date']
             end_date = params['end_date']
 
-            current_date = start_date
             if isinstance(start_date, datetime.datetime):
                 start_date = start_date.date()
             if isinstance(end_date, datetime.datetime):
                 end_date = end_date.date()
-            if isinstance(current_date, datetime.datetime):
-                current_date = current_date.date()
-
-            while current_date <= end_date:
-                # Process your current_date
-                params['date'] = current_date
-                matching_files = self.get_modis_nrt_file_list(tiles, params)
-                if matching_files == []:
-                    current_date += datetime.timedelta(days=1)
-                    print('No matching files found for this date. Please try again later after new imagery available.')
-                    continue
-                hdf_files_to_process = []
-                tif_list = []
-                start = 1
-                year = current_date.year
-                doy = f"{current_date.timetuple().tm_yday:03d}"
-                for url in matching_files:
-                    self.download_and_process_modis_nrt(url, params['folder_output'], hdf_files_to_process,
-                                                        subdataset=self.modis_nrt_band_selection.value,
-                                                        tif_list=tif_list)
-                    start += 1
-
-
-                merged_output = os.path.join(params['folder_output'], f"modis_nrt_merged_{year}_{doy}.tif")
-                self.merge_tifs(tif_list, merged_output)
-                for file in tif_list + hdf_files_to_process:
-                    if params['keep_individual_tiles']:
-                        pass
-                    else:
-                        try:
-                            os.remove(file)
-                        except FileNotFoundError:
-                            pass
-                try:
-                    process_and_clip_raster(merged_output, geometry, params, self.ee_instance)
-                except Exception as e:
-                    print(f"{e}")
-                clipped_output = os.path.join(params['folder_output'], f"modis_nrt_merged_{year}_{doy}_clipped.tif")
 
-                if params['calculate_population']:
-                    try:
+            outputs = self.process_date_range(tiles, geometry, params, start_date, end_date)
+            clipped_output = next(reversed(outputs.values()), None)
 
-                        pop_impacted = self.calculate_population_in_flood_area(clipped_output,
-                                                                               params['population_year'],
-                                                                               params['population_data_type'],
-                                                                               params['population_type'],
-                                                                               params['folder_path'])
-                        print(f'Population Impacted: {pop_impacted:,}')
-                        self.population_dict[current_date.strftime('%Y-%m-%d')] = pop_impacted
-                    except Exception as e:
-                        print(f"{e}")
+            if params.get('build_datacube'):
+                self.update_datacube(outputs, os.path.join(params['folder_output'], 'flood_datacube'),
+                                     statistics_folder=os.path.join(params['folder_output'], 'flood_statistics'))
 
-                # Move to the next day
-                current_date += datetime.timedelta(days=1)
+            if params['calculate_population']:
+                self.population_dict = self.write_population_impacted(outputs, geometry, params)
+                for date, pop_impacted in self.population_dict.items():
+                    print(f'Population Impacted on {date}: {pop_impacted}')
 
         else:
 
@@ -833,35 +1472,10 @@ class ModisNRTNotebookInterface(ModisNRT):
 
             current_date = params['date']
 
-            year = current_date.year
-            doy = f"{current_date.timetuple().tm_yday:03d}"
-
-            hdf_files_to_process = []
-            tif_list = []
-            start=1
             pbar.update(3)
-            pbar.set_postfix_str('Downloading and processing files...')
-            for url in matching_files:
-                self.download_and_process_modis_nrt(url, params['folder_output'], hdf_files_to_process, subdataset=self.modis_nrt_band_selection.value, tif_list=tif_list)
-                start += 1
-
+            pbar.set_postfix_str('Downloading, merging and clipping files...')
+            clipped_output = self.process_date_files(matching_files, geometry, params)
             pbar.update(3)
-            pbar.set_postfix_str('Merging and clipping files...')
-            merged_output = os.path.join(params['folder_output'], f"modis_nrt_merged_{year}_{doy}.tif")
-            self.merge_tifs(tif_list, merged_output)
-            for file in tif_list + hdf_files_to_process:
-                if params['keep_individual_tiles']:
-                    pass
-                else:
-                    try:
-                        os.remove(file)
-                    except FileNotFoundError:
-                        pass
-            try:
-                process_and_clip_raster(merged_output, geometry, params, self.ee_instance)
-            except Exception as e:
-                print(f"{e}")
-            clipped_output = os.path.join(params['folder_output'], f"modis_nrt_merged_{year}_{doy}_clipped.tif")
 
             if params['calculate_population']:
                 try:
@@ -870,7 +1484,10 @@ class ModisNRTNotebookInterface(ModisNRT):
                                                                            params['population_year'],
                                                                            params['population_data_type'],
                                                                            params['population_type'],
-                                                                           params['folder_path'])
+                                                                           params['folder_path'],
+                                                                           aoi=geometry,
+                                                                           admin_units=params.get('admin_units'),
+                                                                           admin_labels=params.get('admin_labels'))
 
                     self.population_dict[current_date.strftime('%Y-%m-%d')] = pop_impacted
 
@@ -942,6 +1559,7 @@ class ModisNRTNotebookInterface(ModisNRT):
             - 'population_year': The value of `population_source_year`
             - 'population_type': The value of `population_source_variable`
             - 'population_data_type': The value of `population_source`
+            - 'build_datacube': The value of `build_datacube`
         - If `single_or_date_range_modis_nrt` is neither 'Single Date' nor 'Date Range', returns None.
 
         """
@@ -979,6 +1597,7 @@ class ModisNRTNotebookInterface(ModisNRT):
                 'population_year': self.population_source_year.value,
                 'population_type': self.population_source_variable.value,
                 'population_data_type': self.population_source.value,
+                'build_datacube': self.build_datacube.value,
             }
         else:
             pass
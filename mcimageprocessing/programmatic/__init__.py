@@ -3,17 +3,33 @@
 from .APIs.EarthEngine import EarthEngineManager, EarthEngineNotebookInterface
 from .APIs.GloFasAPI import GloFasAPI, GloFasAPINotebookInterface
 from .APIs.GPWv4 import GPWv4, GPWv4NotebookInterface
-from .APIs.ModisNRT import ModisNRT, ModisNRTNotebookInterface
+from .APIs.ModisNRT import ModisNRT, ModisNRTNotebookInterface, ModisNRTWatcher
 from .APIs.WorldPop import WorldPop, WorldPopNotebookInterface
 from .shared_functions.utilities import (mosaic_images, process_and_clip_raster, get_raster_min_max,
                                          add_clipped_raster_to_map, inspect_grib_file, clip_raster)
+from .shared_functions.geometry_preparation import prepare_geometry, prepare_geojson
+from .shared_functions.cache import LRUFileCache
+from .shared_functions.gee_catalog import GEECatalogIndex
+from .shared_functions.cds_jobs import CDSJobQueue
+from .shared_functions.grib_decoding import decode_grib
+from .shared_functions.ensemble_statistics import compute_ensemble_statistics, ensemble_statistics_from_grib
+from .shared_functions.return_periods import ReturnPeriodThresholds, return_period_exceedance
+from .shared_functions.point_extraction import extract_points_from_grib
+from .shared_functions.glofas_calendar import GloFasAvailabilityCalendar
+from .shared_functions.modis_tiles import tiles_for_geometry
+from .shared_functions.flood_population import flood_population_overlay
+from .shared_functions.flood_datacube import FloodDatacube
 
 __all__ = [
     'EarthEngineManager', 'GloFasAPI', 'GPWv4', 'ModisNRT', 'WorldPop',
     'EarthEngineNotebookInterface', 'GloFasAPINotebookInterface', 'GPWv4NotebookInterface',
     'ModisNRTNotebookInterface', 'WorldPopNotebookInterface',
     'mosaic_images', 'process_and_clip_raster', 'get_raster_min_max', 'add_clipped_raster_to_map',
-    'inspect_grib_file', 'clip_raster'
+    'inspect_grib_file', 'clip_raster', 'prepare_geometry', 'prepare_geojson',
+    'LRUFileCache', 'GEECatalogIndex', 'CDSJobQueue', 'decode_grib', 'compute_ensemble_statistics',
+    'ensemble_statistics_from_grib', 'ReturnPeriodThresholds', 'return_period_exceedance',
+    'extract_points_from_grib', 'GloFasAvailabilityCalendar', 'tiles_for_geometry',
+    'flood_population_overlay', 'FloodDatacube', 'ModisNRTWatcher'
 ]
 
 
@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+DEFAULT_CACHE_ROOT = os.environ.get('MCIMAGEPROCESSING_CACHE_DIR',
+                                    os.path.join(os.path.expanduser('~'), '.mcimageprocessing', 'cache'))
+
+
+def hash_key(*parts) -> str:
+    """
+    Build a content-addressed cache key.
+
+    :param parts: JSON serializable values identifying the cached content.
+    :return: The SHA-256 hex digest of the canonical JSON encoding of the parts.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def temporary_path_for(path: str) -> str:
+    """
+    :param path: The file about to be written.
+    :return: A temporary path next to it, unique to the process and thread, to be renamed over it with os.replace.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_json(path: str, value) -> None:
+    """
+    Write a JSON file atomically, so readers never see a partially written file.
+
+    :param path: The JSON file.
+    :param value: The JSON serializable value.
+    :return: None
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary_path = temporary_path_for(path)
+    with open(temporary_path, 'w') as f:
+        json.dump(value, f)
+    os.replace(temporary_path, path)
+
+
+def read_json(path: str, default=None):
+    """
+    :param path: The JSON file.
+    :param default: The value returned when the file is missing or invalid.
+    :return: The content of the file, or `default`.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def update_json(path: str, update):
+    """
+    Change a JSON file shared between processes.
+
+    :param path: The JSON file.
+    :param update: A function receiving the current content of the file, or None if it does not exist, and returning
+                   the new content.
+    :return: The new content.
+
+    The file is read, changed and written while holding its FileLock, so concurrent writers in other processes do not
+    overwrite each other's changes.
+
+    Example usage:
+        update_json(state_path, lambda state: {**(state or {}), job_id: job})
+    """
+    with FileLock(f"{path}.lock"):
+        value = update(read_json(path))
+        write_json(path, value)
+        return value
+
+
+class FileLock:
+    """
+    Lock shared between processes, held by creating a lock file exclusively.
+
+    Creating a file with O_EXCL is atomic on every platform, so no platform specific locking is needed. A lock file
+    older than `stale_after` seconds is left by a process that died while holding it and is removed. The lock is not
+    reentrant.
+
+    Example usage:
+        with FileLock(index_path + '.lock'):
+            index = read_json(index_path, {})
+            write_json(index_path, index)
+    """
+
+    def __init__(self, path: str, timeout: float = 60, stale_after: float = 300, poll_interval: float = 0.05):
+        """
+        :param path: The lock file.
+        :param timeout: Seconds to wait for the lock before raising a TimeoutError.
+        :param stale_after: Age in seconds after which a lock file is considered stale.
+        :param poll_interval: Seconds between two attempts to take the lock.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                file_descriptor = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Could not lock {self.path} within {self.timeout} seconds.")
+                time.sleep(self.poll_interval)
+                continue
+            os.write(file_descriptor, str(os.getpid()).encode())
+            os.close(file_descriptor)
+            return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class LRUFileCache:
+    """
+    On-disk cache of JSON values and files, keyed by content hashes and bounded in size.
+
+    Entries are stored as individual files in `cache_directory`, next to an `index.json` that records their size,
+    creation time and last access time. When the total size exceeds `max_bytes`, the least recently used entries are
+    evicted. Every change re-reads the index under a FileLock and merges into it, so the cache can be shared between
+    kernels and processes. Access times are kept in memory and written at most every `touch_interval` seconds, with
+    the next change of the index.
+
+    Example usage:
+        cache = LRUFileCache(os.path.join(DEFAULT_CACHE_ROOT, 'example'), max_bytes=64 * 1024 ** 2)
+        key = hash_key('WorldPop/GP/100m/pop', 2020)
+        cache.put_json(key, {'population': 1234})
+        cache.get_json(key)
+    """
+
+    index_file_name = 'index.json'
+    # Seconds between two writes of the index caused only by cache hits
+    touch_interval = 60
+
+    def __init__(self, cache_directory: str, max_bytes: int = 512 * 1024 ** 2):
+        """
+        Initialize the cache.
+
+        :param cache_directory: The directory holding the cached entries. It is created if it does not exist.
+        :param max_bytes: The maximum total size of the cached entries in bytes.
+        """
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(cache_directory, exist_ok=True)
+        self._index = self._load_index()
+        # Access times of the hits not yet written to the index
+        self._touches = {}
+        self._last_write = time.time()
+
+    # ==============================================================================
+    # PRIMARY FUNCTIONS
+    # ==============================================================================
+
+    def get_json(self, key: str, default=None, max_age: float = None):
+        """
+        :param key: The cache key.
+        :param default: The value returned when the key is missing or stale.
+        :param max_age: Optional maximum age of the entry in seconds.
+        :return: The cached value, or `default`.
+        """
+        path = self._lookup(key, max_age)
+        if path is None:
+            return default
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            self.invalidate(key)
+            return default
+
+    def put_json(self, key: str, value, metadata: dict = None) -> None:
+        """
+        :param key: The cache key.
+        :param value: The JSON serializable value to store.
+        :param metadata: Optional JSON serializable metadata kept in the index.
+        :return: None
+        """
+        file_name = f"{key}.json"
+        write_json(os.path.join(self.cache_directory, file_name), value)
+        self._register(key, file_name, metadata)
+
+    def get_file(self, key: str, max_age: float = None):
+        """
+        :param key: The cache key.
+        :param max_age: Optional maximum age of the entry in seconds.
+        :return: The path of the cached file, or None. The file must be copied before it is modified.
+        """
+        return self._lookup(key, max_age)
+
+    def put_file(self, key: str, source_path: str, move: bool = False, metadata: dict = None) -> str:
+        """
+        :param key: The cache key.
+        :param source_path: The file to store.
+        :param move: Move the file into the cache instead of copying it.
+        :param metadata: Optional JSON serializable metadata kept in the index.
+        :return: The path of the cached file.
+        """
+        file_name = f"{key}{os.path.splitext(source_path)[1]}"
+        cached_path = os.path.join(self.cache_directory, file_name)
+        temporary_path = temporary_path_for(cached_path)
+        if move:
+            shutil.move(source_path, temporary_path)
+        else:
+            shutil.copyfile(source_path, temporary_path)
+        os.replace(temporary_path, cached_path)
+        self._register(key, file_name, metadata)
+        return cached_path
+
+    def get_metadata(self, key: str):
+        """
+        :param key: The cache key.
+        :return: The metadata stored with the entry, or None if the key is missing.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            return None if entry is None else entry.get('metadata')
+
+    def entries(self) -> dict:
+        """
+        :return: A dictionary mapping every key to its metadata, most recently used first.
+        """
+        with self._lock:
+            keys = sorted(self._index, key=lambda k: self._index[k]['last_access'], reverse=True)
+            return {key: self._index[key].get('metadata') for key in keys}
+
+    def invalidate(self, key: str) -> None:
+        """
+        Remove a single entry from the cache.
+
+        :param key: The cache key.
+        :return: None
+        """
+        def remove(index):
+            entry = index.pop(key, None)
+            if entry is not None:
+                self._remove_file(entry['file'])
+
+        self._update_index(remove)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+
+        :return: None
+        """
+        def remove_all(index):
+            for entry in index.values():
+                self._remove_file(entry['file'])
+            index.clear()
+
+        self._update_index(remove_all)
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    def _lookup(self, key, max_age):
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                # The entry may have been added by another process
+                self._index = self._load_index()
+                entry = self._index.get(key)
+                if entry is None:
+                    return None
+
+            path = os.path.join(self.cache_directory, entry['file'])
+            if not os.path.exists(path) or (max_age is not None and time.time() - entry['created'] > max_age):
+                self.invalidate(key)
+                return None
+
+            now = time.time()
+            entry['last_access'] = self._touches[key] = now
+            if now - self._last_write > self.touch_interval:
+                self._update_index(None)
+            return path
+
+    def _register(self, key, file_name, metadata):
+        now = time.time()
+        entry = {
+            'file': file_name,
+            'size': os.path.getsize(os.path.join(self.cache_directory, file_name)),
+            'created': now,
+            'last_access': now,
+            'metadata': metadata
+        }
+        self._update_index(lambda index: index.__setitem__(key, entry))
+
+    def _update_index(self, change):
+        # Merge the pending access times and the change into the index on disk, then evict
+        with self._lock, FileLock(os.path.join(self.cache_directory, f"{self.index_file_name}.lock")):
+            self._index = self._load_index()
+            for key, last_access in self._touches.items():
+                if key in self._index:
+                    self._index[key]['last_access'] = max(self._index[key]['last_access'], last_access)
+            self._touches = {}
+            if change is not None:
+                change(self._index)
+            self._evict()
+            self._save_index()
+            self._last_write = time.time()
+
+    def _evict(self):
+        total_size = sum(entry['size'] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]['last_access']):
+            if total_size <= self.max_bytes:
+                break
+            entry = self._index.pop(key)
+            self._remove_file(entry['file'])
+            total_size -= entry['size']
+
+    def _remove_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.cache_directory, file_name))
+        except FileNotFoundError:
+            pass
+
+    def _load_index(self):
+        return read_json(os.path.join(self.cache_directory, self.index_file_name), {})
+
+    def _save_index(self):
+        write_json(os.path.join(self.cache_directory, self.index_file_name), self._index)
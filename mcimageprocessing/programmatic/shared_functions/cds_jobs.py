@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+
+from cdsapi.api import Result
+
+from mcimageprocessing.programmatic.shared_functions.cache import DEFAULT_CACHE_ROOT, hash_key, read_json, update_json
+
+
+class CDSJobQueue:
+    """
+    Submit many Climate Data Store requests at once and download their results as they complete.
+
+    `cdsapi.Client.retrieve` blocks until the request has gone through the CDS queue. With a client created with
+    `wait_until_complete=False` it returns as soon as the request is accepted, so every request can be queued on the
+    CDS side before the first one finishes. The queue then polls the pending jobs and downloads each result as soon as
+    it is ready.
+
+    Job ids are persisted in `state_path`. Submitting a request identical to a queued, running or completed job
+    reattaches to that job instead of submitting it again, so a restarted kernel picks up where it stopped. The client
+    should be created with `delete=False`, otherwise cdsapi deletes the job on the server when its result object is
+    garbage collected. The queue deletes a job on the server itself once its result is downloaded, and finished jobs
+    are dropped from the state after `state_retention` seconds.
+
+    The state file may be shared by several processes, e.g. the workers of `download_glofas_date_range`. It is
+    re-read before every submission and every write, and written under a file lock, so the jobs of every process are
+    kept and a job submitted by one process is reattached to by the others.
+
+    The queue only uses the `url` of the client for its HTTP calls, so it can be run against a local fake CDS server
+    that implements the `/resources/<dataset>` and `/tasks/<request_id>` endpoints.
+
+    Example usage:
+        client = cdsapi.Client(url=url, key=key, wait_until_complete=False, delete=False)
+        queue = CDSJobQueue(client)
+        for request, target in requests:
+            queue.submit('cems-glofas-forecast', request, target)
+        for job in queue.as_completed():
+            if job['state'] == 'downloaded':
+                process_and_clip_raster(job['target'], geometry, params)
+    """
+
+    finished_states = ('downloaded', 'failed')
+    # Seconds after which downloaded and failed jobs are dropped from the persisted state
+    state_retention = 7 * 24 * 60 * 60
+
+    def __init__(self, client, state_path: str = os.path.join(DEFAULT_CACHE_ROOT, 'cds_jobs.json'),
+                 poll_interval: float = 5, max_poll_interval: float = 60):
+        """
+        Initialize the queue and load the jobs persisted by earlier sessions.
+
+        :param client: A cdsapi.Client created with `wait_until_complete=False`.
+        :param state_path: The JSON file the jobs are persisted in.
+        :param poll_interval: The initial number of seconds between two polls.
+        :param max_poll_interval: The polling interval doubles while no job completes, up to this number of seconds.
+        """
+        self.client = client
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._lock = threading.RLock()
+        self._results = {}
+        # Job ids removed by this queue, which must not be restored from the state of other processes
+        self._removed = set()
+        self.jobs = self._load_state()
+
+    # ==============================================================================
+    # PRIMARY FUNCTIONS
+    # ==============================================================================
+
+    def submit(self, dataset: str, request: dict, target: str) -> str:
+        """
+        Submit a request without waiting for it to complete.
+
+        :param dataset: The CDS dataset name, e.g. 'cems-glofas-forecast'.
+        :param request: The CDS request dictionary.
+        :param target: The file path the result is downloaded to.
+        :return: The CDS request id of the job.
+        """
+        key = hash_key(dataset, request)
+        with self._lock:
+            self.jobs = self._merged(self._load_state())
+            for job_id, job in list(self.jobs.items()):
+                if job['key'] != key:
+                    continue
+                if job['state'] == 'failed' or (job['state'] == 'downloaded' and not os.path.exists(job['target'])):
+                    # Failed jobs are submitted again, and downloaded jobs are deleted on the server, so a result
+                    # whose file no longer exists is requested again
+                    self.jobs.pop(job_id)
+                    self._results.pop(job_id, None)
+                    self._removed.add(job_id)
+                    continue
+                if job['target'] != target and job['state'] != 'downloaded':
+                    job['target'] = target
+                self._save_state()
+                return job_id
+
+        result = self.client.retrieve(dataset, request)
+        job_id = result.reply['request_id']
+        with self._lock:
+            self._results[job_id] = result
+            self.jobs[job_id] = {
+                'key': key,
+                'dataset': dataset,
+                'request': request,
+                'target': target,
+                'state': result.reply['state'],
+                'submitted': time.time()
+            }
+            self._save_state()
+        return job_id
+
+    def poll(self, job_ids=None) -> list:
+        """
+        Update the state of pending jobs.
+
+        :param job_ids: Optional list of job ids to poll. By default every unfinished job is polled.
+        :return: The list of job ids that are completed and not downloaded yet.
+        """
+        completed = []
+        for job_id in self._unfinished(job_ids):
+            job = self.jobs[job_id]
+            if job['state'] != 'completed':
+                result = self._result(job_id)
+                try:
+                    result.update()
+                except Exception as e:
+                    # The job is unknown to the server, e.g. it expired after a long restart
+                    job['state'] = 'failed'
+                    job['error'] = str(e)
+                    continue
+                job['state'] = result.reply['state']
+                if job['state'] == 'failed':
+                    job['error'] = result.reply.get('error', {}).get('message', 'The request failed.')
+            if job['state'] == 'completed':
+                completed.append(job_id)
+
+        with self._lock:
+            self._save_state()
+        return completed
+
+    def as_completed(self, job_ids=None, timeout: float = None):
+        """
+        Download the results of jobs as they complete.
+
+        :param job_ids: Optional list of job ids to wait for. By default every unfinished job is awaited.
+        :param timeout: Optional number of seconds after which waiting stops.
+        :return: A generator of job dictionaries, in completion order. Each has a 'job_id', its 'target' and a 'state'
+                 of 'downloaded', or 'failed' with the server message in 'error'.
+        """
+        # Identical requests share a job id, so the same job may be awaited several times
+        job_ids = list(dict.fromkeys(self._unfinished(job_ids) if job_ids is None else job_ids))
+        reported = set()
+        interval = self.poll_interval
+        started = time.time()
+
+        while True:
+            # Report jobs that were already finished before the first poll, e.g. after reattaching
+            for job_id in job_ids:
+                if job_id not in reported and self.jobs[job_id]['state'] in self.finished_states:
+                    reported.add(job_id)
+                    yield {'job_id': job_id, **self.jobs[job_id]}
+
+            if len(reported) == len(job_ids):
+                return
+
+            completed = self.poll([job_id for job_id in job_ids if job_id not in reported])
+            for job_id in completed:
+                self._download(job_id)
+
+            if completed or any(self.jobs[job_id]['state'] == 'failed' for job_id in job_ids
+                                if job_id not in reported):
+                interval = self.poll_interval
+                continue
+
+            if timeout is not None and time.time() - started > timeout:
+                return
+            time.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def pending(self) -> list:
+        """
+        :return: The list of job ids that have not been downloaded or failed, including those of earlier sessions.
+        """
+        return self._unfinished(None)
+
+    def forget(self, job_id: str) -> None:
+        """
+        Remove a job from the persisted state.
+
+        :param job_id: The CDS request id of the job.
+        :return: None
+        """
+        with self._lock:
+            self.jobs.pop(job_id, None)
+            self._results.pop(job_id, None)
+            self._removed.add(job_id)
+            self._save_state()
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    def _unfinished(self, job_ids):
+        job_ids = self.jobs if job_ids is None else job_ids
+        return [job_id for job_id in job_ids if self.jobs[job_id]['state'] not in self.finished_states]
+
+    def _result(self, job_id):
+        if job_id not in self._results:
+            # Reattach to a job submitted by an earlier session
+            self._results[job_id] = Result(self.client, {'request_id': job_id, 'state': self.jobs[job_id]['state']})
+        return self._results[job_id]
+
+    def _download(self, job_id):
+        job = self.jobs[job_id]
+        result = self._result(job_id)
+
+        os.makedirs(os.path.dirname(job['target']) or '.', exist_ok=True)
+        temporary_path = f"{job['target']}.part"
+        try:
+            if 'location' not in result.reply:
+                # Fails when the job is unknown to the server, e.g. it expired after a long restart
+                result.update()
+            result.download(temporary_path)
+            os.replace(temporary_path, job['target'])
+            job['state'] = 'downloaded'
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+        else:
+            self._delete(job_id)
+        with self._lock:
+            self._save_state()
+
+    def _delete(self, job_id):
+        # Free the result on the server, it is not needed once downloaded
+        try:
+            self._results.pop(job_id).delete()
+        except Exception as e:
+            print(f"Could not delete the CDS job {job_id}: {e}")
+
+    def _load_state(self):
+        return self._pruned(read_json(self.state_path, {}))
+
+    def _pruned(self, jobs):
+        expired = time.time() - self.state_retention
+        return {job_id: job for job_id, job in jobs.items()
+                if job['state'] not in self.finished_states or job.get('submitted', 0) > expired}
+
+    def _progress(self, job):
+        return 2 if job['state'] in self.finished_states else 1 if job['state'] == 'completed' else 0
+
+    def _merged(self, jobs):
+        # Keep the jobs of other processes, and the most advanced state of jobs known to both
+        merged = {job_id: job for job_id, job in jobs.items() if job_id not in self._removed}
+        for job_id, job in self.jobs.items():
+            if job_id not in merged or self._progress(job) >= self._progress(merged[job_id]):
+                merged[job_id] = job
+        return merged
+
+    def _save_state(self):
+        self.jobs = update_json(self.state_path, lambda jobs: self._merged(self._pruned(jobs or {})))
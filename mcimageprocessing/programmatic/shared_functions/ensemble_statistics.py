@@ -0,0 +1,140 @@
+import os
+import warnings
+
+import numpy as np
+import rasterio
+
+from mcimageprocessing.programmatic.shared_functions.grib_decoding import decode_grib
+
+DEFAULT_PERCENTILES = (10, 25, 75, 90)
+COG_PROFILE = {
+    'driver': 'COG',
+    'dtype': 'float32',
+    'nodata': np.nan,
+    'compress': 'DEFLATE',
+    'predictor': 3,
+    'blocksize': 256,
+    'overviews': 'AUTO'
+}
+
+
+def sorted_percentile(sorted_members, valid_count, percentile):
+    """
+    Percentile of the valid members of every pixel, with linear interpolation like numpy.nanpercentile.
+
+    :param sorted_members: A (member, y, x) array sorted along the member axis, NaN members last.
+    :param valid_count: A (y, x) array with the number of valid members of every pixel.
+    :param percentile: The percentile, between 0 and 100.
+    :return: A (y, x) array, NaN where a pixel has no valid member.
+
+    numpy.nanpercentile falls back to a per-pixel loop when NaN are present, this stays vectorized.
+    """
+    position = percentile / 100 * np.maximum(valid_count - 1, 0)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(valid_count - 1, 0))
+    fraction = (position - lower).astype('float32')
+
+    lower_values = np.take_along_axis(sorted_members, lower[np.newaxis], axis=0)[0]
+    upper_values = np.take_along_axis(sorted_members, upper[np.newaxis], axis=0)[0]
+    return np.where(valid_count > 0, lower_values + (upper_values - lower_values) * fraction, np.nan)
+
+
+def compute_ensemble_statistics(data, percentiles=DEFAULT_PERCENTILES, thresholds=None):
+    """
+    Compute per-pixel ensemble statistics for every lead time.
+
+    :param data: A (member, leadtime, y, x) array, NaN where there is no value. It can be a numpy.memmap.
+    :param percentiles: The percentiles to compute.
+    :param thresholds: Optional list of values. The exceedance probability of each is computed.
+    :return: A dictionary mapping statistic names to (leadtime, y, x) float32 arrays. The names are 'mean',
+             'median', 'min', 'max', 'spread' (the standard deviation), 'p<percentile>' and 'exceedance_<threshold>'
+             (the fraction of valid members above the threshold).
+
+    The statistics are vectorized over members and pixels. Lead times are processed one at a time, so only one
+    (member, y, x) slice of a memory-mapped array is in memory at once.
+
+    Example usage:
+        statistics = compute_ensemble_statistics(decoded.data, percentiles=(10, 90), thresholds=[250.0])
+    """
+    thresholds = thresholds or []
+    _, leadtime_count, ny, nx = data.shape
+
+    names = ['mean', 'median', 'min', 'max', 'spread'] + [f"p{percentile:g}" for percentile in percentiles] + \
+            [f"exceedance_{threshold:g}" for threshold in thresholds]
+    statistics = {name: np.full((leadtime_count, ny, nx), np.nan, dtype='float32') for name in names}
+
+    with warnings.catch_warnings():
+        # Pixels outside the river network are NaN for every member
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for leadtime_index in range(leadtime_count):
+            members = np.asarray(data[:, leadtime_index], dtype='float32')
+            valid = ~np.isnan(members)
+            valid_count = valid.sum(axis=0)
+
+            statistics['mean'][leadtime_index] = np.nanmean(members, axis=0)
+            statistics['min'][leadtime_index] = np.nanmin(members, axis=0)
+            statistics['max'][leadtime_index] = np.nanmax(members, axis=0)
+            statistics['spread'][leadtime_index] = np.nanstd(members, axis=0)
+
+            # Sorting moves NaN members to the end, so the valid members of every pixel come first
+            sorted_members = np.sort(members, axis=0)
+            statistics['median'][leadtime_index] = sorted_percentile(sorted_members, valid_count, 50)
+            for percentile in percentiles:
+                statistics[f"p{percentile:g}"][leadtime_index] = sorted_percentile(sorted_members, valid_count,
+                                                                                    percentile)
+
+            for threshold in thresholds:
+                exceeding = (members > threshold).sum(axis=0)
+                statistics[f"exceedance_{threshold:g}"][leadtime_index] = np.where(
+                    valid_count > 0, exceeding / np.maximum(valid_count, 1), np.nan)
+
+    return statistics
+
+
+def write_statistics_cogs(statistics, leadtimes, transform, crs, output_folder, prefix):
+    """
+    Write every statistic as a multi-band Cloud Optimized GeoTIFF with one band per lead time.
+
+    :param statistics: The dictionary returned by `compute_ensemble_statistics`.
+    :param leadtimes: The lead times in hours, in band order.
+    :param transform: The affine transform of the grid.
+    :param crs: The coordinate reference system of the grid.
+    :param output_folder: The folder the files are written to.
+    :param prefix: The prefix of the file names.
+    :return: A dictionary mapping statistic names to file paths.
+    """
+    file_paths = {}
+    for name, values in statistics.items():
+        file_path = os.path.join(output_folder, f"{prefix}_{name}.tif")
+        profile = dict(COG_PROFILE, count=values.shape[0], height=values.shape[1], width=values.shape[2],
+                       transform=transform, crs=crs)
+        with rasterio.open(file_path, 'w', **profile) as dest:
+            dest.write(values.astype('float32'))
+            for band, leadtime in enumerate(leadtimes, start=1):
+                dest.set_band_description(band, f"leadtime_{leadtime}h")
+        file_paths[name] = file_path
+    return file_paths
+
+
+def ensemble_statistics_from_grib(file_path, output_folder=None, percentiles=DEFAULT_PERCENTILES, thresholds=None,
+                                  leadtimes=None, reference_date=None):
+    """
+    Decode an ensemble forecast GRIB and write its per-pixel ensemble statistics as COGs.
+
+    :param file_path: The GRIB file, e.g. a cems-glofas-forecast ensemble_perturbed_forecasts download.
+    :param output_folder: The folder the files are written to. Defaults to the folder of the GRIB file.
+    :param percentiles: The percentiles to compute.
+    :param thresholds: Optional discharge values whose exceedance probability is computed.
+    :param leadtimes: Optional list of lead times in hours. By default every lead time of the file is used.
+    :param reference_date: Optional forecast reference date, for files with several dates.
+    :return: A dictionary mapping statistic names to file paths.
+
+    Example usage:
+        file_paths = ensemble_statistics_from_grib('forecast.grib', thresholds=[250.0, 500.0])
+    """
+    with decode_grib(file_path, reference_date=reference_date, leadtimes=leadtimes) as decoded:
+        statistics = compute_ensemble_statistics(decoded.data, percentiles=percentiles, thresholds=thresholds)
+
+    output_folder = output_folder or os.path.dirname(file_path)
+    prefix = f"{os.path.splitext(os.path.basename(file_path))[0]}_ensemble"
+    return write_statistics_cogs(statistics, decoded.leadtimes, decoded.transform, decoded.crs, output_folder, prefix)
@@ -0,0 +1,239 @@
+import bisect
+import datetime
+import json
+import os
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.warp import reproject, Resampling
+
+from mcimageprocessing.programmatic.shared_functions.flood_population import MODIS_FLOOD_VALUES
+
+
+class FloodDatacube:
+    """
+    Chunked (time, y, x) store of daily flood rasters on a fixed grid.
+
+    The store is a directory of memory-mapped `.npy` chunks of `chunk_days` days each, next to an `index.json` that
+    records the grid and the date of every time slice. The first appended raster fixes the grid, e.g. the grid of the
+    clipped rasters of an area of interest, and later rasters are resampled to it when they differ. Appending a day
+    writes a single slice into the last chunk, or starts a new chunk, so its cost does not depend on the length of the
+    series. Appending a date already in the cube replaces its slice, e.g. when the granules of a day are updated.
+    Appending a day before the last day, e.g. a day whose granules were published late, inserts its slice and moves the
+    slices of the later days one slot, so its cost grows with the number of days after it.
+
+    Flood statistics are computed in one pass along time, chunk by chunk, with vectorized operations over all pixels.
+
+    Example usage:
+        cube = FloodDatacube('flood_datacube')
+        for date, raster_path in rasters.items():
+            cube.append(raster_path, datetime.date.fromisoformat(date))
+        cube.write_statistics('flood_statistics')
+    """
+
+    index_file_name = 'index.json'
+
+    def __init__(self, cube_directory: str, chunk_days: int = 32, nodata: int = 255):
+        """
+        Initialize the datacube and load its index if it exists.
+
+        :param cube_directory: The directory holding the chunks. It is created if it does not exist.
+        :param chunk_days: The number of days per chunk of a new cube.
+        :param nodata: The value of pixels without data, 255 in the MODIS NRT flood product.
+        """
+        self.cube_directory = cube_directory
+        os.makedirs(cube_directory, exist_ok=True)
+        self.index = self._load_index() or {'chunk_days': chunk_days, 'nodata': nodata, 'dates': [], 'grid': None}
+
+    # ==============================================================================
+    # PRIMARY FUNCTIONS
+    # ==============================================================================
+
+    @property
+    def dates(self) -> list:
+        """
+        :return: The datetime.date of every time slice, in time order.
+        """
+        return [datetime.date.fromisoformat(date) for date in self.index['dates']]
+
+    def append(self, raster_path: str, date: datetime.date) -> None:
+        """
+        Append the first band of a raster as the slice of a day.
+
+        :param raster_path: The raster of the day, e.g. a clipped MODIS NRT raster.
+        :param date: The day of the raster.
+        :return: None
+        """
+        with rasterio.open(raster_path) as src:
+            if self.index['grid'] is None:
+                self.index['grid'] = {'height': src.height, 'width': src.width, 'transform': list(src.transform)[:6],
+                                      'crs': src.crs.to_wkt()}
+            height, width, transform, crs = self._grid()
+            if (src.height, src.width) == (height, width) and src.transform.almost_equals(transform) and src.crs == crs:
+                array = src.read(1)
+            else:
+                array = np.full((height, width), self.index['nodata'], dtype='uint8')
+                reproject(rasterio.band(src, 1), array, dst_transform=transform, dst_crs=crs,
+                          dst_nodata=self.index['nodata'], resampling=Resampling.nearest)
+        self.append_array(array, date)
+
+    def append_array(self, array: np.ndarray, date: datetime.date) -> None:
+        """
+        Append a (y, x) array on the grid of the cube as the slice of a day.
+
+        :param array: The flood classes of the day.
+        :param date: The day of the array.
+        :return: None
+        """
+        day = date.isoformat()
+        position = bisect.bisect_left(self.index['dates'], day)
+        replace = position < len(self.index['dates']) and self.index['dates'][position] == day
+        if not replace:
+            self._shift_slices(position)
+
+        self._write_slice(position, array)
+        if not replace:
+            self.index['dates'].insert(position, day)
+        self._save_index()
+
+    def iter_chunks(self):
+        """
+        :return: A generator of (dates, array) tuples with the (time, y, x) array of every chunk, in time order.
+        """
+        dates = self.dates
+        chunk_days = self.index['chunk_days']
+        for start in range(0, len(dates), chunk_days):
+            chunk = np.load(self._chunk_path(start // chunk_days), mmap_mode='r')
+            chunk_dates = dates[start:start + chunk_days]
+            yield chunk_dates, chunk[:len(chunk_dates)]
+
+    def read(self) -> np.ndarray:
+        """
+        :return: The whole (time, y, x) array of the cube.
+        """
+        height, width, _, _ = self._grid()
+        chunks = [array for _, array in self.iter_chunks()]
+        return np.concatenate(chunks) if chunks else np.empty((0, height, width), dtype='uint8')
+
+    def statistics(self, flood_values=MODIS_FLOOD_VALUES) -> dict:
+        """
+        Compute the flood statistics of every pixel over the whole series.
+
+        :param flood_values: The classes counted as flooded.
+        :return: A dictionary of (y, x) arrays:
+                 - 'flood_days': The number of days the pixel was flooded.
+                 - 'valid_days': The number of days the pixel had data.
+                 - 'flood_frequency': flood_days / valid_days, NaN where the pixel never had data.
+                 - 'max_flood_duration': The longest run of consecutive flooded days. A missing day ends a run.
+                 - 'first_flood_day' and 'last_flood_day': The first and last flooded day, in days since the first
+                   day of the cube, -1 where the pixel was never flooded.
+        """
+        height, width, _, _ = self._grid()
+        flood_days = np.zeros((height, width), dtype='int32')
+        valid_days = np.zeros((height, width), dtype='int32')
+        max_duration = np.zeros((height, width), dtype='int32')
+        run = np.zeros((height, width), dtype='int32')
+        first_flood = np.full((height, width), -1, dtype='int32')
+        last_flood = np.full((height, width), -1, dtype='int32')
+        start_date, previous_date = None, None
+
+        for chunk_dates, chunk in self.iter_chunks():
+            start_date = start_date or chunk_dates[0]
+            flooded = np.isin(chunk, flood_values)
+            flood_days += flooded.sum(axis=0, dtype='int32')
+            valid_days += (chunk != self.index['nodata']).sum(axis=0, dtype='int32')
+
+            days = np.array([(date - start_date).days for date in chunk_dates], dtype='int32')
+            any_flooded = flooded.any(axis=0)
+            first_in_chunk = days[np.argmax(flooded, axis=0)]
+            last_in_chunk = days[len(days) - 1 - np.argmax(flooded[::-1], axis=0)]
+            first_flood = np.where((first_flood < 0) & any_flooded, first_in_chunk, first_flood)
+            last_flood = np.where(any_flooded, last_in_chunk, last_flood)
+
+            for date, flooded_day in zip(chunk_dates, flooded):
+                if previous_date is not None and (date - previous_date).days > 1:
+                    run[:] = 0
+                run = (run + 1) * flooded_day
+                np.maximum(max_duration, run, out=max_duration)
+                previous_date = date
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frequency = np.where(valid_days > 0, flood_days / valid_days, np.nan).astype('float32')
+
+        return {'flood_days': flood_days, 'valid_days': valid_days, 'flood_frequency': frequency,
+                'max_flood_duration': max_duration, 'first_flood_day': first_flood, 'last_flood_day': last_flood}
+
+    def write_statistics(self, folder_output: str, flood_values=MODIS_FLOOD_VALUES) -> dict:
+        """
+        Write the flood statistics as GeoTIFFs on the grid of the cube.
+
+        :param folder_output: The folder the GeoTIFFs are written to, one per statistic, e.g. 'flood_frequency.tif'.
+        :param flood_values: The classes counted as flooded.
+        :return: A dictionary mapping every statistic to its GeoTIFF.
+        """
+        os.makedirs(folder_output, exist_ok=True)
+        height, width, transform, crs = self._grid()
+        output_paths = {}
+
+        for name, array in self.statistics(flood_values).items():
+            output_paths[name] = os.path.join(folder_output, f"{name}.tif")
+            nodata = np.nan if array.dtype.kind == 'f' else -1
+            with rasterio.open(output_paths[name], 'w', driver='GTiff', height=height, width=width, count=1,
+                               dtype=array.dtype, crs=crs, transform=transform, nodata=nodata,
+                               compress='deflate', tiled=True) as dst:
+                dst.write(array, 1)
+                dst.update_tags(start_date=self.index['dates'][0], end_date=self.index['dates'][-1],
+                                days=len(self.index['dates']))
+        return output_paths
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    def _grid(self):
+        grid = self.index['grid']
+        if grid is None:
+            raise ValueError("The datacube is empty, append a raster first.")
+        return grid['height'], grid['width'], Affine(*grid['transform']), CRS.from_wkt(grid['crs'])
+
+    def _chunk_path(self, chunk_number):
+        return os.path.join(self.cube_directory, f"chunk_{chunk_number:05d}.npy")
+
+    def _write_slice(self, position, array):
+        chunk_number, offset = divmod(position, self.index['chunk_days'])
+        chunk = self._open_chunk(chunk_number)
+        chunk[offset] = array
+        chunk.flush()
+        del chunk
+
+    def _shift_slices(self, position):
+        # Move the slices from `position` on one slot later, the last one first, to make room for an earlier day
+        for source in range(len(self.index['dates']) - 1, position - 1, -1):
+            chunk_number, offset = divmod(source, self.index['chunk_days'])
+            self._write_slice(source + 1, np.array(np.load(self._chunk_path(chunk_number), mmap_mode='r')[offset]))
+
+    def _open_chunk(self, chunk_number):
+        path = self._chunk_path(chunk_number)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode='r+')
+        height, width, _, _ = self._grid()
+        chunk = np.lib.format.open_memmap(path, mode='w+', dtype='uint8',
+                                          shape=(self.index['chunk_days'], height, width))
+        chunk[:] = self.index['nodata']
+        return chunk
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cube_directory, self.index_file_name), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_index(self):
+        index_path = os.path.join(self.cube_directory, self.index_file_name)
+        temporary_path = f"{index_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temporary_path, index_path)
@@ -0,0 +1,116 @@
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.features import rasterize
+from rasterio.warp import reproject, Resampling, transform_geom
+from shapely.geometry import mapping
+
+from mcimageprocessing.programmatic.shared_functions.utilities import as_clip_geometry
+
+# Value of flooded pixels in the MODIS NRT flood bands
+MODIS_FLOOD_VALUES = (3,)
+
+
+def flood_fraction_on_grid(flood, flood_transform, flood_crs, shape, transform, crs, flood_values=MODIS_FLOOD_VALUES,
+                           nodata=None):
+    """
+    Resample a flood raster to the fraction of every cell of another grid that is flooded.
+
+    :param flood: A (y, x) array of flood classes.
+    :param flood_transform: The affine transform of the flood raster.
+    :param flood_crs: The CRS of the flood raster.
+    :param shape: The (y, x) shape of the target grid.
+    :param transform: The affine transform of the target grid.
+    :param crs: The CRS of the target grid.
+    :param flood_values: The classes counted as flooded.
+    :param nodata: Optional nodata value of the flood raster. Nodata pixels are ignored in the average.
+    :return: A float32 (y, x) array between 0 and 1, NaN where the flood raster has no valid pixel.
+
+    The flooded mask is averaged onto the target grid, so a population cell covering several flood pixels is weighted
+    by the share of them that is flooded, and a flood pixel covering several population cells flags all of them.
+    """
+    mask = np.isin(flood, flood_values).astype('float32')
+    if nodata is not None:
+        mask[flood == nodata] = np.nan
+
+    fraction = np.full(shape, np.nan, dtype='float32')
+    reproject(mask, fraction, src_transform=flood_transform, src_crs=flood_crs, dst_transform=transform, dst_crs=crs,
+              src_nodata=np.nan, dst_nodata=np.nan, resampling=Resampling.average)
+    return fraction
+
+
+def zone_ids(geometries, shape, transform, crs, ee_instance=None):
+    """
+    Rasterize geometries to an array of zone ids.
+
+    :param geometries: The geometries of the zones, e.g. admin units, in EPSG:4326, or a GeoDataFrame.
+    :param shape: The (y, x) shape of the grid.
+    :param transform: The affine transform of the grid.
+    :param crs: The CRS of the grid.
+    :param ee_instance: Optional Earth Engine instance for converting Earth Engine geometries.
+    :return: An int32 (y, x) array with the 1-based index of the zone of every cell, 0 outside all zones. Where zones
+             overlap, the later one wins.
+    """
+    if isinstance(geometries, gpd.GeoDataFrame):
+        geometries = list(geometries.to_crs('EPSG:4326').geometry)
+    shapes = [(transform_geom('EPSG:4326', crs, mapping(as_clip_geometry(geometry, ee_instance))), index)
+              for index, geometry in enumerate(geometries, start=1)]
+    return rasterize(shapes, out_shape=shape, transform=transform, fill=0, dtype='int32')
+
+
+def read_population(population_path):
+    """
+    Read a population count raster for repeated overlays.
+
+    :param population_path: The population count raster.
+    :return: A tuple of the float64 (y, x) population counts, the affine transform and the CRS. Nodata, NaN and
+             negative counts are set to 0.
+    """
+    with rasterio.open(population_path) as src:
+        population = src.read(1, out_dtype='float64')
+        if src.nodata is not None:
+            population[population == src.nodata] = 0
+        population[~np.isfinite(population) | (population < 0)] = 0
+        return population, src.transform, src.crs
+
+
+def flood_population_overlay(flood_path, population, flood_values=MODIS_FLOOD_VALUES, geometries=None,
+                             labels=None, ee_instance=None):
+    """
+    Compute the population living in flooded pixels by overlaying a flood raster on a population raster.
+
+    :param flood_path: The flood raster, e.g. a clipped MODIS NRT flood band.
+    :param population: The population count raster covering the flood raster, or the tuple returned by
+                       `read_population` when the same population is overlaid on several flood rasters.
+    :param flood_values: The classes counted as flooded.
+    :param geometries: Optional geometries or GeoDataFrame, e.g. admin units, to break the population down by.
+    :param labels: One label per geometry. Defaults to their index.
+    :param ee_instance: Optional Earth Engine instance for converting Earth Engine geometries.
+    :return: A dictionary with the 'population_impacted' and, when geometries are given, the population impacted of
+             every label in 'by_unit'.
+
+    The flood mask is resampled to the population grid and the population is summed with one masked, vectorized
+    operation. No flood polygon is built and nothing is sent to Earth Engine.
+
+    Example usage:
+        result = flood_population_overlay('modis_nrt_merged_2024_100_clipped.tif', 'population_2020.tif',
+                                          geometries=admin_units, labels=admin_names)
+        result['by_unit']
+    """
+    population, transform, crs = read_population(population) if isinstance(population, str) else population
+    shape = population.shape
+
+    with rasterio.open(flood_path) as src:
+        fraction = flood_fraction_on_grid(src.read(1), src.transform, src.crs, shape, transform, crs, flood_values,
+                                          src.nodata)
+
+    impacted = population * np.nan_to_num(fraction)
+    result = {'population_impacted': float(impacted.sum())}
+
+    if geometries is not None:
+        labels = labels if labels is not None else [str(index) for index in range(len(geometries))]
+        zones = zone_ids(geometries, shape, transform, crs, ee_instance)
+        totals = np.bincount(zones.ravel(), weights=impacted.ravel(), minlength=len(geometries) + 1)
+        result['by_unit'] = {label: float(total) for label, total in zip(labels, totals[1:])}
+
+    return result
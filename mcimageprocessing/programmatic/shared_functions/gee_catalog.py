@@ -0,0 +1,258 @@
+import bisect
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from mcimageprocessing.programmatic.shared_functions.cache import DEFAULT_CACHE_ROOT, read_json, write_json
+
+GEE_CATALOG_URL = 'https://raw.githubusercontent.com/samapriya/Earth-Engine-Datasets-List/master/gee_catalog.json'
+GEE_STAC_URL = 'https://storage.googleapis.com/earthengine-stac/catalog'
+
+
+def tokenize(text):
+    """
+    :param text: The text to split.
+    :return: The list of lowercase alphanumeric tokens of the text.
+    """
+    return re.findall(r'[a-z0-9]+', str(text).lower())
+
+
+class GEECatalogIndex:
+    """
+    Local, refreshable search index over the Earth Engine data catalog.
+
+    The catalog is downloaded once and stored in `index_path` with the id, title, tags, type, date range and, once
+    known, the band names of every dataset. An inverted index from tokens to dataset ids is built in memory, so
+    searches do not make any network request. Band names are not part of the catalog listing; they are read from the
+    Earth Engine STAC description of a dataset the first time they are needed, or for every dataset with
+    `refresh(include_bands=True)`, and stored in the index file. When the index is older than `max_age` and the
+    catalog cannot be downloaded, the index on disk is used as it is.
+
+    Example usage:
+        catalog = GEECatalogIndex()
+        datasets = catalog.search('modis ndvi', start_date='2020-01-01')
+        bands = catalog.get_bands(datasets[0]['id'])
+    """
+
+    def __init__(self, index_path: str = os.path.join(DEFAULT_CACHE_ROOT, 'gee_catalog.json'),
+                 catalog_url: str = GEE_CATALOG_URL, max_age: float = 7 * 24 * 3600):
+        """
+        Initialize the index. The catalog is loaded on first use.
+
+        :param index_path: The JSON file the index is stored in.
+        :param catalog_url: The URL of the catalog listing.
+        :param max_age: The age in seconds after which the index is downloaded again.
+        """
+        self.index_path = index_path
+        self.catalog_url = catalog_url
+        self.max_age = max_age
+        self.datasets = None
+        self._tokens = {}
+        self._sorted_tokens = []
+        self._lock = threading.Lock()
+        # The ids of the datasets whose bands are being fetched in the background
+        self._pending_bands = set()
+
+    # ==============================================================================
+    # PRIMARY FUNCTIONS
+    # ==============================================================================
+
+    def refresh(self, include_bands: bool = False, max_workers: int = 16) -> None:
+        """
+        Download the catalog listing and rebuild the index.
+
+        :param include_bands: Also fetch the band names of every dataset from the STAC catalog.
+        :param max_workers: The number of concurrent STAC requests when `include_bands` is True.
+        :return: None
+        """
+        response = requests.get(self.catalog_url, timeout=60)
+        response.raise_for_status()
+
+        previous = self.datasets or {}
+        datasets = {}
+        for item in response.json():
+            tags = item.get('tags') or []
+            if isinstance(tags, str):
+                tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+            datasets[item['id']] = {
+                'id': item['id'],
+                'title': item.get('title', item['id']),
+                'type': item.get('type'),
+                'tags': tags,
+                'start_date': item.get('start_date'),
+                'end_date': item.get('end_date'),
+                # Keep the bands fetched before the refresh, they rarely change
+                'bands': previous.get(item['id'], {}).get('bands')
+            }
+
+        with self._lock:
+            self.datasets = datasets
+            self._build_inverted_index()
+
+        if include_bands:
+            missing = [dataset_id for dataset_id, dataset in datasets.items() if dataset['bands'] is None]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for dataset_id, bands in zip(missing, executor.map(self._fetch_bands, missing)):
+                    datasets[dataset_id]['bands'] = bands
+            with self._lock:
+                self._build_inverted_index()
+
+        self._save()
+
+    def search(self, query: str, start_date: str = None, end_date: str = None, limit: int = None) -> list:
+        """
+        Search the catalog.
+
+        :param query: Free text. Every word must match the beginning of a word of the id, title, tags or bands.
+        :param start_date: Optional 'YYYY-MM-DD'. Datasets ending before this date are excluded.
+        :param end_date: Optional 'YYYY-MM-DD'. Datasets starting after this date are excluded.
+        :param limit: Optional maximum number of results.
+        :return: A list of dataset dictionaries, datasets matching in their title or id first.
+        """
+        self._ensure_loaded()
+
+        query_tokens = tokenize(query)
+        with self._lock:
+            if query_tokens:
+                matches = None
+                for token in query_tokens:
+                    token_matches = self._prefix_matches(token)
+                    matches = token_matches if matches is None else matches & token_matches
+            else:
+                matches = set(self.datasets)
+
+            results = [self.datasets[dataset_id] for dataset_id in matches
+                       if self._overlaps(self.datasets[dataset_id], start_date, end_date)]
+
+        def rank(dataset):
+            title_tokens = set(tokenize(dataset['title'])) | set(tokenize(dataset['id']))
+            title_hits = sum(any(title_token.startswith(token) for title_token in title_tokens)
+                             for token in query_tokens)
+            return -title_hits, dataset['title']
+
+        results.sort(key=rank)
+        return results[:limit] if limit else results
+
+    def get_dataset(self, dataset_id: str):
+        """
+        :param dataset_id: The Earth Engine id of the dataset.
+        :return: The dataset dictionary, or None if the dataset is not in the catalog.
+        """
+        self._ensure_loaded()
+        return self.datasets.get(dataset_id)
+
+    def get_date_range(self, dataset_id: str):
+        """
+        :param dataset_id: The Earth Engine id of the dataset.
+        :return: A list with the first and last date of the dataset as 'YYYY-MM-DD', or None if unknown.
+        """
+        dataset = self.get_dataset(dataset_id)
+        if dataset is None or not dataset['start_date'] or not dataset['end_date']:
+            return None
+        return [dataset['start_date'][:10], dataset['end_date'][:10]]
+
+    def get_bands(self, dataset_id: str, background: bool = False):
+        """
+        :param dataset_id: The Earth Engine id of the dataset.
+        :param background: If the bands are not in the index yet, fetch them in a background thread and return None
+                           instead of waiting for the STAC request. A later call returns them once they are fetched.
+        :return: The list of band names of the dataset, or None if they cannot be determined (yet).
+
+        Example usage:
+            bands = catalog.get_bands(dataset_id, background=True) or read_bands_from_earth_engine(dataset_id)
+        """
+        dataset = self.get_dataset(dataset_id)
+        if dataset is None:
+            return None
+        if dataset['bands'] is None:
+            if not background:
+                self._store_bands(dataset_id)
+            else:
+                with self._lock:
+                    if dataset_id in self._pending_bands:
+                        return None
+                    self._pending_bands.add(dataset_id)
+                threading.Thread(target=self._store_bands, args=(dataset_id,), daemon=True).start()
+                return None
+        return dataset['bands']
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    def _ensure_loaded(self):
+        if self.datasets is not None:
+            return
+        datasets = read_json(self.index_path)
+        if datasets is not None:
+            with self._lock:
+                self.datasets = datasets
+                self._build_inverted_index()
+            if time.time() - os.path.getmtime(self.index_path) < self.max_age:
+                return
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError) as e:
+            if self.datasets is None:
+                raise
+            # Keep working offline with the index on disk, it is refreshed on the next start
+            print(f"Could not refresh the Earth Engine catalog, using the index from {self.index_path}: {e}")
+
+    def _store_bands(self, dataset_id):
+        bands = self._fetch_bands(dataset_id)
+        with self._lock:
+            self._pending_bands.discard(dataset_id)
+            dataset = self.datasets.get(dataset_id)
+            if bands is None or dataset is None:
+                return
+            dataset['bands'] = bands
+            self._add_tokens(dataset_id, bands)
+            self._sorted_tokens = sorted(self._tokens)
+        self._save()
+
+    def _save(self):
+        with self._lock:
+            write_json(self.index_path, self.datasets)
+
+    def _build_inverted_index(self):
+        self._tokens = {}
+        for dataset_id, dataset in self.datasets.items():
+            self._add_tokens(dataset_id, [dataset_id, dataset['title']] + dataset['tags'] + (dataset['bands'] or []))
+        self._sorted_tokens = sorted(self._tokens)
+
+    def _add_tokens(self, dataset_id, texts):
+        for text in texts:
+            for token in tokenize(text):
+                self._tokens.setdefault(token, set()).add(dataset_id)
+
+    def _prefix_matches(self, prefix):
+        matches = set()
+        position = bisect.bisect_left(self._sorted_tokens, prefix)
+        while position < len(self._sorted_tokens) and self._sorted_tokens[position].startswith(prefix):
+            matches |= self._tokens[self._sorted_tokens[position]]
+            position += 1
+        return matches
+
+    @staticmethod
+    def _overlaps(dataset, start_date, end_date):
+        if start_date and dataset['end_date'] and dataset['end_date'][:10] < start_date:
+            return False
+        if end_date and dataset['start_date'] and dataset['start_date'][:10] > end_date:
+            return False
+        return True
+
+    @staticmethod
+    def _fetch_bands(dataset_id):
+        provider = dataset_id.split('/')[0]
+        url = f"{GEE_STAC_URL}/{provider}/{dataset_id.replace('/', '_')}.json"
+        try:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            bands = response.json().get('summaries', {}).get('eo:bands')
+        except (requests.RequestException, ValueError):
+            return None
+        return None if bands is None else [band['name'] for band in bands]
@@ -0,0 +1,171 @@
+import json
+
+import shapely
+from shapely.geometry import shape, Polygon, MultiPolygon, GeometryCollection
+from shapely.geometry.base import BaseGeometry
+
+METERS_PER_DEGREE = 111320.0  # Length of one degree of latitude, the longest degree in EPSG:4326
+DEFAULT_PREPARATION_SCALE = 100  # Finest analysis scale used by the APIs (WorldPop 100m)
+
+
+def scale_to_degrees(scale):
+    """
+    Convert a scale in meters to degrees.
+
+    :param scale: The scale in meters.
+    :return: The scale in degrees. One degree is taken as the length of a degree of latitude, so a distance in degrees
+             never corresponds to more than `scale` meters on the ground.
+    """
+    return scale / METERS_PER_DEGREE
+
+
+def as_shapely(geometry):
+    """
+    Convert a GeoJSON geometry, Feature or FeatureCollection dictionary to a Shapely geometry.
+
+    :param geometry: A GeoJSON dictionary or a Shapely geometry.
+    :return: A Shapely geometry. FeatureCollections are returned as a GeometryCollection of their features.
+    """
+    if isinstance(geometry, BaseGeometry):
+        return geometry
+    if isinstance(geometry, dict):
+        if geometry.get('type') == 'FeatureCollection':
+            return GeometryCollection([shape(feature['geometry']) for feature in geometry['features']])
+        if geometry.get('type') == 'Feature':
+            return shape(geometry['geometry'])
+        return shape(geometry)
+    raise TypeError("Input must be a Shapely geometry or a GeoJSON dictionary.")
+
+
+def as_geojson(geometry):
+    """
+    :param geometry: A Shapely geometry.
+    :return: The GeoJSON geometry dictionary, with lists for coordinates so it can be passed to ee.Geometry.
+    """
+    return json.loads(shapely.to_geojson(geometry))
+
+
+def polygon_parts(geometry):
+    """
+    :param geometry: A Shapely geometry.
+    :return: A list of the Polygons contained in the geometry. Points and lines are dropped.
+    """
+    if isinstance(geometry, Polygon):
+        return [] if geometry.is_empty else [geometry]
+    if isinstance(geometry, (MultiPolygon, GeometryCollection)):
+        parts = []
+        for part in geometry.geoms:
+            parts.extend(polygon_parts(part))
+        return parts
+    return []
+
+
+def remove_small_parts(geometry, min_area):
+    """
+    Remove polygons and holes smaller than the given area.
+
+    :param geometry: A Shapely geometry.
+    :param min_area: The minimum area, in squared units of the geometry, of polygons and holes to keep.
+    :return: A MultiPolygon without slivers and holes below `min_area`. If every polygon is below `min_area`, the
+             largest polygon is kept so that small areas of interest do not disappear.
+    """
+    parts = polygon_parts(geometry)
+    kept = []
+    for part in parts:
+        if part.area < min_area:
+            continue
+        holes = [interior for interior in part.interiors if Polygon(interior).area >= min_area]
+        kept.append(Polygon(part.exterior, holes))
+
+    if not kept and parts:
+        kept = [max(parts, key=lambda part: part.area)]
+
+    return MultiPolygon(kept)
+
+
+def prefilter_by_bbox(parts, region):
+    """
+    Keep only the parts that intersect a region, testing bounding boxes before exact geometries.
+
+    :param parts: A list of Shapely geometries.
+    :param region: The Shapely geometry of the region of interest.
+    :return: The parts that intersect the region, in their original order.
+    """
+    if not parts:
+        return []
+    tree = shapely.STRtree(parts)
+    # The tree only runs the exact intersects test on parts whose bounding box intersects the region
+    indices = sorted(tree.query(region, predicate='intersects'))
+    return [parts[index] for index in indices]
+
+
+def prepare_geometry(geometry, scale=DEFAULT_PREPARATION_SCALE, region=None, simplify_fraction=0.25,
+                     grid_fraction=0.05, min_area_fraction=0.1):
+    """
+    Shrink a geometry before it is serialized into an Earth Engine request.
+
+    :param geometry: A Shapely geometry or GeoJSON dictionary in EPSG:4326.
+    :param scale: The analysis scale in meters. Tolerances are expressed as fractions of one pixel at this scale.
+    :param region: Optional Shapely geometry or GeoJSON dictionary. Parts that do not intersect it are dropped, and an
+                   empty MultiPolygon is returned when no part intersects it.
+    :param simplify_fraction: The topology-preserving simplification tolerance, as a fraction of a pixel.
+    :param grid_fraction: The grid size coordinates are snapped to, as a fraction of a pixel.
+    :param min_area_fraction: Polygons and holes below this fraction of a pixel's area are removed. The default of a
+                              tenth of a pixel only removes slivers, so features of a single pixel are kept even after
+                              snapping shrinks them slightly.
+    :return: A Shapely MultiPolygon, or the input geometry unchanged if it has no polygons.
+
+    The steps are ordered from cheapest to most expensive: parts outside the region are rejected by bounding box,
+    slivers and holes are removed, the remaining rings are simplified with preserve_topology and
+    finally quantized onto a grid, which also removes duplicate vertices. With the default fractions no vertex moves
+    by more than a third of a pixel, so results at the analysis scale are unchanged.
+
+    Example usage:
+        geometry = prepare_geometry(uploaded_geojson, scale=250)
+        ee_geometry = ee.Geometry(as_geojson(geometry))
+    """
+    geometry = as_shapely(geometry)
+    if not geometry.is_valid:
+        geometry = shapely.make_valid(geometry)
+
+    pixel_size = scale_to_degrees(scale)
+    min_area = min_area_fraction * pixel_size ** 2
+
+    parts = polygon_parts(geometry)
+    if not parts:
+        # Points and lines are already small, there is nothing to prepare
+        return geometry
+    if region is not None:
+        parts = prefilter_by_bbox(parts, as_shapely(region))
+        if not parts:
+            return MultiPolygon()
+
+    geometry = remove_small_parts(MultiPolygon(parts), min_area)
+    geometry = geometry.simplify(simplify_fraction * pixel_size, preserve_topology=True)
+    geometry = shapely.set_precision(geometry, grid_fraction * pixel_size)
+
+    # Snapping to the grid can collapse narrow parts, so remove the ones that became slivers
+    return remove_small_parts(geometry, min_area)
+
+
+def prepare_geojson(geojson_obj, scale=DEFAULT_PREPARATION_SCALE, region=None):
+    """
+    Apply `prepare_geometry` to every geometry of a GeoJSON object, keeping its structure and properties.
+
+    :param geojson_obj: A GeoJSON FeatureCollection, Feature or geometry dictionary.
+    :param scale: The analysis scale in meters.
+    :param region: Optional region of interest, see `prepare_geometry`.
+    :return: A GeoJSON dictionary of the same type as the input.
+    """
+    if geojson_obj['type'] == 'FeatureCollection':
+        return {
+            'type': 'FeatureCollection',
+            'features': [prepare_geojson(feature, scale, region) for feature in geojson_obj['features']]
+        }
+    if geojson_obj['type'] == 'Feature':
+        return {
+            'type': 'Feature',
+            'properties': geojson_obj.get('properties') or {},
+            'geometry': as_geojson(prepare_geometry(geojson_obj['geometry'], scale, region))
+        }
+    return as_geojson(prepare_geometry(geojson_obj, scale, region))
@@ -0,0 +1,214 @@
+import bisect
+import datetime
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+
+from mcimageprocessing.programmatic.shared_functions.cache import DEFAULT_CACHE_ROOT, read_json, update_json
+
+
+class GloFasAvailabilityCalendar:
+    """
+    Persisted calendar of the dates available for every GloFAS product and system version.
+
+    The calendar of a (product, system_version) pair is built once from a date range, optionally restricted by the CDS
+    constraints of the dataset, and stored in `calendar_path`. Later builds only add the days after the last built day,
+    so the calendar is extended incrementally as new forecasts are published. Recorded download outcomes refine it:
+    a day for which CDS answered that no data is available is removed, and a day that was downloaded is added.
+
+    CDS constraints are lists of dictionaries mapping request keys to lists of valid values, as served next to the
+    download form of a dataset. They are fetched from `constraints_url` when one is given, formatted with the dataset
+    name, or can be passed to `build` directly. Without constraints the calendar starts from every day of the range and
+    relies on recorded outcomes.
+
+    The calendar file may be shared by several processes, e.g. the workers of `download_glofas_date_range`. Every change
+    re-reads the file and is applied to its current content under a file lock, so concurrent changes are merged.
+
+    Example usage:
+        calendar = GloFasAvailabilityCalendar()
+        calendar.build('cems-glofas-forecast', 'operational', datetime.date(2021, 5, 26))
+        dates = calendar.dates('cems-glofas-forecast', 'operational')
+        calendar.is_available('cems-glofas-forecast', 'operational', datetime.date(2023, 5, 1))
+    """
+
+    def __init__(self, calendar_path: str = os.path.join(DEFAULT_CACHE_ROOT, 'glofas_calendar.json'),
+                 constraints_url: str = None):
+        """
+        Initialize the calendar and load the persisted calendars.
+
+        :param calendar_path: The JSON file the calendars are stored in.
+        :param constraints_url: Optional URL of the CDS constraints of a dataset, with a '{dataset}' placeholder.
+        """
+        self.calendar_path = calendar_path
+        self.constraints_url = constraints_url
+        self._lock = threading.RLock()
+        self.calendars = self._load_calendars()
+        self._dates = {}
+
+    # ==============================================================================
+    # PRIMARY FUNCTIONS
+    # ==============================================================================
+
+    def build(self, product_name: str, system_version: str, start_date: datetime.date,
+              end_date: datetime.date = None, constraints: list = None) -> list:
+        """
+        Build or extend the calendar of a product and system version.
+
+        :param product_name: The CDS dataset name, e.g. 'cems-glofas-forecast'.
+        :param system_version: The system version, e.g. 'operational'.
+        :param start_date: The first day of the calendar.
+        :param end_date: The last day of the calendar. Defaults to yesterday.
+        :param constraints: Optional CDS constraints of the dataset. Fetched from `constraints_url` when not given.
+        :return: The sorted list of available dates.
+        """
+        end_date = end_date or datetime.date.today() - datetime.timedelta(days=1)
+        key = self._key(product_name, system_version)
+
+        with self._lock:
+            # Another process may have extended the calendar since it was loaded
+            self.calendars = self._load_calendars()
+            self._dates.clear()
+            calendar = self.calendars.get(key, {'start': start_date.isoformat(), 'end': start_date.isoformat(),
+                                                'dates': [], 'unavailable': []})
+            # Calendars holding only recorded outcomes have no 'updated' time and are built over the whole range
+            if 'updated' in calendar and calendar['start'] <= start_date.isoformat():
+                if calendar['end'] >= end_date.isoformat():
+                    return self.dates(product_name, system_version)
+                # Only add the days published since the last build
+                start_date = datetime.date.fromisoformat(calendar['end']) + datetime.timedelta(days=1)
+
+        if constraints is None and self.constraints_url:
+            constraints = self.fetch_constraints(product_name)
+
+        days = pd.date_range(start_date, end_date, freq='D')
+        if constraints:
+            days = days[self._constraints_mask(days, system_version, constraints)]
+        new_dates = set(days.strftime('%Y-%m-%d'))
+
+        def extend(calendar):
+            calendar = calendar or {'start': start_date.isoformat(), 'end': start_date.isoformat(), 'dates': [],
+                                    'unavailable': []}
+            calendar['dates'] = sorted(set(calendar['dates']) | (new_dates - set(calendar['unavailable'])))
+            calendar['start'] = min(calendar['start'], start_date.isoformat())
+            calendar['end'] = max(calendar['end'], end_date.isoformat())
+            calendar['updated'] = time.time()
+            return calendar
+
+        self._update_calendar(key, extend)
+        return self.dates(product_name, system_version)
+
+    def dates(self, product_name: str, system_version: str) -> list:
+        """
+        :param product_name: The CDS dataset name.
+        :param system_version: The system version.
+        :return: The sorted list of available datetime.date objects, empty if the calendar was never built.
+        """
+        key = self._key(product_name, system_version)
+        if key not in self._dates:
+            calendar = self.calendars.get(key, {'dates': []})
+            self._dates[key] = [datetime.date.fromisoformat(date) for date in calendar['dates']]
+        return self._dates[key]
+
+    def is_available(self, product_name: str, system_version: str, date: datetime.date):
+        """
+        :param product_name: The CDS dataset name.
+        :param system_version: The system version.
+        :param date: A datetime.date.
+        :return: True if the date is in the calendar, False if it is known to be unavailable, None if the calendar does
+                 not cover it.
+        """
+        calendar = self.calendars.get(self._key(product_name, system_version))
+        if calendar is None:
+            return None
+        if date.isoformat() in calendar['unavailable']:
+            return False
+        if not calendar['start'] <= date.isoformat() <= calendar['end']:
+            return None
+        position = bisect.bisect_left(calendar['dates'], date.isoformat())
+        return position < len(calendar['dates']) and calendar['dates'][position] == date.isoformat()
+
+    def record(self, product_name: str, system_version: str, dates, available: bool) -> None:
+        """
+        Record the outcome of a download for one or several days.
+
+        :param product_name: The CDS dataset name.
+        :param system_version: The system version.
+        :param dates: A datetime.date, or a list of them.
+        :param available: True if data was downloaded, False if CDS answered that no data is available.
+        :return: None
+        """
+        key = self._key(product_name, system_version)
+        days = [date.isoformat() for date in (dates if isinstance(dates, (list, tuple, set)) else [dates])]
+        if not days:
+            return
+
+        def apply(calendar):
+            calendar = calendar or {'start': min(days), 'end': max(days), 'dates': [], 'unavailable': []}
+            available_days = set(calendar['dates'])
+            unavailable_days = set(calendar['unavailable'])
+            if available:
+                available_days.update(days)
+                unavailable_days.difference_update(days)
+            else:
+                available_days.difference_update(days)
+                unavailable_days.update(days)
+            calendar['dates'], calendar['unavailable'] = sorted(available_days), sorted(unavailable_days)
+            return calendar
+
+        self._update_calendar(key, apply)
+
+    def fetch_constraints(self, product_name: str) -> list:
+        """
+        :param product_name: The CDS dataset name.
+        :return: The constraints served at `constraints_url`, or None if they could not be fetched.
+        """
+        try:
+            response = requests.get(self.constraints_url.format(dataset=product_name), timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Could not fetch the constraints of {product_name}: {e}")
+            return None
+
+    # ==============================================================================
+    # HELPER FUNCTIONS
+    # ==============================================================================
+
+    @staticmethod
+    def _constraints_mask(days, system_version, constraints):
+        # A day is valid if any constraint allowing the system version allows its year, month and day
+        mask = pd.Series(False, index=days)
+        years, months, day_numbers = days.year.astype(str), days.month, days.day
+        for constraint in constraints:
+            if system_version not in constraint.get('system_version', [system_version]):
+                continue
+            allowed = pd.Series(True, index=days)
+            if 'year' in constraint:
+                allowed &= years.isin([str(year) for year in constraint['year']])
+            if 'month' in constraint:
+                allowed &= months.isin([int(month) for month in constraint['month']])
+            if 'day' in constraint:
+                allowed &= day_numbers.isin([int(day) for day in constraint['day']])
+            mask |= allowed
+        return mask.to_numpy()
+
+    @staticmethod
+    def _key(product_name, system_version):
+        return f"{product_name}/{system_version}"
+
+    def _load_calendars(self):
+        return read_json(self.calendar_path, {})
+
+    def _update_calendar(self, key, change):
+        # Apply the change to the calendar as currently stored, which other processes may have changed
+        def update(calendars):
+            calendars = calendars or {}
+            calendars[key] = change(calendars.get(key))
+            return calendars
+
+        with self._lock:
+            self.calendars = update_json(self.calendar_path, update)
+            self._dates.clear()
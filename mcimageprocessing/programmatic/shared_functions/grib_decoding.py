@@ -0,0 +1,172 @@
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pygrib
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+# Arrays above this size in bytes are decoded into a memory-mapped file instead of memory
+MEMMAP_THRESHOLD_BYTES = 512 * 1024 ** 2
+
+
+class DecodedGrib:
+    """
+    The values of a GRIB file on a regular latitude/longitude grid, as a (member, leadtime, y, x) array.
+
+    Attributes:
+        data (numpy.ndarray): float32 array of shape (member, leadtime, y, x), NaN where the GRIB has no value. It is
+            a numpy.memmap for large files.
+        members (list): The ensemble member numbers along the first axis, 0 for the control forecast.
+        leadtimes (list): The lead times in hours along the second axis.
+        reference_date (datetime.date): The forecast reference date of the decoded messages.
+        transform (affine.Affine): The transform of the grid, north up.
+        crs (rasterio.crs.CRS): The coordinate reference system of the grid, EPSG:4326.
+
+    When the data is memory-mapped to a temporary file, the file belongs to the object and is removed by `close`, at
+    the end of a `with` block, or when the object is garbage collected.
+
+    Example usage:
+        with decode_grib('forecast.grib') as decoded:
+            ensemble_mean = np.nanmean(decoded.data, axis=0)
+    """
+
+    def __init__(self, data, members, leadtimes, reference_date, transform, temporary_directory=None):
+        self.data = data
+        self.members = members
+        self.leadtimes = leadtimes
+        self.reference_date = reference_date
+        self.transform = transform
+        self.crs = CRS.from_epsg(4326)
+        # tempfile.TemporaryDirectory holding the memory-mapped data, if decode_grib created one
+        self._temporary_directory = temporary_directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Remove the temporary file the data is memory-mapped to, if any. The data must not be used afterwards.
+
+        :return: None
+        """
+        if self._temporary_directory is not None:
+            self.data = None
+            self._temporary_directory.cleanup()
+            self._temporary_directory = None
+
+    @property
+    def shape(self):
+        """
+        :return: The (member, leadtime, y, x) shape of the data.
+        """
+        return self.data.shape
+
+    def rowcol(self, lons, lats):
+        """
+        Map coordinates to grid indices.
+
+        :param lons: An array of longitudes.
+        :param lats: An array of latitudes.
+        :return: A tuple of integer row and column arrays. Coordinates outside the grid get -1.
+        """
+        cols, rows = ~self.transform * (np.asarray(lons, dtype='float64'), np.asarray(lats, dtype='float64'))
+        rows, cols = np.floor(rows).astype(int), np.floor(cols).astype(int)
+        outside = (rows < 0) | (rows >= self.shape[2]) | (cols < 0) | (cols >= self.shape[3])
+        rows[outside] = -1
+        cols[outside] = -1
+        return rows, cols
+
+
+def read_message_keys(message):
+    """
+    :param message: A pygrib message.
+    :return: A tuple of the forecast reference date, ensemble member number and lead time in hours of the message.
+    """
+    reference_date = datetime.datetime.strptime(str(message.dataDate), '%Y%m%d').date()
+    member = message.perturbationNumber if message.valid_key('perturbationNumber') else 0
+    leadtime = message.endStep if message.valid_key('endStep') else message.step
+    return reference_date, int(member), int(leadtime)
+
+
+def grid_transform(message):
+    """
+    :param message: A pygrib message on a regular latitude/longitude grid.
+    :return: The north up affine transform of the grid cells.
+    """
+    dx = message.iDirectionIncrementInDegrees
+    dy = message.jDirectionIncrementInDegrees
+    north = max(message.latitudeOfFirstGridPointInDegrees, message.latitudeOfLastGridPointInDegrees)
+    west = message.longitudeOfFirstGridPointInDegrees
+    # Grid points are cell centres, the transform describes cell corners
+    return from_origin(west - dx / 2, north + dy / 2, dx, dy)
+
+
+def decode_grib(file_path, reference_date=None, members=None, leadtimes=None, memmap_path=None):
+    """
+    Decode the messages of a GRIB file into a (member, leadtime, y, x) array.
+
+    :param file_path: The GRIB file to decode.
+    :param reference_date: Optional datetime.date. Only messages of this forecast reference date are decoded. By
+                           default the first date of the file is used.
+    :param members: Optional list of ensemble member numbers to decode. By default every member is decoded.
+    :param leadtimes: Optional list of lead times in hours to decode. By default every lead time is decoded.
+    :param memmap_path: Optional file to memory-map the array to. Arrays larger than MEMMAP_THRESHOLD_BYTES are
+                        memory-mapped to a temporary file when no path is given, which is removed when the returned
+                        DecodedGrib is closed.
+    :return: A DecodedGrib.
+
+    The file is read twice: the first pass only reads the keys of the messages to size the array, the second decodes
+    the values of the selected messages straight into their slot of the array.
+
+    Example usage:
+        with decode_grib('cems-glofas-forecast_userdefined_0_2023_5_1.grib', leadtimes=[24, 48, 72]) as decoded:
+            ensemble_mean = np.nanmean(decoded.data, axis=0)
+    """
+    selected = []
+    with pygrib.open(file_path) as grib_file:
+        for message in grib_file:
+            message_date, member, leadtime = read_message_keys(message)
+            if reference_date is None:
+                reference_date = message_date
+            if message_date != reference_date:
+                continue
+            if (members is not None and member not in members) or (leadtimes is not None and leadtime not in leadtimes):
+                continue
+            selected.append((message.messagenumber, member, leadtime))
+            ny, nx = message.Nj, message.Ni
+            j_scans_positively = message.valid_key('jScansPositively') and message.jScansPositively == 1
+            transform = grid_transform(message)
+
+    if not selected:
+        raise ValueError(f"No messages matching the selection were found in {file_path}.")
+
+    member_values = sorted({member for _, member, _ in selected})
+    leadtime_values = sorted({leadtime for _, _, leadtime in selected})
+    member_index = {member: index for index, member in enumerate(member_values)}
+    leadtime_index = {leadtime: index for index, leadtime in enumerate(leadtime_values)}
+
+    shape = (len(member_values), len(leadtime_values), ny, nx)
+    temporary_directory = None
+    if memmap_path is None and np.prod(shape) * 4 > MEMMAP_THRESHOLD_BYTES:
+        temporary_directory = tempfile.TemporaryDirectory(prefix='grib_', ignore_cleanup_errors=True)
+        memmap_path = os.path.join(temporary_directory.name, 'decoded.dat')
+    if memmap_path is not None:
+        data = np.memmap(memmap_path, dtype='float32', mode='w+', shape=shape)
+        data[:] = np.nan
+    else:
+        data = np.full(shape, np.nan, dtype='float32')
+
+    with pygrib.open(file_path) as grib_file:
+        for message_number, member, leadtime in selected:
+            values = grib_file.message(message_number).values
+            values = np.ma.filled(np.ma.asarray(values, dtype='float32'), np.nan)
+            if j_scans_positively:
+                values = values[::-1]
+            data[member_index[member], leadtime_index[leadtime]] = values
+
+    return DecodedGrib(data, member_values, leadtime_values, reference_date, transform, temporary_directory)
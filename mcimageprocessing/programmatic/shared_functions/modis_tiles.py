@@ -0,0 +1,98 @@
+import functools
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, box
+from shapely.strtree import STRtree
+
+# Sphere radius and tile size in meters of the MODIS sinusoidal grid of 36 x 18 tiles
+SINUSOIDAL_RADIUS = 6371007.181
+SINUSOIDAL_TILE_SIZE = 1111950.5196666667
+SINUSOIDAL_TILES = (36, 18)
+# Tile size in degrees of the linear latitude/longitude grid used by some MODIS products
+GEOGRAPHIC_TILE_SIZE = 10
+GEOGRAPHIC_TILES = (36, 18)
+
+
+def sinusoidal_tile_polygon(h, v, samples=64):
+    """
+    Outline of a MODIS sinusoidal tile in longitude and latitude.
+
+    :param h: The horizontal tile index, 0 to 35.
+    :param v: The vertical tile index, 0 to 17.
+    :param samples: The number of latitudes at which the curved east and west edges are sampled.
+    :return: A Shapely Polygon in EPSG:4326, or None if the tile lies entirely outside the globe.
+
+    Tile rows do not cross the equator, so at every latitude the part of the tile on the globe is a single longitude
+    interval. The polygon is made of the western ends of these intervals going north and their eastern ends going
+    south.
+    """
+    x_min = -np.pi * SINUSOIDAL_RADIUS + h * SINUSOIDAL_TILE_SIZE
+    y_max = np.pi / 2 * SINUSOIDAL_RADIUS - v * SINUSOIDAL_TILE_SIZE
+    x_max, y_min = x_min + SINUSOIDAL_TILE_SIZE, y_max - SINUSOIDAL_TILE_SIZE
+
+    latitudes = np.clip(np.linspace(y_min, y_max, samples) / SINUSOIDAL_RADIUS, -np.pi / 2 + 1e-9, np.pi / 2 - 1e-9)
+    scale = SINUSOIDAL_RADIUS * np.cos(latitudes)
+    west = np.clip(np.degrees(x_min / scale), -180, 180)
+    east = np.clip(np.degrees(x_max / scale), -180, 180)
+
+    on_globe = east > west
+    if on_globe.sum() < 2:
+        return None
+    latitudes = np.degrees(latitudes[on_globe])
+    return Polygon(np.concatenate([np.column_stack([west[on_globe], latitudes]),
+                                   np.column_stack([east[on_globe], latitudes])[::-1]]))
+
+
+def geographic_tile_polygon(h, v):
+    """
+    :param h: The horizontal tile index, 0 to 35.
+    :param v: The vertical tile index, 0 to 17.
+    :return: The Shapely Polygon of a 10 degree tile of the linear latitude/longitude grid.
+    """
+    west = -180 + h * GEOGRAPHIC_TILE_SIZE
+    north = 90 - v * GEOGRAPHIC_TILE_SIZE
+    return box(west, north - GEOGRAPHIC_TILE_SIZE, west + GEOGRAPHIC_TILE_SIZE, north)
+
+
+@functools.lru_cache(maxsize=None)
+def tile_index(grid='sinusoidal'):
+    """
+    Precompute the tile polygons of a MODIS grid and index them.
+
+    :param grid: 'sinusoidal' for the MODIS land grid, or 'geographic' for the 10 degree latitude/longitude grid.
+    :return: A tuple of the list of (h, v) tiles and the STRtree of their polygons, in the same order.
+    """
+    if grid == 'sinusoidal':
+        columns, rows = SINUSOIDAL_TILES
+        make_polygon = sinusoidal_tile_polygon
+    elif grid == 'geographic':
+        columns, rows = GEOGRAPHIC_TILES
+        make_polygon = geographic_tile_polygon
+    else:
+        raise ValueError(f"Unknown MODIS tile grid: {grid}")
+
+    tiles, polygons = [], []
+    for h in range(columns):
+        for v in range(rows):
+            polygon = make_polygon(h, v)
+            if polygon is not None:
+                tiles.append((h, v))
+                polygons.append(polygon)
+    return tiles, STRtree(polygons)
+
+
+def tiles_for_geometry(geometry, grid='sinusoidal'):
+    """
+    Find the MODIS tiles a geometry intersects.
+
+    :param geometry: A Shapely geometry in EPSG:4326, e.g. the area of interest.
+    :param grid: 'sinusoidal' or 'geographic', see `tile_index`.
+    :return: The sorted list of (h, v) tiles intersecting the geometry itself, not only its bounding box.
+
+    Example usage:
+        tiles_for_geometry(shapely.geometry.box(30, -5, 42, 5))
+    """
+    tiles, tree = tile_index(grid)
+    shapely.prepare(geometry)
+    return sorted(tiles[position] for position in tree.query(geometry, predicate='intersects'))
@@ -0,0 +1,111 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from mcimageprocessing.programmatic.shared_functions.grib_decoding import decode_grib
+
+
+def station_grid_indices(decoded, stations, search_radius=0, id_column='station_id', lon_column='lon',
+                         lat_column='lat'):
+    """
+    Map station coordinates to grid indices.
+
+    :param decoded: A DecodedGrib.
+    :param stations: A DataFrame with one row per station.
+    :param search_radius: Number of cells around each station searched for the river cell. The cell with the highest
+                          mean discharge within the radius is used, since gauges are rarely exactly on the modelled
+                          river network.
+    :param id_column: The column with the station ids.
+    :param lon_column: The column with the station longitudes.
+    :param lat_column: The column with the station latitudes.
+    :return: A DataFrame with the station id, coordinates and 'row' and 'col' of every station inside the grid.
+    """
+    rows, cols = decoded.rowcol(stations[lon_column].to_numpy(), stations[lat_column].to_numpy())
+    inside = rows >= 0
+    rows, cols = rows[inside], cols[inside]
+
+    if search_radius > 0 and len(rows):
+        offsets = np.arange(-search_radius, search_radius + 1)
+        row_offsets, col_offsets = (offset.ravel() for offset in np.meshgrid(offsets, offsets, indexing='ij'))
+        # (station, offset) candidate cells, clipped to the grid
+        candidate_rows = np.clip(rows[:, np.newaxis] + row_offsets, 0, decoded.shape[2] - 1)
+        candidate_cols = np.clip(cols[:, np.newaxis] + col_offsets, 0, decoded.shape[3] - 1)
+
+        with warnings.catch_warnings():
+            # Cells off the river network are NaN for every member and lead time
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            mean_discharge = np.nanmean(decoded.data[:, :, candidate_rows, candidate_cols], axis=(0, 1))
+        mean_discharge = np.where(np.isnan(mean_discharge), -np.inf, mean_discharge)
+        best = np.argmax(mean_discharge, axis=1)
+        rows = candidate_rows[np.arange(len(rows)), best]
+        cols = candidate_cols[np.arange(len(cols)), best]
+
+    indices = stations.loc[inside, [id_column, lon_column, lat_column]].reset_index(drop=True)
+    indices['row'] = rows
+    indices['col'] = cols
+    return indices
+
+
+def extract_points(decoded, indices, id_column='station_id'):
+    """
+    Extract the value of every member and lead time at every station.
+
+    :param decoded: A DecodedGrib.
+    :param indices: The DataFrame returned by `station_grid_indices`.
+    :param id_column: The column with the station ids.
+    :return: A tidy DataFrame with one row per station, member and lead time, with the columns id_column,
+             'reference_date', 'member', 'leadtime_hour', 'valid_date' and 'value'.
+
+    All values are gathered with a single fancy indexing operation on the (member, leadtime, y, x) array.
+    """
+    # (member, leadtime, station)
+    values = np.asarray(decoded.data[:, :, indices['row'].to_numpy(), indices['col'].to_numpy()])
+    member_count, leadtime_count, station_count = values.shape
+
+    members = np.repeat(decoded.members, leadtime_count * station_count)
+    leadtimes = np.tile(np.repeat(decoded.leadtimes, station_count), member_count)
+    station_ids = np.tile(indices[id_column].to_numpy(), member_count * leadtime_count)
+    reference_time = pd.Timestamp(decoded.reference_date)
+
+    return pd.DataFrame({
+        id_column: station_ids,
+        'reference_date': decoded.reference_date,
+        'member': members,
+        'leadtime_hour': leadtimes,
+        'valid_date': reference_time + pd.to_timedelta(leadtimes, unit='h'),
+        'value': values.ravel()
+    })
+
+
+def extract_points_from_grib(file_paths, stations, search_radius=0, id_column='station_id', lon_column='lon',
+                             lat_column='lat'):
+    """
+    Extract station time series from GloFAS GRIB files.
+
+    :param file_paths: A GRIB file path, or a list of them, e.g. the daily files of a date range.
+    :param stations: A DataFrame with one row per station.
+    :param search_radius: Number of cells searched around each station, see `station_grid_indices`.
+    :param id_column: The column with the station ids.
+    :param lon_column: The column with the station longitudes.
+    :param lat_column: The column with the station latitudes.
+    :return: A tidy DataFrame with one row per station, reference date, member and lead time.
+
+    Station indices are computed once for the first file and reused for files on the same grid.
+
+    Example usage:
+        stations = pd.read_csv('gauges.csv')  # station_id, lon, lat
+        timeseries = extract_points_from_grib(file_paths, stations, search_radius=1)
+    """
+    file_paths = [file_paths] if isinstance(file_paths, str) else list(file_paths)
+    tables = []
+    indices, grid = None, None
+
+    for file_path in file_paths:
+        with decode_grib(file_path) as decoded:
+            if grid != (decoded.transform, decoded.shape[2:]):
+                indices = station_grid_indices(decoded, stations, search_radius, id_column, lon_column, lat_column)
+                grid = (decoded.transform, decoded.shape[2:])
+            tables.append(extract_points(decoded, indices, id_column))
+
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
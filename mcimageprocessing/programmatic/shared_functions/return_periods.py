@@ -0,0 +1,225 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import geometry_mask
+from rasterio.warp import reproject, Resampling
+from rasterio.windows import Window, from_bounds
+
+from mcimageprocessing.programmatic.shared_functions.cache import DEFAULT_CACHE_ROOT, LRUFileCache, hash_key
+from mcimageprocessing.programmatic.shared_functions.grib_decoding import decode_grib
+from mcimageprocessing.programmatic.shared_functions.utilities import as_clip_geometry
+
+
+class ReturnPeriodThresholds:
+    """
+    Return-period discharge thresholds, aligned to the grid of decoded GloFAS forecasts.
+
+    The thresholds are read from one raster per return period, e.g. the GloFAS flood threshold NetCDF files. Only the
+    window covering the forecast grid is read, resampled to it with nearest neighbour, and cached both in memory and
+    on disk, keyed by the threshold files and the grid. Forecasts of the same area reuse the aligned thresholds
+    without reading the threshold files again.
+
+    Example usage:
+        thresholds = ReturnPeriodThresholds({2: 'flood_threshold_rl_2.0.nc', 5: 'flood_threshold_rl_5.0.nc',
+                                             20: 'flood_threshold_rl_20.0.nc'})
+        return_periods, values = thresholds.aligned(decoded.transform, decoded.shape[2:])
+    """
+
+    def __init__(self, threshold_paths: dict, cache_directory: str = os.path.join(DEFAULT_CACHE_ROOT, 'return_periods'),
+                 max_bytes: int = 512 * 1024 ** 2):
+        """
+        :param threshold_paths: A dictionary mapping return periods in years to threshold raster paths.
+        :param cache_directory: The directory of the on-disk cache of aligned thresholds.
+        :param max_bytes: The maximum size of the on-disk cache in bytes.
+        """
+        self.threshold_paths = dict(sorted(threshold_paths.items()))
+        self.cache = LRUFileCache(cache_directory, max_bytes)
+        self._aligned = {}
+
+    @property
+    def return_periods(self):
+        """
+        :return: The sorted list of return periods.
+        """
+        return list(self.threshold_paths)
+
+    def aligned(self, transform, shape):
+        """
+        :param transform: The affine transform of the target grid, in EPSG:4326.
+        :param shape: The (y, x) shape of the target grid.
+        :return: A tuple of the return periods and a float32 (return_period, y, x) array of thresholds on the grid,
+                 NaN where no threshold is defined.
+        """
+        key = hash_key([(return_period, os.path.abspath(path), os.path.getmtime(path))
+                        for return_period, path in self.threshold_paths.items()], list(transform)[:6], list(shape))
+        if key in self._aligned:
+            return self.return_periods, self._aligned[key]
+
+        cached_path = self.cache.get_file(key)
+        if cached_path is not None:
+            values = np.load(cached_path)
+        else:
+            values = np.stack([self._align(path, transform, shape) for path in self.threshold_paths.values()])
+            temporary_path = os.path.join(self.cache.cache_directory, f"{key}.npy.tmp.npy")
+            np.save(temporary_path, values)
+            self.cache.put_file(key, temporary_path, move=True)
+
+        self._aligned[key] = values
+        return self.return_periods, values
+
+    @staticmethod
+    def _align(path, transform, shape):
+        destination = np.full(shape, np.nan, dtype='float32')
+        west, north = transform * (0, 0)
+        east, south = transform * (shape[1], shape[0])
+
+        with rasterio.open(path) as src:
+            # Read a window one source pixel larger than the target grid on every side
+            window = from_bounds(west, south, east, north, src.transform).round_offsets().round_lengths()
+            window = Window(window.col_off - 1, window.row_off - 1, window.width + 2, window.height + 2)
+            source = src.read(1, window=window, boundless=True, fill_value=np.nan, out_dtype='float32')
+            if src.nodata is not None and not np.isnan(src.nodata):
+                source[source == src.nodata] = np.nan
+
+            reproject(source, destination, src_transform=src.window_transform(window), src_crs=src.crs or 'EPSG:4326',
+                      dst_transform=transform, dst_crs='EPSG:4326', src_nodata=np.nan, dst_nodata=np.nan,
+                      resampling=Resampling.nearest)
+        return destination
+
+
+def compute_exceedance(data, thresholds, leadtimes, min_probability=0.5):
+    """
+    Compare every member and lead time of a forecast to return-period thresholds.
+
+    :param data: A (member, leadtime, y, x) discharge array, NaN where there is no value.
+    :param thresholds: A (return_period, y, x) array of thresholds on the same grid.
+    :param leadtimes: The lead times in hours along the second axis of `data`.
+    :param min_probability: The fraction of members that must exceed a threshold for a pixel to be flagged.
+    :return: A dictionary of arrays with a leading return period axis:
+             'probability' (return_period, leadtime, y, x), the fraction of valid members above the threshold;
+             'max_probability' (return_period, y, x), its maximum over lead times;
+             'exceeded' (return_period, y, x), True where the probability reaches `min_probability` at any lead time;
+             'first_leadtime' (return_period, y, x), the first lead time in hours at which it does, NaN otherwise.
+
+    The forecast is read one lead time at a time, so a memory-mapped `data` is never loaded as a whole, and every
+    return period is compared to all members of that lead time in one vectorized operation.
+    """
+    leadtimes = np.asarray(leadtimes, dtype='float32')
+    _, leadtime_count, ny, nx = data.shape
+    probability = np.full((len(thresholds), leadtime_count, ny, nx), np.nan, dtype='float32')
+    has_threshold = ~np.isnan(thresholds)
+
+    with warnings.catch_warnings():
+        # Pixels outside the river network or without a threshold are NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for leadtime_index in range(leadtime_count):
+            members = np.asarray(data[:, leadtime_index], dtype='float32')
+            valid_count = (~np.isnan(members)).sum(axis=0)
+            for threshold_index, threshold in enumerate(thresholds):
+                exceeding = (members > threshold).sum(axis=0)
+                probability[threshold_index, leadtime_index] = np.where(
+                    (valid_count > 0) & has_threshold[threshold_index], exceeding / np.maximum(valid_count, 1), np.nan)
+        max_probability = np.nanmax(probability, axis=1)
+
+    flagged = probability >= min_probability
+    exceeded = flagged.any(axis=1)
+    first_leadtime = np.where(exceeded, leadtimes[np.argmax(flagged, axis=1)], np.nan).astype('float32')
+
+    return {
+        'probability': probability,
+        'max_probability': max_probability,
+        'exceeded': exceeded,
+        'first_leadtime': first_leadtime
+    }
+
+
+def summarize_exceedance(exceedance, return_periods, transform, geometries, labels, ee_instance=None):
+    """
+    Summarize exceedance results per geometry.
+
+    :param exceedance: The dictionary returned by `compute_exceedance`.
+    :param return_periods: The return periods along the first axis of the results.
+    :param transform: The affine transform of the grid.
+    :param geometries: The geometries to summarize, in any format accepted by `clip_raster`.
+    :param labels: One label per geometry.
+    :param ee_instance: Optional Earth Engine instance for conversion.
+    :return: A DataFrame with one row per geometry and return period: the number of river pixels, the number of
+             flagged pixels, the maximum exceedance probability and the earliest first-exceedance lead time.
+    """
+    shape = exceedance['exceeded'].shape[1:]
+    river = ~np.isnan(exceedance['probability'][0]).all(axis=0)
+    rows = []
+    for geometry, label in zip(geometries, labels):
+        inside = ~geometry_mask([as_clip_geometry(geometry, ee_instance)], out_shape=shape, transform=transform,
+                                all_touched=True) & river
+        for index, return_period in enumerate(return_periods):
+            exceeded = exceedance['exceeded'][index] & inside
+            # River pixels without a threshold for this return period have no probability
+            probabilities = exceedance['max_probability'][index][inside]
+            probabilities = probabilities[~np.isnan(probabilities)]
+            rows.append({
+                'geometry': label,
+                'return_period': return_period,
+                'river_pixels': int(inside.sum()),
+                'exceeded_pixels': int(exceeded.sum()),
+                'max_probability': float(probabilities.max()) if probabilities.size else None,
+                'first_leadtime': float(np.nanmin(exceedance['first_leadtime'][index][exceeded]))
+                if exceeded.any() else None
+            })
+    return pd.DataFrame(rows)
+
+
+def return_period_exceedance(file_path, thresholds, output_folder=None, geometries=None, labels=None,
+                             min_probability=0.5, ee_instance=None):
+    """
+    Flag where a GloFAS forecast exceeds return-period thresholds.
+
+    :param file_path: The forecast GRIB file, control or ensemble.
+    :param thresholds: A ReturnPeriodThresholds.
+    :param output_folder: The folder the results are written to. Defaults to the folder of the GRIB file.
+    :param geometries: Optional geometries to summarize the results for.
+    :param labels: One label per geometry. Defaults to their index.
+    :param min_probability: The fraction of members that must exceed a threshold for a pixel to be flagged.
+    :param ee_instance: Optional Earth Engine instance for converting Earth Engine geometries.
+    :return: A dictionary with the 'rasters' written per return period and, when geometries are given, the
+             'summary' DataFrame, also written as CSV.
+
+    For every return period a GeoTIFF is written with the maximum exceedance probability, the exceedance mask and
+    the first-exceedance lead time as bands.
+
+    Example usage:
+        results = return_period_exceedance('forecast.grib', thresholds, geometries=admin_units, labels=names)
+        results['summary']
+    """
+    with decode_grib(file_path) as decoded:
+        height, width = decoded.shape[2:]
+        return_periods, threshold_values = thresholds.aligned(decoded.transform, (height, width))
+        exceedance = compute_exceedance(decoded.data, threshold_values, decoded.leadtimes, min_probability)
+
+    output_folder = output_folder or os.path.dirname(file_path)
+    prefix = os.path.splitext(os.path.basename(file_path))[0]
+    profile = {'driver': 'GTiff', 'dtype': 'float32', 'count': 3, 'height': height, 'width': width,
+               'transform': decoded.transform, 'crs': decoded.crs, 'nodata': np.nan,
+               'compress': 'DEFLATE', 'predictor': 3}
+
+    results = {'rasters': {}}
+    for index, return_period in enumerate(return_periods):
+        raster_path = os.path.join(output_folder, f"{prefix}_rp{return_period}_exceedance.tif")
+        with rasterio.open(raster_path, 'w', **profile) as dest:
+            dest.write(np.stack([exceedance['max_probability'][index],
+                                 exceedance['exceeded'][index].astype('float32'),
+                                 exceedance['first_leadtime'][index]]))
+            for band, description in enumerate(['max_probability', 'exceeded', 'first_leadtime_hours'], start=1):
+                dest.set_band_description(band, description)
+        results['rasters'][return_period] = raster_path
+
+    if geometries is not None:
+        labels = labels if labels is not None else [str(index) for index in range(len(geometries))]
+        summary = summarize_exceedance(exceedance, return_periods, decoded.transform, geometries, labels, ee_instance)
+        summary.to_csv(os.path.join(output_folder, f"{prefix}_return_period_summary.csv"), index=False)
+        results['summary'] = summary
+
+    return results
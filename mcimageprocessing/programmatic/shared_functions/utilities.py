@@ -6,7 +6,8 @@ import numpy as np
 import pygrib
 import rasterio
 from osgeo import gdal
-from rasterio.features import geometry_mask
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
 from rasterio.merge import merge
 from shapely.geometry import shape, Polygon, MultiPolygon, LineString, Point
 from rasterio.mask import mask as rasterio_mask
@@ -188,21 +189,16 @@ def inspect_grib_file(file_path: str):
     except Exception as e:
         print(f"An overall error occurred: {e}")
 
-@suppress_external_warnings
-def clip_raster(file_path, geometry, ee_instance=None):
+def as_clip_geometry(geometry, ee_instance=None):
     """
-    Clips a raster file based on a specified geometry.
+    Convert a geometry to the Shapely MultiPolygon used for clipping rasters.
 
-    :param file_path: The file path of the raster file to be clipped.
-    :param geometry: The geometry to be used for clipping. Can be a dictionary, an Earth Engine geometry, or a GeoDataFrame.
+    :param geometry: A dictionary (GeoJSON), an Earth Engine geometry, a GeoDataFrame or a Shapely geometry.
     :param ee_instance: Optional Earth Engine instance for conversion.
-    :return: The file path of the clipped raster file.
+    :return: A Shapely MultiPolygon in EPSG:4326.
     """
-    if file_path.endswith('.grib'):
-        print("GRIB file detected. Ensure appropriate handling is implemented.")
-
     # Convert Earth Engine geometry to shapely geometry if applicable
-    if isinstance(geometry, ee.Geometry) and ee_instance:
+    if isinstance(geometry, (ee.Geometry, ee.Feature)) and ee_instance:
         geometry = ee_instance.ee_geometry_to_shapely(geometry)
 
     # Convert geometry input to a Shapely geometry object if it's a dictionary (assuming GeoJSON)
@@ -217,6 +213,23 @@ def clip_raster(file_path, geometry, ee_instance=None):
     if not isinstance(geometry, MultiPolygon):
         geometry = MultiPolygon([geometry])
 
+    return geometry
+
+@suppress_external_warnings
+def clip_raster(file_path, geometry, ee_instance=None):
+    """
+    Clips a raster file based on a specified geometry.
+
+    :param file_path: The file path of the raster file to be clipped.
+    :param geometry: The geometry to be used for clipping. Can be a dictionary, an Earth Engine geometry, or a GeoDataFrame.
+    :param ee_instance: Optional Earth Engine instance for conversion.
+    :return: The file path of the clipped raster file.
+    """
+    if file_path.endswith('.grib'):
+        print("GRIB file detected. Ensure appropriate handling is implemented.")
+
+    geometry = as_clip_geometry(geometry, ee_instance)
+
     # Load the raster file
     with rasterio.open(file_path) as src:
         # Create a GeoDataFrame to handle the geometry
@@ -246,6 +259,61 @@ def clip_raster(file_path, geometry, ee_instance=None):
 
     return output_path
 
+@suppress_external_warnings
+def clip_raster_to_geometries(file_path, geometries, labels, ee_instance=None):
+    """
+    Clips a raster file to several geometries, reading the raster only once.
+
+    :param file_path: The file path of the raster file to be clipped.
+    :param geometries: The geometries to clip to, in any format accepted by `clip_raster`.
+    :param labels: One label per geometry, added to the output file names.
+    :param ee_instance: Optional Earth Engine instance for conversion.
+    :return: A dictionary mapping every label to the file path of its clipped raster. Geometries outside the raster
+             are left out.
+
+    Every output is cropped to the bounds of its geometry and masked outside it, like `clip_raster` does.
+
+    Example usage:
+        clipped = clip_raster_to_geometries('glofas_union.grib', admin_geometries, ['north', 'south'])
+    """
+    output_paths = {}
+
+    with rasterio.open(file_path) as src:
+        data = src.read()
+        nodata = -9999 if src.nodata is None else src.nodata
+
+        for geometry, label in zip(geometries, labels):
+            shapes = gpd.GeoSeries([as_clip_geometry(geometry, ee_instance)], crs="EPSG:4326").to_crs(src.crs)
+            try:
+                window = geometry_window(src, shapes)
+            except WindowError:
+                print(f"Geometry {label} does not overlap {file_path}.")
+                continue
+
+            row_start, col_start = int(window.row_off), int(window.col_off)
+            row_stop, col_stop = row_start + int(window.height), col_start + int(window.width)
+            out_transform = src.window_transform(window)
+
+            out_image = data[:, row_start:row_stop, col_start:col_stop].copy()
+            outside = geometry_mask(shapes, out_shape=out_image.shape[1:], transform=out_transform, all_touched=True)
+            out_image[:, outside] = nodata
+
+            out_meta = src.meta.copy()
+            out_meta.update({
+                'nodata': nodata,
+                "driver": "GTiff",
+                "height": out_image.shape[1],
+                "width": out_image.shape[2],
+                "transform": out_transform
+            })
+
+            output_path = f"{file_path.rsplit('.', 1)[0]}_{label}_clipped.tif"
+            with rasterio.open(output_path, "w", **out_meta) as dest:
+                dest.write(out_image)
+            output_paths[label] = output_path
+
+    return output_paths
+
 def calculate_bounds(input_geom):
     # Initialize min and max coordinates
     min_lat, min_lon, max_lat, max_lon = 90, 180, -90, -180
@@ -0,0 +1,177 @@
+import datetime
+import json
+import os
+
+import ee
+import pytest
+
+from mcimageprocessing.programmatic.APIs.EarthEngine import EarthEngineManager
+
+
+@pytest.fixture
+def ee_manager(monkeypatch):
+    # A manager without Earth Engine credentials, the geometries are passed through as they are
+    monkeypatch.setattr(EarthEngineManager, 'load_credentials', lambda self: None)
+    monkeypatch.setattr(EarthEngineManager, 'ee_ensure_geometry', lambda self, geometry: geometry)
+    return EarthEngineManager(use_result_cache=False)
+
+
+class FakeFeatureCollection:
+    # Client-side stand-in for the ee.FeatureCollection operations used to split a chunk
+    def __init__(self, features):
+        self.features = list(features)
+
+    def size(self):
+        return FakeValue(len(self.features))
+
+    def toList(self, count):
+        return FakeList(self.features[:count])
+
+    def select(self, *args):
+        return self
+
+
+class FakeValue:
+    def __init__(self, value):
+        self.value = value
+
+    def getInfo(self):
+        return self.value
+
+
+class FakeList(list):
+    def slice(self, start, end=None):
+        return self[start:end]
+
+
+class FakeImage:
+    # Reduces a chunk to the square of each feature index, runs out of memory above `capacity` features per tileScale
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.requests = []
+
+    def reduceRegions(self, collection, reducer, scale, tileScale):
+        self.requests.append((len(collection.features), tileScale))
+        if len(collection.features) > self.capacity * tileScale:
+            raise ee.EEException('User memory limit exceeded.')
+        return FakeFeatureCollection(dict(feature, mean=feature['_feature_index'] ** 2)
+                                     for feature in collection.features)
+
+
+@pytest.fixture
+def fake_collections(ee_manager, monkeypatch):
+    monkeypatch.setattr(ee, 'FeatureCollection', FakeFeatureCollection)
+    monkeypatch.setattr(EarthEngineManager, 'build_statistics_reducer', lambda self, statistics=None: 'reducer')
+    monkeypatch.setattr(EarthEngineManager, 'get_info', lambda self, reduced, max_age=None: {
+        'features': [{'properties': feature} for feature in reduced.features]})
+
+    def chunk_features(self, geometries, max_features, max_payload_bytes):
+        features = [{'_feature_index': index, 'name': name} for index, name in enumerate(geometries)]
+        for offset in range(0, len(features), max_features):
+            yield FakeFeatureCollection(features[offset:offset + max_features])
+
+    monkeypatch.setattr(EarthEngineManager, '_chunk_features_for_request', chunk_features)
+    return ee_manager
+
+
+def test_calculate_bulk_statistics_returns_one_row_per_geometry(fake_collections):
+    image = FakeImage(capacity=10)
+
+    table = fake_collections.calculate_bulk_statistics(image, ['a', 'b', 'c', 'd', 'e'], scale=100,
+                                                       max_features_per_request=2)
+
+    assert table.to_dict('records') == [{'name': name, 'mean': index ** 2} for index, name in enumerate('abcde')]
+    assert image.requests == [(2, 1), (2, 1), (1, 1)]
+
+
+def test_calculate_bulk_statistics_raises_the_tile_scale_then_splits(fake_collections):
+    image = FakeImage(capacity=1)
+
+    table = fake_collections.calculate_bulk_statistics(image, ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'], scale=100,
+                                                       max_features_per_request=8, max_tile_scale=4)
+
+    assert list(table['name']) == list('abcdefgh')
+    assert list(table['mean']) == [index ** 2 for index in range(8)]
+    # The chunk of 8 features is retried with tileScale 2 and 4, then split in two chunks that fit
+    assert image.requests == [(8, 1), (8, 2), (8, 4), (4, 4), (4, 4)]
+
+
+def test_calculate_bulk_statistics_raises_other_errors(fake_collections):
+    class FailingImage:
+        def reduceRegions(self, collection, reducer, scale, tileScale):
+            raise ee.EEException('Image.select: Pattern did not match any bands.')
+
+    with pytest.raises(ee.EEException):
+        fake_collections.calculate_bulk_statistics(FailingImage(), ['a'], scale=100)
+
+
+def test_plan_exports_clips_the_first_and_last_periods(ee_manager, tmp_path):
+    start_date, end_date = datetime.date(2020, 1, 15), datetime.date(2020, 3, 10)
+    date_ranges = ee_manager.generate_monthly_date_ranges(start_date, end_date)
+
+    exports = ee_manager._plan_exports(date_ranges, start_date, end_date, ['tile'], 'MODIS/061/MOD13Q1', 'NDVI',
+                                       'mean', str(tmp_path), overwrite=False)
+
+    assert [(export['start_date'], export['end_date']) for export in exports] == [
+        ('2020-01-15', '2020-01-31'), ('2020-02-01', '2020-02-29'), ('2020-03-01', '2020-03-10')]
+    assert exports[0]['file_name'] == 'MODIS_061_MOD13Q1_NDVI_2020_01_15_2020_01_31_mean.tif'
+    assert all(export['status'] == 'pending' for export in exports)
+
+
+def test_plan_exports_skips_existing_files(ee_manager, tmp_path):
+    start_date, end_date = datetime.date(2021, 1, 1), datetime.date(2021, 12, 31)
+    date_ranges = ee_manager.generate_yearly_date_ranges(start_date, end_date)
+    existing = tmp_path / 'MODIS_061_MOD13Q1_NDVI_2021_01_01_2021_12_31_max_tile_1.tif'
+    existing.write_bytes(b'image')
+    # An empty file is an interrupted download
+    (tmp_path / 'MODIS_061_MOD13Q1_NDVI_2021_01_01_2021_12_31_max_tile_0.tif').write_bytes(b'')
+
+    exports = ee_manager._plan_exports(date_ranges, start_date, end_date, ['tile 0', 'tile 1'], 'MODIS/061/MOD13Q1',
+                                       'NDVI', 'max', str(tmp_path), overwrite=False)
+    assert [(export['tile'], export['status']) for export in exports] == [(0, 'pending'), (1, 'skipped')]
+
+    exports = ee_manager._plan_exports(date_ranges, start_date, end_date, ['tile 0', 'tile 1'], 'MODIS/061/MOD13Q1',
+                                       'NDVI', 'max', str(tmp_path), overwrite=True)
+    assert [export['status'] for export in exports] == ['pending', 'pending']
+
+
+def test_process_images_writes_a_manifest_and_resumes(ee_manager, tmp_path, monkeypatch):
+    exported = []
+
+    def export_image(self, export, tile_geometry, image_collection, band, function, scale):
+        exported.append(export['start_date'])
+        if export['start_date'] == '2020-02-01' and len(exported) <= 3:
+            raise RuntimeError('Total request size must be less than or equal to 50331648 bytes.')
+        with open(export['file_path'], 'wb') as f:
+            f.write(b'image')
+
+    monkeypatch.setattr(EarthEngineManager, '_export_image', export_image)
+
+    manifest = ee_manager.process_images('2020-01-01', '2020-03-31', 'MODIS/061/MOD13Q1', 'NDVI', 'geometry',
+                                         'monthly', 'mean', output_folder=str(tmp_path))
+
+    assert sorted(exported) == ['2020-01-01', '2020-02-01', '2020-03-01']
+    statuses = {export['start_date']: export['status'] for export in manifest['exports']}
+    assert statuses == {'2020-01-01': 'exported', '2020-02-01': 'failed', '2020-03-01': 'exported'}
+    with open(os.path.join(tmp_path, 'manifest.json')) as f:
+        assert json.load(f)['exports'] == manifest['exports']
+
+    # Running the export again only retries the failed period
+    manifest = ee_manager.process_images('2020-01-01', '2020-03-31', 'MODIS/061/MOD13Q1', 'NDVI', 'geometry',
+                                         'monthly', 'mean', output_folder=str(tmp_path))
+
+    assert exported[3:] == ['2020-02-01']
+    statuses = {export['start_date']: export['status'] for export in manifest['exports']}
+    assert statuses == {'2020-01-01': 'skipped', '2020-02-01': 'exported', '2020-03-01': 'skipped'}
+
+
+def test_process_images_accepts_the_deprecated_country_keyword(ee_manager, tmp_path, monkeypatch):
+    tiles = []
+    monkeypatch.setattr(EarthEngineManager, '_export_image',
+                        lambda self, export, tile_geometry, *args: tiles.append(tile_geometry))
+
+    with pytest.deprecated_call():
+        ee_manager.process_images('2020-01-01', '2020-01-31', 'MODIS/061/MOD13Q1', 'NDVI', country='Kenya',
+                                  aggregation_type='monthly', function='mean', output_folder=str(tmp_path))
+
+    assert tiles == ['Kenya']
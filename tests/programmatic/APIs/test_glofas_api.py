@@ -0,0 +1,46 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from shapely.geometry import box, mapping
+
+from mcimageprocessing.programmatic.APIs import GloFasAPI as glofas_module
+from mcimageprocessing.programmatic.APIs.GloFasAPI import GloFasAPI, run_glofas_job
+
+
+def test_concurrent_jobs_write_to_separate_folders(tmp_path, monkeypatch):
+    # An instance without clients, the download is replaced by one writing the bounds of the job
+    api = GloFasAPI.__new__(GloFasAPI)
+    api.ee_instance = None
+
+    def download_glofas_data(bbox, params, index=None, distinct_values=None):
+        file_path = os.path.join(params['folder_location'],
+                                 api._build_file_name(params, 0, distinct_values, params['year'], params['month'],
+                                                      params['day']))
+        with open(file_path, 'w') as f:
+            f.write(str(bbox['minx'][0]))
+        # Keep both jobs running at the same time
+        time.sleep(0.2)
+        return file_path
+
+    monkeypatch.setattr(api, 'download_glofas_data', download_glofas_data)
+    monkeypatch.setattr(glofas_module, 'process_and_clip_raster',
+                        lambda file_path, geometry, params, ee_instance: file_path)
+    monkeypatch.setattr(glofas_module, '_worker_api', api)
+
+    params = {'glofas_product': 'cems-glofas-forecast', 'folder_location': str(tmp_path), 'year': 2023, 'month': 5,
+              'day': 1}
+    geometries = [mapping(box(0, 0, 1, 1)), mapping(box(2, 0, 3, 1))]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(lambda geometry: run_glofas_job(geometry, params), geometries))
+
+    assert [len(rasters) for rasters in results] == [1, 1]
+    folders = {os.path.dirname(rasters[0]) for rasters in results}
+    assert len(folders) == 2
+    for rasters, minx in zip(results, ['0.0', '2.0']):
+        with open(rasters[0]) as f:
+            assert f.read() == minx
+        assert os.path.exists(os.path.join(os.path.dirname(rasters[0]), 'geometry.geojson'))
+    assert params == {'glofas_product': 'cems-glofas-forecast', 'folder_location': str(tmp_path), 'year': 2023,
+                      'month': 5, 'day': 1}
@@ -0,0 +1,52 @@
+import numpy as np
+from osgeo import gdal, osr
+from shapely.geometry import box
+
+from mcimageprocessing.programmatic.APIs.ModisNRT import warp_modis_granules
+
+
+def write_granule(path, origin_x, value):
+    # A 4 x 4 pixel GeoTIFF with two pages, which GDAL lists as subdatasets like the bands of an HDF granule
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    for page, fill in enumerate([0, value]):
+        dataset = gdal.GetDriverByName('GTiff').Create(str(path), 4, 4, 1, gdal.GDT_Byte,
+                                                       options=['APPEND_SUBDATASET=YES'] if page else [])
+        dataset.SetGeoTransform((origin_x, 1, 0, 4, 0, -1))
+        dataset.SetProjection(srs.ExportToWkt())
+        band = dataset.GetRasterBand(1)
+        band.SetNoDataValue(255)
+        band.WriteArray(np.full((4, 4), fill, dtype='uint8'))
+        dataset = None
+    return str(path)
+
+
+def read_output(path):
+    dataset = gdal.Open(path)
+    return dataset.GetGeoTransform(), dataset.GetRasterBand(1).ReadAsArray()
+
+
+def test_warp_modis_granules_mosaics_the_subdataset(tmp_path):
+    granules = [write_granule(tmp_path / 'west.tif', 0, 3), write_granule(tmp_path / 'east.tif', 4, 1)]
+    output_path = str(tmp_path / 'merged.tif')
+
+    assert warp_modis_granules(granules, 1, output_path, num_threads=1) == output_path
+
+    transform, array = read_output(output_path)
+    assert transform == (0, 1, 0, 4, 0, -1)
+    np.testing.assert_array_equal(array, np.hstack([np.full((4, 4), 3), np.full((4, 4), 1)]))
+
+
+def test_warp_modis_granules_crops_to_the_cutline(tmp_path):
+    granules = [write_granule(tmp_path / 'west.tif', 0, 3), write_granule(tmp_path / 'east.tif', 4, 1)]
+    output_path = str(tmp_path / 'clipped.tif')
+
+    warp_modis_granules(granules, 1, output_path, clip_geometry=box(2, 1, 6, 3), num_threads=1)
+
+    transform, array = read_output(output_path)
+    assert transform == (2, 1, 0, 3, 0, -1)
+    np.testing.assert_array_equal(array, [[3, 3, 1, 1],
+                                          [3, 3, 1, 1]])
+    # The in-memory mosaic and cutline are removed
+    assert gdal.VSIStatL('/vsimem/clipped.tif.vrt') is None
+    assert gdal.VSIStatL('/vsimem/clipped.tif.geojson') is None
@@ -0,0 +1,58 @@
+import time
+
+from mcimageprocessing.programmatic.shared_functions.cache import LRUFileCache, hash_key
+
+
+def test_hash_key_is_stable_and_order_independent_for_dictionaries():
+    assert hash_key('dataset', {'year': 2020, 'month': 5}) == hash_key('dataset', {'month': 5, 'year': 2020})
+    assert hash_key('dataset', {'year': 2020}) != hash_key('dataset', {'year': 2021})
+
+
+def test_lru_file_cache_round_trip(tmp_path):
+    cache = LRUFileCache(str(tmp_path / 'cache'))
+    cache.put_json('key', {'population': 1234}, metadata={'year': 2020})
+
+    assert cache.get_json('key') == {'population': 1234}
+    assert cache.get_metadata('key') == {'year': 2020}
+    assert cache.get_json('missing', default='default') == 'default'
+
+
+def test_lru_file_cache_evicts_least_recently_used(tmp_path):
+    value = 'x' * 100
+    cache = LRUFileCache(str(tmp_path / 'cache'), max_bytes=250)
+    cache.put_json('first', value)
+    cache.put_json('second', value)
+    # Using the first entry makes the second one the least recently used
+    assert cache.get_json('first') == value
+
+    cache.put_json('third', value)
+
+    assert cache.get_json('second') is None
+    assert cache.get_json('first') == value
+    assert cache.get_json('third') == value
+
+
+def test_lru_file_cache_expires_old_entries(tmp_path, monkeypatch):
+    cache = LRUFileCache(str(tmp_path / 'cache'))
+    cache.put_json('key', 'value')
+    assert cache.get_json('key', max_age=60) == 'value'
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+
+    assert cache.get_json('key', max_age=60) is None
+    # The expired entry is removed, not only skipped
+    assert cache.get_json('key') is None
+
+
+def test_lru_file_cache_is_shared_between_instances(tmp_path):
+    source = tmp_path / 'source.tif'
+    source.write_bytes(b'raster')
+    writer = LRUFileCache(str(tmp_path / 'cache'))
+    reader = LRUFileCache(str(tmp_path / 'cache'))
+
+    cached_path = writer.put_file('raster', str(source))
+
+    assert reader.get_file('raster') == cached_path
+    reader.invalidate('raster')
+    assert writer.get_file('raster') is None
@@ -0,0 +1,112 @@
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import cdsapi
+import pytest
+
+from mcimageprocessing.programmatic.shared_functions.cds_jobs import CDSJobQueue
+
+
+class FakeCDSHandler(BaseHTTPRequestHandler):
+    # A CDS server whose jobs run for one poll and complete on the next, requests with 'fail' set fail instead
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, value, status=200):
+        body = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        job_id = f"job-{next(self.server.counter)}"
+        self.server.jobs[job_id] = {'request': request, 'polls': 0}
+        self.send_json({'state': 'queued', 'request_id': job_id})
+
+    def do_GET(self):
+        job_id = self.path.rsplit('/', 1)[-1]
+        if job_id not in self.server.jobs:
+            return self.send_json({'message': 'Not found'}, 404)
+        job = self.server.jobs[job_id]
+        if self.path.startswith('/files/'):
+            body = job_id.encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        job['polls'] += 1
+        if job['request'].get('fail'):
+            return self.send_json({'state': 'failed', 'request_id': job_id,
+                                   'error': {'message': 'No data is available within your requested subset'}})
+        if job['polls'] < 2:
+            return self.send_json({'state': 'running', 'request_id': job_id})
+        self.send_json({'state': 'completed', 'request_id': job_id, 'content_length': len(job_id),
+                        'location': f"http://127.0.0.1:{self.server.server_port}/files/{job_id}"})
+
+    def do_DELETE(self):
+        self.server.deleted.append(self.path.rsplit('/', 1)[-1])
+        self.send_json({})
+
+
+@pytest.fixture
+def cds_server():
+    server = HTTPServer(('127.0.0.1', 0), FakeCDSHandler)
+    server.jobs, server.deleted, server.counter = {}, [], itertools.count()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(cds_server):
+    return cdsapi.Client(url=f"http://127.0.0.1:{cds_server.server_port}/api", key='1:fake', quiet=True,
+                         wait_until_complete=False, delete=False, retry_max=1, sleep_max=0)
+
+
+def test_submit_poll_and_download(tmp_path, cds_server, client):
+    queue = CDSJobQueue(client, state_path=str(tmp_path / 'jobs.json'), poll_interval=0.01)
+    first = queue.submit('cems-glofas-forecast', {'day': '01'}, str(tmp_path / 'first.grib'))
+    second = queue.submit('cems-glofas-forecast', {'day': '02'}, str(tmp_path / 'second.grib'))
+    failing = queue.submit('cems-glofas-forecast', {'day': '03', 'fail': True}, str(tmp_path / 'failing.grib'))
+
+    # Both requests are queued on the server before any result is awaited
+    assert len(cds_server.jobs) == 3
+    assert queue.pending() == [first, second, failing]
+
+    jobs = {job['job_id']: job for job in queue.as_completed(timeout=10)}
+
+    assert jobs[first]['state'] == jobs[second]['state'] == 'downloaded'
+    assert (tmp_path / 'first.grib').read_bytes() == first.encode()
+    assert (tmp_path / 'second.grib').read_bytes() == second.encode()
+    assert jobs[failing]['state'] == 'failed'
+    assert 'No data is available' in jobs[failing]['error']
+    # Downloaded jobs are deleted on the server
+    assert sorted(cds_server.deleted) == sorted([first, second])
+    assert queue.pending() == []
+
+
+def test_identical_requests_reattach_after_a_restart(tmp_path, cds_server, client):
+    state_path = str(tmp_path / 'jobs.json')
+    job_id = CDSJobQueue(client, state_path=state_path).submit('cems-glofas-forecast', {'day': '01'},
+                                                                str(tmp_path / 'first.grib'))
+
+    # A new queue, e.g. in a restarted kernel, reattaches to the job instead of submitting it again
+    queue = CDSJobQueue(client, state_path=state_path, poll_interval=0.01)
+    assert queue.submit('cems-glofas-forecast', {'day': '01'}, str(tmp_path / 'first.grib')) == job_id
+    assert len(cds_server.jobs) == 1
+
+    jobs = list(queue.as_completed(timeout=10))
+
+    assert [(job['job_id'], job['state']) for job in jobs] == [(job_id, 'downloaded')]
+    assert (tmp_path / 'first.grib').read_bytes() == job_id.encode()
+    # A downloaded result whose file still exists is not requested again
+    assert queue.submit('cems-glofas-forecast', {'day': '01'}, str(tmp_path / 'first.grib')) == job_id
+    assert len(cds_server.jobs) == 1
@@ -0,0 +1,61 @@
+import datetime
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from mcimageprocessing.programmatic.shared_functions.flood_datacube import FloodDatacube
+
+
+def write_flood_raster(path, array):
+    with rasterio.open(path, 'w', driver='GTiff', height=array.shape[0], width=array.shape[1], count=1,
+                       dtype='uint8', crs='EPSG:4326', transform=from_origin(30, 5, 0.5, 0.5), nodata=255) as dst:
+        dst.write(array.astype('uint8'), 1)
+    return str(path)
+
+
+def build_cube(tmp_path, days, chunk_days=2):
+    cube = FloodDatacube(str(tmp_path / 'cube'), chunk_days=chunk_days)
+    for date, values in days.items():
+        cube.append(write_flood_raster(tmp_path / f"{date}.tif", np.array([values])), date)
+    return cube
+
+
+def test_flood_datacube_statistics(tmp_path):
+    start = datetime.date(2024, 1, 1)
+    # Two pixels over four days, 3 is flooded, 0 is dry and 255 has no data
+    cube = build_cube(tmp_path, {start + datetime.timedelta(days=offset): values
+                                 for offset, values in enumerate([[3, 255], [3, 0], [0, 3], [3, 255]])})
+
+    statistics = cube.statistics()
+
+    np.testing.assert_array_equal(statistics['flood_days'], [[3, 1]])
+    np.testing.assert_array_equal(statistics['valid_days'], [[4, 2]])
+    np.testing.assert_allclose(statistics['flood_frequency'], [[0.75, 0.5]])
+    np.testing.assert_array_equal(statistics['max_flood_duration'], [[2, 1]])
+    np.testing.assert_array_equal(statistics['first_flood_day'], [[0, 2]])
+    np.testing.assert_array_equal(statistics['last_flood_day'], [[3, 2]])
+
+
+def test_flood_datacube_missing_day_ends_a_run(tmp_path):
+    start = datetime.date(2024, 1, 1)
+    cube = build_cube(tmp_path, {start: [3], start + datetime.timedelta(days=1): [3],
+                                 start + datetime.timedelta(days=3): [3]})
+
+    statistics = cube.statistics()
+
+    np.testing.assert_array_equal(statistics['max_flood_duration'], [[2]])
+    np.testing.assert_array_equal(statistics['last_flood_day'], [[3]])
+
+
+def test_flood_datacube_accepts_days_out_of_order(tmp_path):
+    start = datetime.date(2024, 1, 1)
+    dates = [start + datetime.timedelta(days=offset) for offset in (4, 0, 2, 1, 3)]
+    cube = build_cube(tmp_path, {date: [(date - start).days] for date in dates})
+    # Appending a day again replaces its slice
+    cube.append(write_flood_raster(tmp_path / 'replaced.tif', np.array([[3]])), start + datetime.timedelta(days=2))
+
+    cube = FloodDatacube(str(tmp_path / 'cube'))
+
+    assert cube.dates == sorted(dates)
+    np.testing.assert_array_equal(cube.read()[:, 0, 0], [0, 1, 3, 3, 4])
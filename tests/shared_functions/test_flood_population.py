@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from mcimageprocessing.programmatic.shared_functions.flood_population import flood_population_overlay
+
+# Flooded, dry and nodata pixels on a 2 x 2 grid of 1 degree cells, from 30E 5N
+FLOOD = np.array([[3, 0],
+                  [3, 255]], dtype='uint8')
+
+
+def write_raster(path, array, transform, nodata):
+    with rasterio.open(path, 'w', driver='GTiff', height=array.shape[0], width=array.shape[1], count=1,
+                       dtype=array.dtype, crs='EPSG:4326', transform=transform, nodata=nodata) as dst:
+        dst.write(array, 1)
+    return str(path)
+
+
+@pytest.fixture
+def flood_path(tmp_path):
+    return write_raster(tmp_path / 'flood.tif', FLOOD, from_origin(30, 5, 1, 1), 255)
+
+
+def test_flood_population_overlay_on_the_same_grid(tmp_path, flood_path):
+    population = np.array([[10, 20],
+                           [30, -1]], dtype='float32')
+    population_path = write_raster(tmp_path / 'population.tif', population, from_origin(30, 5, 1, 1), -1)
+
+    result = flood_population_overlay(flood_path, population_path)
+
+    assert result['population_impacted'] == pytest.approx(40)
+
+
+def test_flood_population_overlay_on_a_coarser_grid(tmp_path, flood_path):
+    # One population cell covers the whole flood raster, two of its three valid pixels are flooded
+    population_path = write_raster(tmp_path / 'population.tif', np.array([[90]], dtype='float32'),
+                                   from_origin(30, 5, 2, 2), None)
+
+    result = flood_population_overlay(flood_path, population_path)
+
+    assert result['population_impacted'] == pytest.approx(60)
+
+
+def test_flood_population_overlay_by_unit(tmp_path, flood_path):
+    population = np.array([[10, 20],
+                           [30, 40]], dtype='float32')
+    population_path = write_raster(tmp_path / 'population.tif', population, from_origin(30, 5, 1, 1), None)
+    units = [box(30, 4, 32, 5), box(30, 3, 32, 4)]
+
+    result = flood_population_overlay(flood_path, population_path, geometries=units, labels=['north', 'south'])
+
+    assert result['by_unit'] == pytest.approx({'north': 10, 'south': 30})
+    assert result['population_impacted'] == pytest.approx(40)
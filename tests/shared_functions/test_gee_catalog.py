@@ -0,0 +1,114 @@
+import json
+import os
+import time
+
+import pytest
+import requests
+
+from mcimageprocessing.programmatic.shared_functions import gee_catalog as gee_catalog_module
+from mcimageprocessing.programmatic.shared_functions.gee_catalog import GEECatalogIndex
+
+DATASETS = {
+    'MODIS/061/MOD13Q1': {'id': 'MODIS/061/MOD13Q1', 'title': 'MOD13Q1.061 Terra Vegetation Indices 16-Day Global',
+                          'type': 'image_collection', 'tags': ['ndvi', 'evi', 'modis'], 'start_date': '2000-02-18',
+                          'end_date': '2024-12-31', 'bands': None},
+    'MODIS/006/MOD13Q1': {'id': 'MODIS/006/MOD13Q1', 'title': 'MOD13Q1.006 Terra Vegetation Indices 16-Day Global',
+                          'type': 'image_collection', 'tags': ['ndvi', 'evi', 'modis'], 'start_date': '2000-02-18',
+                          'end_date': '2023-02-18', 'bands': None},
+    'JRC/GSW1_4/GlobalSurfaceWater': {'id': 'JRC/GSW1_4/GlobalSurfaceWater', 'title': 'JRC Global Surface Water',
+                                      'type': 'image', 'tags': ['water', 'surface'], 'start_date': '1984-03-16',
+                                      'end_date': '2022-01-01', 'bands': ['occurrence', 'seasonality']}
+}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def offline(*args, **kwargs):
+    raise requests.ConnectionError('offline')
+
+
+def write_index(path, age=0):
+    with open(path, 'w') as f:
+        json.dump(DATASETS, f)
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+    return str(path)
+
+
+def test_search_matches_prefixes_and_ranks_titles_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(gee_catalog_module.requests, 'get', offline)
+    catalog = GEECatalogIndex(index_path=write_index(tmp_path / 'index.json'))
+
+    assert {dataset['id'] for dataset in catalog.search('veg ndv')} == {'MODIS/061/MOD13Q1', 'MODIS/006/MOD13Q1'}
+    # Bands are searchable as well
+    assert [dataset['id'] for dataset in catalog.search('occurrence')] == ['JRC/GSW1_4/GlobalSurfaceWater']
+    assert [dataset['id'] for dataset in catalog.search('water')] == ['JRC/GSW1_4/GlobalSurfaceWater']
+    assert catalog.search('modis landsat') == []
+    assert len(catalog.search('', limit=2)) == 2
+
+
+def test_search_filters_by_date_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(gee_catalog_module.requests, 'get', offline)
+    catalog = GEECatalogIndex(index_path=write_index(tmp_path / 'index.json'))
+
+    assert [dataset['id'] for dataset in catalog.search('mod13q1', start_date='2023-06-01')] == ['MODIS/061/MOD13Q1']
+    assert catalog.search('water', end_date='1980-01-01') == []
+    assert catalog.get_date_range('JRC/GSW1_4/GlobalSurfaceWater') == ['1984-03-16', '2022-01-01']
+
+
+def test_stale_index_is_used_when_the_refresh_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(gee_catalog_module.requests, 'get', offline)
+    catalog = GEECatalogIndex(index_path=write_index(tmp_path / 'index.json', age=30 * 24 * 3600))
+
+    assert [dataset['id'] for dataset in catalog.search('water')] == ['JRC/GSW1_4/GlobalSurfaceWater']
+
+
+def test_missing_index_without_network_raises(tmp_path, monkeypatch):
+    monkeypatch.setattr(gee_catalog_module.requests, 'get', offline)
+    catalog = GEECatalogIndex(index_path=str(tmp_path / 'index.json'))
+
+    with pytest.raises(requests.ConnectionError):
+        catalog.search('water')
+
+
+def test_stale_index_is_refreshed(tmp_path, monkeypatch):
+    listing = [{'id': 'JRC/GSW1_4/GlobalSurfaceWater', 'title': 'JRC Global Surface Water', 'type': 'image',
+                'tags': 'water, surface', 'start_date': '1984-03-16', 'end_date': '2023-01-01'}]
+    monkeypatch.setattr(gee_catalog_module.requests, 'get', lambda url, timeout: FakeResponse(listing))
+    index_path = write_index(tmp_path / 'index.json', age=30 * 24 * 3600)
+    catalog = GEECatalogIndex(index_path=index_path)
+
+    assert catalog.get_date_range('JRC/GSW1_4/GlobalSurfaceWater') == ['1984-03-16', '2023-01-01']
+    assert catalog.get_dataset('MODIS/061/MOD13Q1') is None
+    # The bands known before the refresh are kept
+    assert catalog.get_bands('JRC/GSW1_4/GlobalSurfaceWater') == ['occurrence', 'seasonality']
+    with open(index_path) as f:
+        assert list(json.load(f)) == ['JRC/GSW1_4/GlobalSurfaceWater']
+
+
+def test_get_bands_in_the_background(tmp_path, monkeypatch):
+    stac = {'summaries': {'eo:bands': [{'name': 'NDVI'}, {'name': 'EVI'}]}}
+    monkeypatch.setattr(gee_catalog_module.requests, 'get', lambda url, timeout: FakeResponse(stac))
+    index_path = write_index(tmp_path / 'index.json')
+    catalog = GEECatalogIndex(index_path=index_path)
+
+    assert catalog.get_bands('MODIS/061/MOD13Q1', background=True) is None
+    for _ in range(100):
+        if catalog.get_bands('MODIS/061/MOD13Q1', background=True) is not None:
+            break
+        time.sleep(0.05)
+
+    assert catalog.get_bands('MODIS/061/MOD13Q1', background=True) == ['NDVI', 'EVI']
+    assert [dataset['id'] for dataset in catalog.search('evi ndvi terra 061')] == ['MODIS/061/MOD13Q1']
+    with open(index_path) as f:
+        assert json.load(f)['MODIS/061/MOD13Q1']['bands'] == ['NDVI', 'EVI']
+    assert catalog.get_bands('MODIS/006/MOD13Q1') == ['NDVI', 'EVI']
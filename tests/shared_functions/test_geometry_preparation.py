@@ -0,0 +1,82 @@
+import numpy as np
+from shapely.geometry import MultiPolygon, Point, Polygon, box
+
+from mcimageprocessing.programmatic.shared_functions.geometry_preparation import (prefilter_by_bbox, prepare_geojson,
+                                                                                  prepare_geometry, remove_small_parts,
+                                                                                  scale_to_degrees)
+
+# The MODIS NRT pixel size in meters
+SCALE = 231.656
+
+
+def single_pixel_boxes(count, seed=0):
+    # Isolated boxes of exactly one pixel, on a coarse lattice with a random offset within a pixel
+    pixel = scale_to_degrees(SCALE)
+    offsets = np.random.default_rng(seed).uniform(0, pixel, (count, 2))
+    return [box(3 * pixel * index + dx, dy, 3 * pixel * index + dx + pixel, dy + pixel)
+            for index, (dx, dy) in enumerate(offsets)]
+
+
+def test_prepare_geometry_keeps_single_pixel_polygons():
+    boxes = single_pixel_boxes(500)
+    geometry = MultiPolygon(boxes + [box(20, 20, 25, 25)])
+
+    prepared = prepare_geometry(geometry, scale=SCALE)
+
+    assert len(prepared.geoms) == len(boxes) + 1
+    pixel_area = scale_to_degrees(SCALE) ** 2
+    single_pixel_areas = sorted(part.area for part in prepared.geoms)[:-1]
+    assert all(abs(area - pixel_area) < 0.25 * pixel_area for area in single_pixel_areas)
+
+
+def test_prepare_geometry_removes_slivers_and_small_holes():
+    pixel = scale_to_degrees(SCALE)
+    hole = box(1, 1, 1 + pixel / 10, 1 + pixel / 10)
+    polygon = Polygon(box(0, 0, 2, 2).exterior, [hole.exterior])
+    sliver = box(3, 3, 3 + pixel / 20, 3 + pixel)
+
+    prepared = prepare_geometry(MultiPolygon([polygon, sliver]), scale=SCALE)
+
+    assert len(prepared.geoms) == 1
+    assert not list(prepared.geoms[0].interiors)
+
+
+def test_prepare_geometry_moves_vertices_by_less_than_a_pixel():
+    circle = Point(10, 10).buffer(1, quad_segs=256)
+
+    prepared = prepare_geometry(circle, scale=SCALE)
+
+    assert prepared.hausdorff_distance(circle) < scale_to_degrees(SCALE) / 2
+    assert len(prepared.geoms[0].exterior.coords) < len(circle.exterior.coords)
+
+
+def test_prepare_geometry_drops_parts_outside_the_region():
+    geometry = MultiPolygon([box(0, 0, 1, 1), box(10, 10, 11, 11)])
+
+    assert prepare_geometry(geometry, region=box(-1, -1, 2, 2)).bounds == (0, 0, 1, 1)
+    assert prepare_geometry(geometry, region=box(50, 50, 51, 51)).is_empty
+
+
+def test_prefilter_by_bbox_tests_exact_geometries():
+    triangle = Polygon([(0, 0), (2, 0), (0, 2)])
+    # The region intersects the bounding box of the triangle but not the triangle itself
+    assert prefilter_by_bbox([triangle], box(1.5, 1.5, 2, 2)) == []
+    assert prefilter_by_bbox([triangle], box(0, 0, 0.5, 0.5)) == [triangle]
+
+
+def test_remove_small_parts_keeps_the_largest_part_of_a_small_area():
+    parts = MultiPolygon([box(0, 0, 1, 1), box(2, 2, 2.5, 2.5)])
+
+    assert remove_small_parts(parts, min_area=10).geoms[0].equals(box(0, 0, 1, 1))
+
+
+def test_prepare_geojson_keeps_the_structure_and_properties():
+    feature_collection = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'unit'}, 'geometry': {
+            'type': 'Polygon', 'coordinates': [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}}]}
+
+    prepared = prepare_geojson(feature_collection)
+
+    assert prepared['type'] == 'FeatureCollection'
+    assert prepared['features'][0]['properties'] == {'name': 'unit'}
+    assert prepared['features'][0]['geometry']['type'] == 'MultiPolygon'
@@ -0,0 +1,22 @@
+from shapely.geometry import Point, box
+
+from mcimageprocessing.programmatic.shared_functions.modis_tiles import (sinusoidal_tile_polygon, tile_index,
+                                                                         tiles_for_geometry)
+
+
+def test_tiles_for_geometry_sinusoidal():
+    # Kenya is covered by tiles h21v08, h21v09, h22v08 and h22v09 of the MODIS land grid
+    assert tiles_for_geometry(box(34, -4, 41, 4)) == [(21, 8), (21, 9), (22, 8), (22, 9)]
+    assert tiles_for_geometry(Point(0.5, 0.5)) == [(18, 8)]
+
+
+def test_tiles_for_geometry_geographic():
+    assert tiles_for_geometry(box(31, -4, 41, 4), grid='geographic') == [(21, 8), (21, 9), (22, 8), (22, 9)]
+
+
+def test_sinusoidal_tiles_outside_the_globe_are_skipped():
+    # The corner tiles of the sinusoidal grid do not reach the globe
+    assert sinusoidal_tile_polygon(0, 0) is None
+    tiles, _ = tile_index('sinusoidal')
+    assert (0, 0) not in tiles
+    assert (18, 8) in tiles
@@ -0,0 +1,52 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from rasterio.transform import from_origin
+
+from mcimageprocessing.programmatic.shared_functions.grib_decoding import DecodedGrib
+from mcimageprocessing.programmatic.shared_functions.point_extraction import extract_points, station_grid_indices
+
+STATIONS = pd.DataFrame({'station_id': ['upstream', 'outside', 'downstream'],
+                         'lon': [30.5, 35, 31.5],
+                         'lat': [2.5, 0, 1.5]})
+
+
+def decoded_forecast():
+    # Two members and two lead times on a 3 x 3 grid of 1 degree cells, from 30E 3N. Only three cells are on the
+    # river network, the others have no value
+    data = np.full((2, 2, 3, 3), np.nan, dtype='float32')
+    data[:, :, 0, 0] = 1
+    data[:, :, 1, 2] = [[10, 20],
+                        [30, 40]]
+    data[:, :, 2, 0] = 5
+    return DecodedGrib(data, [0, 1], [24, 48], datetime.date(2024, 5, 1), from_origin(30, 3, 1, 1))
+
+
+def test_station_grid_indices():
+    indices = station_grid_indices(decoded_forecast(), STATIONS)
+
+    assert list(indices['station_id']) == ['upstream', 'downstream']
+    assert list(zip(indices['row'], indices['col'])) == [(0, 0), (1, 1)]
+
+
+def test_station_grid_indices_moves_stations_to_the_river():
+    indices = station_grid_indices(decoded_forecast(), STATIONS, search_radius=1)
+
+    # The downstream station snaps to the cell with the highest mean discharge, the upstream one stays on the river
+    assert list(zip(indices['row'], indices['col'])) == [(0, 0), (1, 2)]
+
+
+def test_extract_points():
+    decoded = decoded_forecast()
+    indices = station_grid_indices(decoded, STATIONS, search_radius=1)
+
+    table = extract_points(decoded, indices)
+
+    assert len(table) == 8
+    assert list(table.columns) == ['station_id', 'reference_date', 'member', 'leadtime_hour', 'valid_date', 'value']
+    downstream = table[table['station_id'] == 'downstream']
+    assert list(zip(downstream['member'], downstream['leadtime_hour'], downstream['value'])) == [
+        (0, 24, 10), (0, 48, 20), (1, 24, 30), (1, 48, 40)]
+    assert list(downstream['valid_date']) == [pd.Timestamp('2024-05-02'), pd.Timestamp('2024-05-03')] * 2
+    assert (table.loc[table['station_id'] == 'upstream', 'value'] == 1).all()
@@ -0,0 +1,74 @@
+import numpy as np
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from mcimageprocessing.programmatic.shared_functions.return_periods import compute_exceedance, summarize_exceedance
+
+# Four members and two lead times on a 1 x 3 grid of 1 degree cells, from 30E 1N. The middle cell is off the river
+# network, the last one has missing members
+DATA = np.full((4, 2, 1, 3), np.nan, dtype='float32')
+DATA[:, 0, 0, 0] = [1, 1, 5, 5]
+DATA[:, 1, 0, 0] = [5, 5, 5, 1]
+DATA[:, 0, 0, 2] = [10, np.nan, 1, 1]
+DATA[:, 1, 0, 2] = [10, 10, np.nan, np.nan]
+# The 2 and 5 year thresholds, the last cell has no 5 year threshold
+THRESHOLDS = np.array([[[3, 3, 3]],
+                       [[6, 6, np.nan]]], dtype='float32')
+LEADTIMES = [24, 48]
+TRANSFORM = from_origin(30, 1, 1, 1)
+
+
+def test_compute_exceedance():
+    exceedance = compute_exceedance(DATA, THRESHOLDS, LEADTIMES)
+
+    np.testing.assert_allclose(exceedance['probability'][0], [[[0.5, np.nan, 1 / 3]],
+                                                              [[0.75, np.nan, 1]]])
+    np.testing.assert_allclose(exceedance['probability'][1], [[[0, np.nan, np.nan]],
+                                                              [[0, np.nan, np.nan]]])
+    np.testing.assert_allclose(exceedance['max_probability'], [[[0.75, np.nan, 1]],
+                                                               [[0, np.nan, np.nan]]])
+    np.testing.assert_array_equal(exceedance['exceeded'], [[[True, False, True]],
+                                                           [[False, False, False]]])
+    np.testing.assert_allclose(exceedance['first_leadtime'], [[[24, np.nan, 48]],
+                                                              [[np.nan, np.nan, np.nan]]])
+
+
+def test_compute_exceedance_minimum_probability():
+    exceedance = compute_exceedance(DATA, THRESHOLDS, LEADTIMES, min_probability=0.8)
+
+    np.testing.assert_array_equal(exceedance['exceeded'][0], [[False, False, True]])
+    np.testing.assert_allclose(exceedance['first_leadtime'][0], [[np.nan, np.nan, 48]])
+
+
+def test_compute_exceedance_of_a_memory_mapped_forecast(tmp_path):
+    data = np.memmap(tmp_path / 'forecast.dat', dtype='float32', mode='w+', shape=DATA.shape)
+    data[:] = DATA
+
+    exceedance = compute_exceedance(data, THRESHOLDS, LEADTIMES)
+
+    np.testing.assert_allclose(exceedance['probability'], compute_exceedance(DATA, THRESHOLDS, LEADTIMES)['probability'])
+
+
+def test_summarize_exceedance():
+    exceedance = compute_exceedance(DATA, THRESHOLDS, LEADTIMES)
+    # The west unit covers the first cell and touches the middle one, which is off the river network
+    geometries = [box(30, 0, 31, 1), box(32.2, 0.2, 32.8, 0.8), box(30, 0, 33, 1)]
+
+    summary = summarize_exceedance(exceedance, [2, 5], TRANSFORM, geometries, ['west', 'east', 'all'])
+
+    rows = {(row['geometry'], row['return_period']): row for row in summary.to_dict('records')}
+    assert len(rows) == 6
+    assert rows['west', 2]['river_pixels'] == 1
+    assert rows['west', 2]['exceeded_pixels'] == 1
+    assert rows['west', 2]['max_probability'] == 0.75
+    assert rows['west', 2]['first_leadtime'] == 24
+    assert rows['east', 2]['first_leadtime'] == 48
+    assert rows['all', 2]['river_pixels'] == 2
+    assert rows['all', 2]['exceeded_pixels'] == 2
+    assert rows['all', 2]['max_probability'] == 1
+    assert rows['all', 2]['first_leadtime'] == 24
+    assert rows['west', 5]['exceeded_pixels'] == 0
+    assert rows['west', 5]['max_probability'] == 0
+    assert np.isnan(rows['west', 5]['first_leadtime'])
+    # The east cell has no 5 year threshold
+    assert np.isnan(rows['east', 5]['max_probability'])